@@ -364,6 +364,17 @@ export default function TranslatePage() {
             // 刷新历史记录
             fetchHistory()
 
+            // 停止轮询
+            clearInterval(progressIntervalRef.current!)
+          } else if (status === "partial_success" && downloadUrl) {
+            toast({
+              title: "翻译部分完成",
+              description: "少数段落翻译失败，已保留原文，可在历史记录中重试",
+            })
+
+            // 刷新历史记录
+            fetchHistory()
+
             // 停止轮询
             clearInterval(progressIntervalRef.current!)
           } else if (status === "failed") {
@@ -394,6 +405,8 @@ export default function TranslatePage() {
         return "正在翻译内容..."
       case "success":
         return "翻译完成！"
+      case "partial_success":
+        return "部分完成"
       case "failed":
         return "翻译失败"
       default:
@@ -480,6 +493,13 @@ export default function TranslatePage() {
           <span className="text-green-700 dark:text-green-400 text-sm font-medium">完成</span>
         </div>
       )
+    } else if (status === "partial_success") {
+      return (
+        <div className="flex items-center gap-1">
+          <div className="w-2 h-2 bg-yellow-500 rounded-full"></div>
+          <span className="text-yellow-700 dark:text-yellow-400 text-sm font-medium">部分完成</span>
+        </div>
+      )
     } else if (status === "failed") {
       return (
         <div className="flex items-center gap-1">
@@ -772,7 +792,7 @@ export default function TranslatePage() {
                               </TableCell>
                               <TableCell className="text-right">
                                 <div className="flex justify-end gap-2">
-                                  {(!item.status || item.status === "success") && (
+                                  {(!item.status || item.status === "success" || item.status === "partial_success") && (
                                     <Button
                                     variant="outline"
                                     size="sm"
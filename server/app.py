@@ -1,27 +1,47 @@
 from flask import Flask, request, jsonify, g, send_file, send_from_directory
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
 from werkzeug.security import generate_password_hash, check_password_hash
 import time
 import uuid
+from datetime import datetime
 import os
 import shutil
 from functools import wraps
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-from threading import Thread
+from threading import Thread, Lock
 from concurrent.futures import ThreadPoolExecutor
-import en_pdf_to_zh_markdown as translator
+from task_control import CancelToken, TaskCancelled
+import scheduler
+import pdf_estimate
+import metrics
+import timeline
+import profiling
+import image_stage
 from dotenv import load_dotenv
 import json
+import logging
+from log_config import setup_logging, task_context
+# 客户端配置；可选的OpenAI兼容后端配置后与DeepSeek一起按延迟路由
+from client_config import build_client_config, build_fallback_config
 
 # Load environment variables from .env file
 # 获取项目根目录的路径
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 # 加载根目录下的 .env 文件
 load_dotenv(os.path.join(ROOT_DIR, '.env'))
+# 异步日志，级别和格式由 LOG_LEVEL / LOG_FORMAT 等环境变量控制
+setup_logging()
+logger = logging.getLogger(__name__)
+# 可选的任务性能分析，由 PROFILE_TARGETS 等环境变量开启
+profiling.configure()
 
-# 线程池配置
-executor = ThreadPoolExecutor(max_workers=4)
+# 正在排队或执行中的任务状态（fixing_headers 只出现在旧版本写入的记录中，标题修复现与翻译并行）
+ACTIVE_STATUSES = ('processing', 'converting', 'translating', 'fixing_headers', 'cancelling')
+# 已提交到线程池的任务的取消标记
+cancel_tokens = {}
+cancel_tokens_lock = Lock()
 
 # 加载配置文件
 def load_config():
@@ -42,6 +62,42 @@ config = load_config()
 tailscale_ip = config.get('tailscale_ip', '100.88.126.48')
 frontend_port = config.get('frontend_port', 3000)
 
+# 调度配置：全局并发任务数、单用户并发任务数、块级翻译并发数
+MAX_CONCURRENT_TASKS = config.get('max_concurrent_tasks', 4)
+MAX_TASKS_PER_USER = config.get('max_tasks_per_user', 2)
+scheduler.configure_block_dispatcher(config.get('block_workers', scheduler.DEFAULT_BLOCK_WORKERS))
+
+# 准入控制配置：排队上限、单用户未完成任务上限、文件大小、页数和磁盘剩余空间
+MAX_QUEUE_DEPTH = config.get('max_queue_depth', 50)
+MAX_QUEUED_PER_USER = config.get('max_queued_per_user', 10)
+MAX_UPLOAD_MB = config.get('max_upload_mb', 100)
+MAX_PAGES = config.get('max_pages', 300)
+MIN_FREE_DISK_MB = config.get('min_free_disk_mb', 1024)
+# 每个任务保留的执行时间线次数（首次执行与之后的重译）
+MAX_TIMELINE_RUNS = 5
+# 启动后是否在后台预热翻译流水线；关闭时由首个任务加载
+PRELOAD_PIPELINE = config.get('preload_pipeline', True)
+# PDF解析的OCR模式：auto 逐页判断 / on 全部OCR / off 只用文本层
+OCR_MODE = config.get('ocr_mode', 'auto')
+image_stage.configure(recompress=config.get('image_recompress', True),
+                      max_side=config.get('image_max_side', 2048),
+                      jpeg_quality=config.get('image_jpeg_quality', 85),
+                      workers=config.get('image_workers', image_stage.DEFAULT_WORKERS))
+
+# 线程池配置
+executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_TASKS)
+# 最近的解析/翻译吞吐量，用于预计任务耗时
+throughput = scheduler.ThroughputTracker()
+# 最近的任务完成速率，用于计算 Retry-After
+drain_rate = scheduler.DrainRate()
+
+# 翻译流水线（MinerU、tiktoken、nltk、langchain、openai）导入耗时较长，
+# Web层启动时不导入，由预热线程或首个任务通过 load_pipeline 加载
+_pipeline = None
+_pipeline_lock = Lock()
+pipeline_state = {'ready': False, 'loadSeconds': None, 'error': None}
+STARTED_AT = time.time()
+
 # 创建Flask应用实例
 app = Flask(__name__)
 
@@ -61,13 +117,15 @@ CORS(app,
      )
 
 # 配置数据库连接URI为SQLite数据库文件
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///site.db')
 # 禁用SQLAlchemy的修改跟踪功能
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 # 设置文件上传的文件夹路径
 app.config['UPLOAD_FOLDER'] = 'uploads'
 # 增加处理后文件存储路径的配置
 app.config['PROCESSED_FOLDER'] = 'processed_files'
+# 超过上传大小上限时Flask直接返回413
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_MB * 1024 * 1024
 # 生成一个随机的密钥用于会话管理
 app.secret_key = os.urandom(24)
 
@@ -103,11 +161,48 @@ class TranslationTask(db.Model):
     # 添加语言设置
     source_language = db.Column(db.String(10), default='en')  # 原文语言
     target_language = db.Column(db.String(10), default='zh-CN')  # 目标语言
+    target_languages = db.Column(db.String(100))  # 多目标语言，逗号分隔；为空时仅使用target_language
     created_at = db.Column(db.DateTime, server_default=db.func.now())  # 任务创建时间，默认为当前时间
+    started_at = db.Column(db.DateTime)  # 任务开始执行时间（UTC）
+    page_count = db.Column(db.Integer)  # 上传时估算的页数
+    token_estimate = db.Column(db.Integer)  # 上传时估算的单语言Token量
+    api_usage = db.Column(db.Text)  # API用量汇总（JSON），含上下文缓存命中Token数
+    failed_blocks = db.Column(db.Text)  # 翻译失败、保留原文的块id（JSON，按目标语言）
+    retry_blocks = db.Column(db.Text)  # 待重译的块id（JSON列表），为空时重译全部失败块
+    timeline = db.Column(db.Text)  # 最近几次执行的时间线（JSON列表）：阶段区间与每个块的请求耗时
+
+    def get_target_languages(self):
+        """ 任务的全部目标语言 """
+        if self.target_languages:
+            return [lang for lang in self.target_languages.split(',') if lang]
+        return [self.target_language or 'zh-CN']
+
+    def estimated_seconds(self):
+        """ 按最近吞吐量预计的总耗时（秒） """
+        tokens = (self.token_estimate or 0) * len(self.get_target_languages())
+        return throughput.estimate_seconds(self.page_count, tokens)
+
+    def waited_seconds(self):
+        """ 已排队的秒数（created_at 为数据库写入的UTC时间） """
+        if self.created_at is None:
+            return 0.0
+        return max((datetime.utcnow() - self.created_at).total_seconds(), 0.0)
+
+def ensure_columns():
+    """ 为已存在的表补充模型中新增的列（db.create_all 不会修改已有表） """
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                db.session.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+    db.session.commit()
 
 # 在应用上下文中创建数据库表
 with app.app_context():
     db.create_all()
+    ensure_columns()
 
 # 辅助函数，检查文件扩展名是否为PDF
 def allowed_file(filename):
@@ -142,10 +237,127 @@ def token_required(f):
         return f(*args, **kwargs)
     return decorated
 
+def request_cancel(task_id):
+    """ 向执行中的任务发出取消信号，返回任务是否在线程池中 """
+    with cancel_tokens_lock:
+        token = cancel_tokens.get(task_id)
+    if token is None:
+        return False
+    token.cancel()
+    return True
+
+def task_upload_path(task_id, filename):
+    """
+    任务上传文件的保存路径：按任务ID分目录保存，同名文件的任务互不覆盖。
+    旧版本直接保存在上传目录下的文件仍按原路径读取。
+    """
+    path = os.path.join(app.config['UPLOAD_FOLDER'], task_id, filename)
+    legacy_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    if not os.path.exists(path) and os.path.exists(legacy_path):
+        return legacy_path
+    return path
+
+def _finish_cancelled(task_id):
+    """ 任务取消后清理本任务的中间产物（processed_files/<任务ID>/）并更新状态（任务记录可能已被删除） """
+    db.session.rollback()
+    shutil.rmtree(os.path.join(app.config['PROCESSED_FOLDER'], task_id), ignore_errors=True)
+    task = TranslationTask.query.get(task_id)
+    if task:
+        task.status = 'cancelled'
+        db.session.commit()
+    metrics.TASKS_FINISHED.inc(status='cancelled')
+    logger.info("Task %s cancelled", task_id)
+
+def _restore_partial(task_id):
+    """ 重译失败块被取消或出错时，保留之前的部分结果 """
+    db.session.rollback()
+    task = TranslationTask.query.get(task_id)
+    if task:
+        task.status = 'partial_success'
+        task.progress = 100
+        task.retry_blocks = None
+        db.session.commit()
+    metrics.TASKS_FINISHED.inc(status='partial_success')
+
+def load_pipeline():
+    """
+    导入翻译流水线并预加载分词器，重复调用直接返回已加载的模块。
+
+    :return: (en_pdf_to_zh_markdown, translate) 模块
+    """
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            start = time.monotonic()
+            try:
+                import en_pdf_to_zh_markdown
+                import en_markdown_to_zh
+                import translate
+                en_markdown_to_zh.warm_up()
+            except Exception as e:
+                pipeline_state['error'] = str(e)
+                logger.exception("❌ 翻译流水线加载失败: %s", e)
+                raise
+            _pipeline = (en_pdf_to_zh_markdown, translate)
+            pipeline_state.update(ready=True, loadSeconds=round(time.monotonic() - start, 3), error=None)
+            logger.info("⚙️ 翻译流水线已加载，用时 %.1fs", pipeline_state['loadSeconds'])
+    return _pipeline
+
+
+def warm_up_pipeline():
+    """ 后台预热线程：加载失败时记录在 pipeline_state 中，首个任务会再次尝试 """
+    try:
+        load_pipeline()
+    except Exception:
+        pass
+
+
+def _finish_task(task, failed):
+    """ 根据失败块设置任务的最终状态（由调用方提交，提交成功后再计入完成指标） """
+    task.status = 'partial_success' if failed else 'success'
+    task.failed_blocks = json.dumps(failed) if failed else None
+    task.retry_blocks = None
+    task.progress = 100
+
+
 def process_task(task_id):
-    """ 实际处理翻译任务的函数 """
+    """ 实际处理翻译任务的函数，任务内的日志都带有任务ID，执行过程记录到任务时间线 """
+    run = timeline.Timeline()
+    with task_context(task_id), metrics.TASKS_RUNNING.track_inprogress(), timeline.activate(run), \
+            profiling.task_session(task_id):
+        try:
+            _run_task(task_id)
+        finally:
+            _save_timeline(task_id, run)
+
+
+def _save_timeline(task_id, run):
+    """ 追加本次执行的时间线，只保留最近 MAX_TIMELINE_RUNS 次 """
     with app.app_context():
         task = TranslationTask.query.get(task_id)
+        if task is None:
+            return
+        runs = json.loads(task.timeline) if task.timeline else []
+        runs.append(run.to_dict())
+        task.timeline = json.dumps(runs[-MAX_TIMELINE_RUNS:], ensure_ascii=False, separators=(',', ':'))
+        db.session.commit()
+
+
+def _run_task(task_id):
+    with app.app_context():
+        with cancel_tokens_lock:
+            cancel_token = cancel_tokens.setdefault(task_id, CancelToken())
+        task = TranslationTask.query.get(task_id)
+        if task is None or cancel_token.cancelled:
+            with cancel_tokens_lock:
+                cancel_tokens.pop(task_id, None)
+            if task is not None:
+                _finish_cancelled(task_id)
+            return
+        output_dir = app.config['PROCESSED_FOLDER']
+        task_zip_path = os.path.join(output_dir, f"{task_id}.zip")
+        # 已有结果包且记录了失败块的任务只重译失败块
+        retrying = bool(task.failed_blocks) and os.path.exists(task_zip_path)
         try:
             # 获取用户的API配置
             user_config = UserApiConfig.query.filter_by(user_id=task.user_id).first()
@@ -154,87 +366,267 @@ def process_task(task_id):
                 # 如果用户没有配置API Key，任务失败
                 task.status = 'failed'
                 db.session.commit()
-                print(f"Task {task_id} failed: 用户未配置API Key")
+                metrics.TASKS_FINISHED.inc(status='failed')
+                logger.warning("Task %s failed: 用户未配置API Key", task_id)
                 return
-                
+
+            translator, translate = load_pipeline()
+            # 使用用户自定义的API Key创建配置
+            config_short = build_client_config(user_config.deepseek_api_key, 120)
+            config_long = build_client_config(user_config.deepseek_api_key, 300)
+            config_fallback = build_fallback_config(300)
+            failed = {}
+            usage = translate.UsageMeter()
+
+            if retrying:
+                timeline.current().kind = 'retry'
+                task.status = 'translating'
+                task.progress = 60
+                db.session.commit()
+                logger.info("Retrying failed blocks of %s", task.filename)
+                translator.retranslate_failed_blocks(
+                    task_zip_path,
+                    config_short,
+                    config_long,
+                    block_ids=json.loads(task.retry_blocks) if task.retry_blocks else None,
+                    config_fallback=config_fallback,
+                    cancel_token=cancel_token,
+                    owner=task.user_id,
+                    usage=usage,
+                    failed_blocks=failed
+                )
+                task.api_usage = json.dumps(usage.summary())
+                _finish_task(task, failed)
+                db.session.commit()
+                metrics.TASKS_FINISHED.inc(status=task.status)
+                logger.info("Task %s retry completed, %s", task_id, task.status)
+                return
+
             # 阶段1: 文件转换
             task.status = 'converting'
             task.progress = 30
             db.session.commit()
-            print(f"Converting file {task.filename}")
-            time.sleep(2)  # 模拟耗时操作
+            logger.info("Converting file %s", task.filename)
+            with timeline.span('convert'):
+                if cancel_token.wait(2):  # 模拟耗时操作
+                    raise TaskCancelled()
             # 阶段2: 翻译处理
             task.status = 'translating'
             task.progress = 60
             db.session.commit()
-            print(f"Translating file {task.filename}")
+            logger.info("Translating file %s", task.filename)
             # 调用 translate_pdf_to_zh 函数进行翻译
-            original_file_path = os.path.join(app.config['UPLOAD_FOLDER'], task.filename)
-            output_dir = app.config['PROCESSED_FOLDER']
-            
-            # 使用用户自定义的API Key创建配置
-            config_short = {
-                "provider": "deepseek",
-                "api_key": user_config.deepseek_api_key,
-                "modelname": "deepseek-chat",
-                "maxtoken": 8192
-            }
-            config_long = {
-                "provider": "deepseek",
-                "api_key": user_config.deepseek_api_key,
-                "modelname": "deepseek-chat",
-                "maxtoken": 8192
-            }
-            
+            original_file_path = task_upload_path(task_id, task.filename)
+
             # 调用 translate_one_pdf 函数进行翻译并生成 ZIP 文件，传递语言设置
-            translator.translate_one_pdf(
+            timings = {}
+            # 工作目录和结果包按任务ID命名，同名文件的任务可以同时执行
+            result_zip_path = translator.translate_one_pdf(
                 original_file_path, 
                 output_dir, 
                 config_short, 
                 config_long,
                 source_language=task.source_language,
-                target_language=task.target_language
+                target_language=task.target_language,
+                cancel_token=cancel_token,
+                target_languages=task.get_target_languages(),
+                owner=task.user_id,
+                timings=timings,
+                usage=usage,
+                config_fallback=config_fallback,
+                failed_blocks=failed,
+                ocr_mode=OCR_MODE,
+                output_name=task_id
             )
+            if result_zip_path is None:
+                raise FileNotFoundError(f"未生成结果包: {original_file_path}")
+            task.api_usage = json.dumps(usage.summary())
+            # 用实际耗时校准吞吐量
+            throughput.record_parse(task.page_count or 0, timings.get('parse', 0))
+            throughput.record_translate((task.token_estimate or 0) * len(task.get_target_languages()),
+                                        timings.get('translate', 0))
             
-            # 阶段3: 标题修复
-            task.status = 'fixing_headers'
-            task.progress = 80
-            db.session.commit()
-            print(f"Fixing markdown headers for {task.filename}")
-            
-            # 阶段4: 完成处理
-            task.status = 'success'
-            task.progress = 100
-            # 获取生成的 ZIP 文件路径
-            filename_without_ext = os.path.splitext(task.filename)[0]
-            original_zip_path = os.path.join(output_dir, f"{filename_without_ext}.zip")
-            # 将 ZIP 文件重命名为 task_id 命名
-            new_zip_name = f"{task_id}.zip"
-            new_zip_path = os.path.join(output_dir, new_zip_name)
-            shutil.move(original_zip_path, new_zip_path)
+            # 阶段3: 完成处理（标题层级已在翻译阶段并行修复；部分块失败时为 partial_success，失败块保留原文）
+            _finish_task(task, failed)
             # 设置下载 URL
             task.download_url = f'/api/download/{task.id}'
             db.session.commit()
-            print(f"Task {task_id} completed")
+            # 结果包已就位且状态已提交后才计入完成指标，避免失败路径重复计数
+            metrics.TASKS_FINISHED.inc(status=task.status)
+            logger.info("Task %s completed, %s", task_id, task.status)
+        except TaskCancelled:
+            if retrying:
+                _restore_partial(task_id)
+            else:
+                _finish_cancelled(task_id)
         except Exception as e:
-            print(f"Task {task_id} failed: {str(e)}")
-            task.status = 'failed'
-            db.session.commit()
+            logger.exception("Task %s failed: %s", task_id, e)
+            if retrying:
+                _restore_partial(task_id)
+                return
+            db.session.rollback()
+            task = TranslationTask.query.get(task_id)
+            if task:
+                task.status = 'failed'
+                db.session.commit()
+            metrics.TASKS_FINISHED.inc(status='failed')
+        finally:
+            drain_rate.record()
+            with cancel_tokens_lock:
+                cancel_tokens.pop(task_id, None)
+def running_task_counts():
+    """ 各用户正在执行的任务数 """
+    rows = db.session.query(TranslationTask.user_id, db.func.count(TranslationTask.id)) \
+        .filter(TranslationTask.status.in_(ACTIVE_STATUSES)).group_by(TranslationTask.user_id).all()
+    return {user_id: count for user_id, count in rows}
+
+
+def task_priority():
+    """ 短作业优先并随等待时间老化的排序键 """
+    return scheduler.response_ratio_priority(lambda t: t.estimated_seconds(), lambda t: t.waited_seconds())
+
+
+def estimate_etas(tasks):
+    """
+    预计任务的剩余完成时间（秒）。
+
+    执行中的任务按预计总耗时减去已执行时间计算；排队任务按公平队列中
+    排在前面的任务和执行中任务的剩余耗时分摊到全部执行槽位后，再加上自身耗时。
+    :param tasks: 需要计算的任务列表
+    :return: 任务ID到剩余秒数的映射，已结束的任务不包含在内
+    """
+    now = datetime.utcnow()
+
+    def remaining(task):
+        elapsed = (now - task.started_at).total_seconds() if task.started_at else 0.0
+        return max(task.estimated_seconds() - elapsed, 0.0)
+
+    etas = {}
+    wanted = {task.id for task in tasks}
+    active = TranslationTask.query.filter(TranslationTask.status.in_(ACTIVE_STATUSES)).all()
+    backlog = sum(remaining(task) for task in active)
+    for task in active:
+        if task.id in wanted:
+            etas[task.id] = int(remaining(task))
+    if any(task.status == 'pending' for task in tasks):
+        pending = TranslationTask.query.filter_by(status='pending').all()
+        for task in scheduler.fair_order(pending, running_task_counts(), task_priority()):
+            cost = task.estimated_seconds()
+            if task.id in wanted:
+                etas[task.id] = int(backlog / MAX_CONCURRENT_TASKS + cost)
+            backlog += cost
+    return etas
+
+
+def overloaded(error, excess, queued):
+    """ 构造带 Retry-After 的429响应，按最近的完成速率估计排队位置腾出的时间 """
+    fallback = sum(task.estimated_seconds() for task in queued) / MAX_CONCURRENT_TASKS if queued else 60
+    retry_after = drain_rate.retry_after(excess, fallback)
+    response = jsonify({'success': False, 'error': error, 'code': 429, 'retryAfter': retry_after})
+    return response, 429, {'Retry-After': str(retry_after)}
+
+
+def check_admission(user_id):
+    """
+    上传前的准入检查：排队深度、单用户未完成任务数和磁盘剩余空间。
+
+    :param user_id: 上传用户ID
+    :return: 拒绝时返回响应，允许时返回None
+    """
+    pending = TranslationTask.query.filter_by(status='pending').all()
+    if len(pending) >= MAX_QUEUE_DEPTH:
+        metrics.TASKS_REJECTED.inc(reason='queue_full')
+        return overloaded('当前排队任务过多，请稍后再试', len(pending) - MAX_QUEUE_DEPTH + 1, pending)
+
+    user_tasks = TranslationTask.query.filter(
+        TranslationTask.user_id == user_id,
+        TranslationTask.status.in_(('pending',) + ACTIVE_STATUSES)
+    ).all()
+    if len(user_tasks) >= MAX_QUEUED_PER_USER:
+        metrics.TASKS_REJECTED.inc(reason='user_limit')
+        return overloaded(f'每个用户最多同时提交 {MAX_QUEUED_PER_USER} 个未完成任务',
+                          len(user_tasks) - MAX_QUEUED_PER_USER + 1, user_tasks)
+
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    free_mb = shutil.disk_usage(app.config['UPLOAD_FOLDER']).free / (1024 * 1024)
+    if free_mb < MIN_FREE_DISK_MB:
+        metrics.TASKS_REJECTED.inc(reason='disk_full')
+        retry_after = drain_rate.retry_after(1, 300)
+        response = jsonify({'success': False, 'error': '服务器存储空间不足，请稍后再试', 'code': 503,
+                            'retryAfter': retry_after})
+        return response, 503, {'Retry-After': str(retry_after)}
+    return None
+
+
+@app.errorhandler(413)
+def file_too_large(e):
+    metrics.TASKS_REJECTED.inc(reason='file_too_large')
+    return jsonify({'success': False, 'error': f'文件大小超过 {MAX_UPLOAD_MB}MB 上限', 'code': 413}), 413
+
+
+def recover_orphaned_tasks():
+    """
+    回收没有工作线程的执行中任务（服务崩溃或重启前正在执行），避免其永久占用执行槽位和排队名额：
+    取消中的任务直接结束，其余任务重新排队。
+
+    :return: 回收的任务数
+    """
+    with cancel_tokens_lock:
+        live = set(cancel_tokens)
+    orphaned = [task for task in TranslationTask.query.filter(TranslationTask.status.in_(ACTIVE_STATUSES)).all()
+                if task.id not in live]
+    for task in orphaned:
+        if task.status == 'cancelling':
+            # 与 _restore_partial 一致：重译失败块时取消保留之前的部分结果
+            task_zip_path = os.path.join(app.config['PROCESSED_FOLDER'], f"{task.id}.zip")
+            task.status = 'partial_success' if task.failed_blocks and os.path.exists(task_zip_path) else 'cancelled'
+        else:
+            task.status = 'pending'
+            task.progress = 0
+            task.started_at = None
+    db.session.commit()
+    if orphaned:
+        logger.warning("♻️ 回收了 %d 个上次运行遗留的执行中任务", len(orphaned))
+    return len(orphaned)
+
+
+def schedule_pending_tasks():
+    """ 按用户公平份额依次填满空闲的执行槽位，返回本次提交的任务数 """
+    submitted = 0
+    with db.session.begin():
+        pending = TranslationTask.query.filter_by(status='pending').with_for_update(skip_locked=True).all()
+        running = running_task_counts()
+        priority = task_priority()
+        while pending and sum(running.values()) < MAX_CONCURRENT_TASKS:
+            task = scheduler.pick_next(pending, running, MAX_TASKS_PER_USER, priority)
+            if task is None:
+                break
+            pending.remove(task)
+            running[task.user_id] = running.get(task.user_id, 0) + 1
+            task.status = 'processing'
+            task.started_at = datetime.utcnow()
+            with cancel_tokens_lock:
+                cancel_tokens[task.id] = CancelToken()
+            logger.info("Processing task %s", task.id)
+            # 提交任务到线程池
+            executor.submit(process_task, task.id)
+            submitted += 1
+    return submitted
+
+
 def background_checker():
-    """ 后台任务检查线程 """
+    """ 后台任务检查线程，启动时先回收上次运行遗留的任务 """
+    with app.app_context():
+        try:
+            recover_orphaned_tasks()
+        except Exception as e:
+            logger.exception("Recovering orphaned tasks failed: %s", e)
     while True:
         with app.app_context():
             try:
-                with db.session.begin():
-                    # 原子化获取并锁定任务
-                    task = TranslationTask.query.filter_by(status='pending').with_for_update(skip_locked=True).first()
-                    if task:
-                        task.status = 'processing'
-                        print(f"Processing task {task.id}")
-                        # 提交任务到线程池
-                        executor.submit(process_task, task.id)
+                schedule_pending_tasks()
             except Exception as e:
-                print(f"Background checker error: {str(e)}")
+                logger.exception("Background checker error: %s", e)
             time.sleep(10)
 
 
@@ -313,7 +705,7 @@ def logout():
             'message': '登出成功'
         }), 200
     except Exception as e:
-        print(f"Logout error: {str(e)}")
+        logger.error("Logout error: %s", e)
         return jsonify({
             'success': False,
             'error': '登出失败'
@@ -400,26 +792,50 @@ def upload_file():
     file = request.files['file']
     if file.filename == '' or not allowed_file(file.filename):
         return jsonify({'success': False, 'error': '无效的PDF文件', 'code': 400}), 400
+
+    # 过载时在保存文件前拒绝
+    rejection = check_admission(g.current_user.id)
+    if rejection is not None:
+        return rejection
     
     # 获取语言设置参数
     source_language = request.form.get('sourceLanguage', user_config.default_source_language or 'en')
     target_language = request.form.get('targetLanguage', user_config.default_target_language or 'zh-CN')
+    # 多目标语言：支持重复的targetLanguages字段或逗号分隔
+    target_languages = []
+    for value in request.form.getlist('targetLanguages'):
+        for lang in value.split(','):
+            lang = lang.strip()
+            if lang and lang not in target_languages:
+                target_languages.append(lang)
+    if target_languages:
+        target_language = target_languages[0]
     
     # 确保文件名安全
     filename = secure_filename(file.filename)
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    task_id = str(uuid.uuid4())
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], task_id, filename)
     
-    # 保存文件到本地
+    # 保存文件到本地（按任务ID分目录，不会覆盖其他任务的同名文件）
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
     file.save(file_path)
+    # 快速估算页数和Token量，用于调度和预计完成时间
+    estimate = pdf_estimate.estimate_pdf(file_path)
+    if estimate['pages'] > MAX_PAGES:
+        shutil.rmtree(os.path.dirname(file_path), ignore_errors=True)
+        metrics.TASKS_REJECTED.inc(reason='too_many_pages')
+        return jsonify({'success': False, 'error': f'PDF页数超过 {MAX_PAGES} 页上限', 'code': 413}), 413
     # 创建翻译任务
-    task_id = str(uuid.uuid4())
     new_task = TranslationTask(
         id=task_id,
         user_id=g.current_user.id,
         filename=filename,
         status='pending',
         source_language=source_language,
-        target_language=target_language
+        target_language=target_language,
+        target_languages=','.join(target_languages) if len(target_languages) > 1 else None,
+        page_count=estimate['pages'],
+        token_estimate=estimate['tokens']
     )
     db.session.add(new_task)
     db.session.commit()
@@ -439,7 +855,7 @@ def download_file(task_id):
     响应: 文件下载流或错误信息
     """
     task = TranslationTask.query.get_or_404(task_id)
-    print(f"Download request for task: {task}")  # 添加日志
+    logger.info("Download request for task: %s", task_id)
     # 确保当前用户有权限访问该文件
     if task.user_id != g.current_user.id:
         return jsonify({'success': False, 'error': '无权访问该文件', 'code': 403}), 403
@@ -466,6 +882,65 @@ def download_file(task_id):
     return send_file(file_path, as_attachment=True, download_name=download_name)
 
 
+# 存活检查接口：不访问数据库，也不触发流水线加载
+@app.route('/api/health', methods=['GET'])
+def health():
+    return jsonify({'success': True, 'data': {
+        'status': 'ok',
+        'uptimeSeconds': round(time.time() - STARTED_AT, 1)
+    }}), 200
+
+
+# 就绪检查接口：数据库可用且翻译流水线已预热时返回200，否则返回503
+@app.route('/api/ready', methods=['GET'])
+def ready():
+    database = True
+    try:
+        db.session.execute(text('SELECT 1'))
+    except Exception as e:
+        logger.warning("Readiness check database error: %s", e)
+        database = False
+    is_ready = database and pipeline_state['ready']
+    return jsonify({'success': is_ready, 'data': {
+        'ready': is_ready,
+        'database': database,
+        'pipeline': pipeline_state,
+        'workers': MAX_CONCURRENT_TASKS,
+        'runningTasks': metrics.TASKS_RUNNING.value()
+    }}), 200 if is_ready else 503
+
+
+# 各状态任务数的刷新间隔（秒），频繁抓取 /metrics 时不必每次查询任务表
+TASK_METRICS_TTL = 5
+_task_metrics_refreshed = {'at': None}
+
+
+def collect_task_metrics():
+    """ 采集前刷新各状态任务数（含排队深度，最多每 TASK_METRICS_TTL 秒查询一次）和块调度器积压 """
+    now = time.monotonic()
+    refreshed_at = _task_metrics_refreshed['at']
+    if refreshed_at is None or now - refreshed_at >= TASK_METRICS_TTL:
+        _task_metrics_refreshed['at'] = now
+        rows = db.session.query(TranslationTask.status, db.func.count(TranslationTask.id)) \
+            .group_by(TranslationTask.status).all()
+        metrics.TASKS.clear()
+        for status, count in rows:
+            metrics.TASKS.set(count, status=status)
+    metrics.BLOCKS_QUEUED.set(sum(scheduler.get_block_dispatcher().pending().values()))
+
+
+metrics.REGISTRY.add_collector(collect_task_metrics)
+
+
+# Prometheus 指标接口
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    以Prometheus文本格式输出队列、任务状态、阶段耗时、API延迟与Token用量等指标
+    """
+    return metrics.REGISTRY.render(), 200, {'Content-Type': metrics.CONTENT_TYPE}
+
+
 # 进度查询接口
 @app.route('/api/progress', methods=['GET'])
 @token_required
@@ -475,13 +950,19 @@ def get_progress():
 
     if not task or task.user_id != g.current_user.id:
         return jsonify({'success': False, 'error': '任务不存在', 'code': 404}), 404
-    print(task.status)
+    logger.debug("Task %s status: %s", task_id, task.status, extra={"sample": "progress_poll"})
+    queue_position = None
+    if task.status == 'pending':
+        pending = TranslationTask.query.filter_by(status='pending').all()
+        queue_position = scheduler.queue_position(task.id, pending, running_task_counts(), task_priority())
     return jsonify({
         'success': True,
         'data': {
             'status': task.status,
             'progress': task.progress,
-            'downloadUrl': task.download_url
+            'downloadUrl': task.download_url,
+            'queuePosition': queue_position,
+            'etaSeconds': estimate_etas([task]).get(task.id)
         }
     })
 
@@ -490,6 +971,7 @@ def get_progress():
 @token_required
 def get_history():
     tasks = TranslationTask.query.filter_by(user_id=g.current_user.id).all()
+    etas = estimate_etas(tasks)
   
     history = [{
         'id': task.id,
@@ -498,13 +980,94 @@ def get_history():
         'progress': task.progress,
         'sourceLanguage': task.source_language,
         'targetLanguage': task.target_language,
+        'targetLanguages': task.get_target_languages(),
         'translatedLang': task.target_language,  # 保持兼容性
         'createdAt': task.created_at.isoformat(),
-        'downloadUrl': task.download_url
+        'downloadUrl': task.download_url,
+        'pageCount': task.page_count,
+        'tokenEstimate': task.token_estimate,
+        'etaSeconds': etas.get(task.id),
+        'usage': json.loads(task.api_usage) if task.api_usage else None,
+        'failedBlocks': json.loads(task.failed_blocks) if task.failed_blocks else None
     } for task in tasks]
 
     return jsonify({'success': True, 'data': history})
 
+# 取消任务接口
+@app.route('/api/tasks/<task_id>/cancel', methods=['POST'])
+@token_required
+def cancel_task(task_id):
+    task = TranslationTask.query.get(task_id)
+
+    if not task or task.user_id != g.current_user.id:
+        return jsonify({'success': False, 'error': '任务不存在', 'code': 404}), 404
+
+    if task.status == 'pending':
+        # 尚未提交到线程池，直接取消
+        task.status = 'cancelled'
+    elif task.status in ACTIVE_STATUSES:
+        # 执行中的任务在下一个检查点退出并释放线程池位置；
+        # 找不到取消标记说明任务已不在运行（如服务重启），直接标记为取消
+        task.status = 'cancelling' if request_cancel(task_id) else 'cancelled'
+    else:
+        return jsonify({'success': False, 'error': '任务已结束，无法取消', 'code': 409}), 409
+    db.session.commit()
+
+    return jsonify({'success': True, 'data': {'status': task.status}})
+
+# 重译失败块接口
+@app.route('/api/tasks/<task_id>/retry', methods=['POST'])
+@token_required
+def retry_failed_blocks(task_id):
+    task = TranslationTask.query.get(task_id)
+
+    if not task or task.user_id != g.current_user.id:
+        return jsonify({'success': False, 'error': '任务不存在', 'code': 404}), 404
+    if task.status != 'partial_success' or not task.failed_blocks:
+        return jsonify({'success': False, 'error': '只有部分完成的任务可以重译失败块', 'code': 409}), 409
+
+    # 可选的blockIds只重译指定的失败块
+    data = request.get_json(silent=True) or {}
+    block_ids = data.get('blockIds')
+    if block_ids is not None:
+        failed_ids = {block_id for ids in json.loads(task.failed_blocks).values() for block_id in ids}
+        unknown = [block_id for block_id in block_ids if block_id not in failed_ids]
+        if unknown:
+            return jsonify({'success': False, 'error': f'不是失败块: {unknown}', 'code': 400}), 400
+        task.retry_blocks = json.dumps(block_ids)
+    task.status = 'pending'
+    task.progress = 0
+    db.session.commit()
+
+    return jsonify({'success': True, 'data': {'status': task.status}}), 202
+
+# 任务执行时间线接口
+@app.route('/api/tasks/<task_id>/timeline', methods=['GET'])
+@token_required
+def get_task_timeline(task_id):
+    """
+    返回任务最近几次执行的时间线，用于定位耗时异常：
+    runs 中 spans 为各阶段的开始/结束偏移（秒），blocks 为每个块的请求耗时、重试次数和Token数；
+    slowestBlocks 为最近一次执行中耗时最长的块。
+    """
+    task = TranslationTask.query.get(task_id)
+
+    if not task or task.user_id != g.current_user.id:
+        return jsonify({'success': False, 'error': '任务不存在', 'code': 404}), 404
+
+    runs = json.loads(task.timeline) if task.timeline else []
+    slowest = sorted(runs[-1]['blocks'], key=lambda block: block['dur'], reverse=True)[:10] if runs else []
+    queued = None
+    if task.created_at and task.started_at:
+        queued = max((task.started_at - task.created_at).total_seconds(), 0.0)
+    return jsonify({'success': True, 'data': {
+        'taskId': task.id,
+        'status': task.status,
+        'queuedSeconds': queued,
+        'runs': runs,
+        'slowestBlocks': slowest
+    }}), 200
+
 # 删除历史记录接口
 @app.route('/api/history/<task_id>', methods=['DELETE'])
 @token_required
@@ -513,11 +1076,20 @@ def delete_history(task_id):
   
     if not task or task.user_id != g.current_user.id:
         return jsonify({'success': False, 'error': '未找到记录', 'code': 404}), 404
+
+    # 执行中的任务先取消，避免继续消耗API额度；工作线程仍在使用上传文件和任务记录，
+    # 等其在检查点退出（状态变为cancelled）后再删除
+    if request_cancel(task_id):
+        if task.status != 'cancelling':
+            task.status = 'cancelling'
+            db.session.commit()
+        return jsonify({'success': False, 'error': '任务正在取消，请稍后再删除', 'code': 409}), 409
   
     # 删除上传的文件
-    upload_file_path = os.path.join(app.config['UPLOAD_FOLDER'], task.filename)
+    upload_file_path = task_upload_path(task.id, task.filename)
     if os.path.exists(upload_file_path):
         os.remove(upload_file_path)
+    shutil.rmtree(os.path.join(app.config['UPLOAD_FOLDER'], task.id), ignore_errors=True)
   
     # 删除处理后的文件
     processed_file_path = os.path.join(app.config['PROCESSED_FOLDER'], f"{task.id}.zip")
@@ -582,6 +1154,9 @@ if __name__ == '__main__':
     # 启动后台线程
     checker_thread = Thread(target=background_checker, daemon=True)
     checker_thread.start()
+    # 后台预热翻译流水线，期间服务已可登录、查询历史；完成后 /api/ready 返回就绪
+    if PRELOAD_PIPELINE:
+        Thread(target=warm_up_pipeline, daemon=True).start()
     
     # 从配置文件读取启动参数
     host = config.get('backend_host', '0.0.0.0')
@@ -0,0 +1,74 @@
+"""
+批量翻译文件夹中的PDF（如夜间回填），中断后重新运行会跳过已完成的文件。
+
+用法: python batch_translate.py 输入目录 输出目录 [--workers 4] [--parse-workers 1] [--target zh-CN ja]
+
+DeepSeek API Key 从 --api-key 或环境变量 DEEPSEEK_API_KEY 读取；OpenAI兼容后端与Web服务相同，
+由根目录 .env 中的 OPENAI_COMPAT_* 配置。每个文件完成时向汇总文件追加一行JSON（耗时、Token用量、失败块数）。
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+import scheduler
+from client_config import build_client_config, build_fallback_config
+from log_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="批量翻译文件夹中的PDF")
+    parser.add_argument("input_folder", help="PDF所在目录")
+    parser.add_argument("output_folder", help="输出目录，每个PDF一个子目录")
+    parser.add_argument("--source", default="en", help="原文语言")
+    parser.add_argument("--target", nargs="+", default=["zh-CN"], help="目标语言，可指定多个")
+    parser.add_argument("--workers", type=int, default=4, help="同时处理的文件数")
+    parser.add_argument("--parse-workers", type=int, default=1, help="同时做MinerU解析的文件数")
+    parser.add_argument("--block-workers", type=int, default=scheduler.DEFAULT_BLOCK_WORKERS,
+                        help="翻译块并发数，所有文件共享")
+    parser.add_argument("--ocr-mode", choices=("auto", "on", "off"), default="auto", help="OCR模式")
+    parser.add_argument("--summary", help="汇总文件路径（JSON Lines），默认为 输出目录/batch_summary.jsonl")
+    parser.add_argument("--api-key", help="DeepSeek API Key，默认读取环境变量 DEEPSEEK_API_KEY")
+    parser.add_argument("--delete-source", action="store_true", help="翻译成功后删除原文PDF")
+    parser.add_argument("--force", action="store_true", help="忽略完成标记，重新翻译所有文件")
+    args = parser.parse_args()
+
+    load_dotenv(os.path.join(ROOT_DIR, ".env"))
+    setup_logging()
+    api_key = args.api_key or os.getenv("DEEPSEEK_API_KEY")
+    if not api_key:
+        parser.error("需要 --api-key 或环境变量 DEEPSEEK_API_KEY")
+
+    scheduler.configure_block_dispatcher(args.block_workers)
+    # 翻译流水线（MinerU等）较重，参数检查通过后再导入
+    import en_markdown_to_zh
+    import en_pdf_to_zh_markdown
+    en_markdown_to_zh.warm_up()
+
+    start = time.monotonic()
+    records = en_pdf_to_zh_markdown.translate_all_pdfs_in_folder(
+        args.input_folder, args.output_folder,
+        build_client_config(api_key, 120), build_client_config(api_key, 300),
+        source_language=args.source, target_languages=args.target,
+        workers=args.workers, parse_workers=args.parse_workers,
+        config_fallback=build_fallback_config(300), ocr_mode=args.ocr_mode,
+        summary_path=args.summary, delete_source=args.delete_source, force=args.force,
+    )
+    counts = {}
+    for record in records:
+        counts[record["status"]] = counts.get(record["status"], 0) + 1
+    logger.info("📦 批量翻译完成：共 %d 个文件，%s，用时 %.1f 秒", len(records),
+                "，".join(f"{status} {count}" for status, count in sorted(counts.items())) or "无PDF",
+                time.monotonic() - start)
+    return 1 if counts.get("failed") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+import os
+from typing import Dict, Optional
+
+# 路由模式下每个后端的重试次数与单次请求超时上限：后端内部只做少量快速重试，持续失败交给路由切换后端
+ROUTER_BACKEND_RETRIES = 1
+ROUTER_BACKEND_TIMEOUT = 60
+
+
+def _openai_backend(prefix, timeout) -> Optional[Dict]:
+    """
+    由环境变量 <prefix>_BASE_URL / <prefix>_API_KEY / <prefix>_MODEL 配置的OpenAI兼容后端，未配置时返回None。
+    调用时读取，.env 可在导入本模块之后加载。
+    """
+    base_url = os.getenv(f'{prefix}_BASE_URL')
+    model = os.getenv(f'{prefix}_MODEL')
+    if not (base_url and model):
+        return None
+    return {
+        "provider": "openai_compatible",
+        "base_url": base_url,
+        "api_key": os.getenv(f'{prefix}_API_KEY', 'EMPTY'),
+        "modelname": model,
+        "maxtoken": 8192,
+        "timeout": timeout,
+        "max_retries": 3
+    }
+
+
+def build_client_config(api_key, timeout):
+    """
+    构建翻译客户端配置；配置了OpenAI兼容后端（OPENAI_COMPAT_*，如本地推理服务）时返回路由配置。
+
+    :param api_key: 用户的DeepSeek API Key
+    :param timeout: 单次请求超时（秒）
+    :return: api_client_factory 使用的配置
+    """
+    deepseek = {
+        "provider": "deepseek",
+        "api_key": api_key,
+        "modelname": "deepseek-chat",
+        "maxtoken": 8192,
+        "timeout": timeout,
+        "hedge": True
+    }
+    compat = _openai_backend('OPENAI_COMPAT', timeout)
+    if compat is None:
+        return deepseek
+    backends = [deepseek, compat]
+    for backend in backends:
+        backend["max_retries"] = ROUTER_BACKEND_RETRIES
+        backend["timeout"] = min(timeout, ROUTER_BACKEND_TIMEOUT)
+    return {"provider": "router", "backends": backends}
+
+
+def build_fallback_config(timeout):
+    """
+    失败块重新排队时使用的备用客户端配置，由 OPENAI_FALLBACK_* 配置，未配置时返回None。
+
+    备用后端应与主客户端不同（其他服务或模型）：OPENAI_COMPAT_* 后端已在路由中参与每个请求，
+    再用它重试失败块只会重复同样的失败。
+    """
+    return _openai_backend('OPENAI_FALLBACK', timeout)
@@ -0,0 +1,147 @@
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import timeline
+from log_config import bind_context, truncate
+
+logger = logging.getLogger(__name__)
+
+# 本地关键词分类器使用的领域词表，领域名与模型检测的输出风格一致
+_DOMAIN_KEYWORDS = {
+    "机器学习": ["neural network", "deep learning", "machine learning", "training", "gradient", "transformer",
+             "reinforcement learning", "loss function", "dataset", "benchmark", "fine-tuning", "embedding"],
+    "计算机视觉": ["image", "segmentation", "object detection", "convolutional", "pixel", "visual", "video",
+              "camera", "point cloud"],
+    "自然语言处理": ["language model", "token", "corpus", "translation", "sentence", "parsing", "text generation",
+               "named entity", "question answering"],
+    "大气科学": ["atmospheric", "climate", "precipitation", "aerosol", "troposphere", "weather", "monsoon",
+             "radiative forcing", "cloud microphysics"],
+    "生物医学工程": ["patient", "clinical", "tissue", "cell", "protein", "gene", "disease", "medical", "in vivo",
+               "biomarker"],
+    "模拟IC": ["amplifier", "transistor", "cmos", "bandwidth", "circuit", "voltage", "op-amp", "adc", "pll",
+             "low-noise", "gain"],
+    "材料科学": ["alloy", "crystal", "microstructure", "thin film", "nanoparticle", "polymer", "annealing",
+             "lattice", "diffraction"],
+    "化学": ["synthesis", "catalyst", "molecule", "reaction", "solvent", "spectroscopy", "compound", "yield"],
+    "经济学": ["market", "price", "economic", "policy", "firm", "inflation", "welfare", "equilibrium", "labor"],
+}
+_KEYWORD_PATTERNS = {
+    domain: re.compile(r'\b(?:' + '|'.join(re.escape(word) for word in words) + r')s?\b', re.IGNORECASE)
+    for domain, words in _DOMAIN_KEYWORDS.items()
+}
+# 关键词命中数低于该值时不做判断，使用通用领域
+_MIN_HITS = 3
+
+# 已检测文档的领域缓存（文档哈希 -> 领域）
+_CACHE_SIZE = 256
+_cache: "OrderedDict[str, str]" = OrderedDict()
+_cache_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="domain-detect")
+
+
+def classify_domain(text: str) -> Optional[str]:
+    """
+    基于关键词的快速本地领域分类，无需调用API。
+
+    :param text: 文献前几段内容
+    :return: 领域名，命中不足时返回None
+    """
+    scores = {domain: len(pattern.findall(text)) for domain, pattern in _KEYWORD_PATTERNS.items()}
+    domain, hits = max(scores.items(), key=lambda item: item[1])
+    return domain if hits >= _MIN_HITS else None
+
+
+def document_hash(document: str) -> str:
+    """文档内容的哈希，作为领域缓存的键"""
+    return hashlib.sha256(document.encode('utf-8')).hexdigest()
+
+
+def _cache_get(key: str) -> Optional[str]:
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+        return _cache.get(key)
+
+
+def _cache_put(key: str, domain: str) -> None:
+    with _cache_lock:
+        _cache[key] = domain
+        _cache.move_to_end(key)
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+class DomainResolver:
+    """
+    异步领域检测：先使用本地分类器得到的临时领域开始翻译，
+    模型检测完成后后续请求切换为检测结果。同一文档的检测结果会被缓存。
+    """
+
+    def __init__(self, client, document: str, front_text: str):
+        """
+        :param client: 提供 detect_domain 方法的翻译客户端
+        :param document: 完整文档内容，用于计算缓存键
+        :param front_text: 用于检测的正文前几段
+        """
+        self.key = document_hash(document)
+        self.provisional = classify_domain(front_text)
+        self._domain = _cache_get(self.key)
+        self._future = None
+        self._lock = threading.Lock()
+        if self._domain is not None:
+            logger.info("🏷️ 领域命中缓存：%s", self._domain)
+        else:
+            logger.info("🏷️ 临时领域：%s，后台检测中", self.provisional or '通用领域')
+            self._future = _executor.submit(bind_context(timeline.traced(client.detect_domain, "detect_domain")),
+                                            front_text)
+
+    def _resolve(self) -> Optional[str]:
+        """读取已完成的检测结果（调用方持有锁），失败时保留临时领域"""
+        try:
+            detected = self._future.result()
+        except Exception as e:
+            logger.warning("⚠️ 领域检测失败，使用临时领域: %s", truncate(e))
+            detected = None
+        self._future = None
+        if detected:
+            _cache_put(self.key, detected)
+            logger.info("🏷️ 领域检测完成：%s", detected)
+        self._domain = detected or self.provisional
+        return self._domain
+
+    def current(self) -> Optional[str]:
+        """当前可用的领域：检测完成前返回临时领域，不会阻塞"""
+        with self._lock:
+            if self._future is None:
+                return self._domain
+            if not self._future.done():
+                return self.provisional
+            return self._resolve()
+
+    def result(self) -> Optional[str]:
+        """等待检测完成并返回最终领域"""
+        future = self._future
+        if future is not None:
+            future.exception()
+        with self._lock:
+            if self._future is not None:
+                return self._resolve()
+            return self._domain
+
+
+class FixedDomain:
+    """已知领域（如从快照恢复时），接口与 DomainResolver 一致"""
+
+    def __init__(self, domain: Optional[str]):
+        self._domain = domain
+
+    def current(self) -> Optional[str]:
+        return self._domain
+
+    def result(self) -> Optional[str]:
+        return self._domain
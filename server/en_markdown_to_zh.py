@@ -1,10 +1,23 @@
+import logging
 import os
-from typing import Dict
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
 import tiktoken
 import nltk
 import pre_process
+import masking
+import metrics
 import translate
 import rebuild
+import scheduler
+import timeline
+from domain import DomainResolver, FixedDomain
+from markdown_fixer import MarkdownFixer, apply_heading_levels
+from log_config import bind_context, truncate
+from task_control import CancelToken, TaskCancelled, check_cancelled
+
+logger = logging.getLogger(__name__)
 
 
 def save_markdown(output_md: str, file_path: str) -> None:
@@ -18,66 +31,449 @@ def save_markdown(output_md: str, file_path: str) -> None:
         file.write(output_md)
 
 
-def main_workflow(input_md: str, config_short: Dict, config_long: Dict, source_language: str = "en", target_language: str = "zh-CN") -> str:
+def warm_up() -> None:
     """
-    核心工作流函数，完成从输入Markdown文本到翻译后Markdown文本的完整流程。
+    预加载tiktoken编码和NLTK句子切分模型，使首个任务不必承担加载耗时。
+    """
+    tiktoken.get_encoding("cl100k_base")
+    try:
+        nltk.sent_tokenize("Warm up. Done.")
+    except LookupError as e:
+        logger.warning("⚠️ NLTK punkt 资源缺失，超长段落将无法按句切分: %s", truncate(e))
+
+
+def _deepseek_api_key(*configs: Dict) -> Optional[str]:
+    """
+    从客户端配置中查找DeepSeek密钥，供标题修复使用（包括路由配置中的后端）。
+    """
+    for config in configs:
+        if config.get('provider') == "router":
+            api_key = _deepseek_api_key(*config.get('backends', []))
+        elif config.get('provider') == "deepseek":
+            api_key = config.get('api_key')
+        else:
+            api_key = None
+        if api_key:
+            return api_key
+    return None
+
+
+def _fix_headings(split_blocks: List[Dict], api_key: str, size_hints: Optional[List[float]],
+                  cancel_token: Optional[CancelToken] = None) -> List[Optional[int]]:
+    """在后台推断标题层级，失败时保留原层级"""
+    try:
+        with metrics.STAGE_SECONDS.time(stage="fix_headings"), timeline.span("fix_headings"):
+            return MarkdownFixer(api_key, cancel_token).fix_heading_blocks(split_blocks, size_hints)
+    except Exception as e:
+        logger.warning("⚠️ 标题修复失败，保留原层级: %s", truncate(e))
+        return []
+
+
+def _translate_masked(client: translate.APIClient, block: Dict, masked: str, mapping: Dict[str, str], domain,
+                      source_language: str, target_language: str, stats: Dict,
+                      cancel_token: Optional[CancelToken] = None,
+                      usage: Optional[translate.UsageMeter] = None) -> str:
+    """
+    翻译屏蔽了公式、URL、引用的块并还原占位符，占位符丢失时用原文重新请求。
+
+    领域在发出请求时读取，后台检测完成后的请求即使用检测结果。
+    """
+    context = domain.current()
+    result = client.translate(masked, context, source_language, target_language, block_type=block["type"],
+                              cancel_token=cancel_token, usage=usage)
+    restored, missing = masking.unmask_text(result, mapping)
+    if not missing:
+        return restored
+    logger.warning("⚠️ 块 %s 译文丢失占位符 %s，使用原文重新请求", block.get("id"), missing)
+    stats["remasked_blocks"] += 1
+    return client.translate(block["content"], context, source_language, target_language, block_type=block["type"],
+                            cancel_token=cancel_token, usage=usage)
+
+
+def _translate_block(client: translate.APIClient, block: Dict, masked: str, mapping: Dict[str, str], domain,
+                     source_language: str, target_language: str, stats: Dict,
+                     cancel_token: Optional[CancelToken] = None,
+                     usage: Optional[translate.UsageMeter] = None) -> Dict:
+    """翻译单个文本块，返回替换了译文的新块"""
+    check_cancelled(cancel_token)
+    logger.debug("块 %s 原文: %s", block.get("id"), truncate(block["content"]), extra={"sample": "block_source"})
+    result = _translate_masked(client, block, masked, mapping, domain, source_language, target_language, stats,
+                               cancel_token, usage)
+    logger.debug("块 %s 译文: %s", block.get("id"), truncate(result), extra={"sample": "block_result"})
+    return {**block, "content": result}
+
+
+def _run_block(client: translate.APIClient, fn: Callable, args: tuple, language: str, tokens: int) -> Dict:
+    """执行块任务（args[0] 为块），并把期间的请求耗时、重试和Token数记入任务时间线"""
+    block = args[0]
+    with timeline.block(block.get("id"), language, block["type"], tokens):
+        return fn(client, *args)
+
+
+def _table_segments(block: Dict) -> List[tuple]:
+    """
+    返回表格中需要翻译的单元格坐标（跳过对齐行以及数字、符号单元格）。
+    """
+    return [
+        (row_idx, col_idx)
+        for row_idx, cells in enumerate(block["rows"]) if row_idx != block.get("align_row")
+        for col_idx, cell in enumerate(cells) if pre_process.is_text_cell(cell)
+    ]
+
+
+def _translate_table(client: translate.APIClient, block: Dict, positions: List[tuple], packed: str, masked: str,
+                     mapping: Dict[str, str], domain, source_language: str, target_language: str, stats: Dict,
+                     cancel_token: Optional[CancelToken] = None,
+                     usage: Optional[translate.UsageMeter] = None) -> Dict:
+    """
+    以单次打包请求翻译表格中的文字单元格，并按原行列结构回填。
+    """
+    check_cancelled(cancel_token)
+    packed_block = {"type": "segments", "content": packed}
+    result = _translate_masked(client, packed_block, masked, mapping, domain, source_language, target_language, stats,
+                               cancel_token, usage)
+    cells = translate.unpack_segments(result, len(positions))
+    rows = [list(row) for row in block["rows"]]
+    for (row_idx, col_idx), cell in zip(positions, cells):
+        if cell is None:
+            stats["table_cells_missing"] += 1
+            continue
+        rows[row_idx][col_idx] = cell
+    return {**block, "rows": rows}
+
+
+def _new_stats() -> Dict:
+    """单个目标语言的统计项"""
+    return {"masked_spans": 0, "tokens_before_mask": 0, "tokens_after_mask": 0, "remasked_blocks": 0,
+            "table_cells_missing": 0, "reference_blocks_skipped": 0, "reference_tokens_skipped": 0,
+            "failed_blocks": []}
+
+
+def prepare_blocks(input_md: str) -> List[Dict]:
+    """
+    预处理阶段：解析Markdown、标记参考文献并按Token上限拆分。
 
     :param input_md: 输入的Markdown文本
-    :param config_short: 短文本配置参数，包含API提供者等信息
-    :param config_long: 长文本配置参数，包含API提供者等信息
-    :param source_language: 原文语言
-    :param target_language: 目标语言
+    :return: 拆分后的块列表（各目标语言共享，翻译时不会被修改），每个块带有稳定的id
     """
-    # 预处理阶段
     ast_blocks = pre_process.markdown_parser(input_md)
+    pre_process.classify_sections(ast_blocks)
     split_blocks = []
     for block in ast_blocks:
         split_blocks.extend(pre_process.dynamic_splitter(block))
+    # 相同输入的解析结果确定，按顺序编号即可在重试时定位同一个块
+    for idx, block in enumerate(split_blocks):
+        block["id"] = f"b{idx:04d}"
+    return split_blocks
+
 
-    # 翻译阶段
+def retranslate_snapshot(snapshot: Dict, config_short: Dict, config_long: Dict, block_ids: Optional[List[str]] = None,
+                         config_fallback: Optional[Dict] = None, stats: Optional[Dict] = None,
+                         cancel_token: Optional[CancelToken] = None, owner=None,
+                         usage: Optional[translate.UsageMeter] = None) -> Dict[str, str]:
+    """
+    只重新翻译快照中失败的块（或指定的块），其余译文保持不变。
+
+    :param snapshot: multi_language_workflow 生成的快照，重译结果会原地更新
+    :param config_short: 短文本配置参数
+    :param config_long: 长文本配置参数
+    :param block_ids: 需要重译的块id，为None时重译各语言记录的全部失败块
+    :param config_fallback: 备用客户端配置
+    :param stats: 可选的统计字典，按目标语言返回各自的统计项
+    :param cancel_token: 取消标记
+    :param owner: 块调度所有者
+    :param usage: 可选的用量统计器
+    :return: 目标语言到重建后译文Markdown的映射
+    """
+    if stats is None:
+        stats = {}
+    encoder = tiktoken.get_encoding("cl100k_base")
     client_short = translate.api_client_factory(config_short)
-    client_long=translate.api_client_factory(config_long)
-    # 判断领域
+    client_long = translate.api_client_factory(config_long)
+    client_fallback = translate.api_client_factory(config_fallback) if config_fallback else None
+    domain = FixedDomain(snapshot.get("domain"))
+    source_by_id = {block["id"]: block for block in snapshot["source_blocks"]}
+
+    outputs = {}
+    for language, entry in snapshot["languages"].items():
+        wanted = set(block_ids if block_ids is not None else entry["failed_blocks"])
+        retry_blocks = [source_by_id[block_id] for block_id in source_by_id if block_id in wanted]
+        stats[language] = _new_stats()
+        if retry_blocks:
+            logger.info("🔁 [%s] 重新翻译 %d 个块", language, len(retry_blocks))
+            with timeline.span("translate", lang=language):
+                results = translate_blocks(retry_blocks, client_short, client_long, config_short, config_long,
+                                           domain, snapshot["source_language"], language, stats[language], encoder,
+                                           cancel_token, owner, usage, client_fallback)
+            by_id = {block["id"]: block for block in results}
+            entry["blocks"] = [by_id.get(block["id"], block) for block in entry["blocks"]]
+        # 未参与本次重试的失败块仍保留在失败列表中
+        entry["failed_blocks"] = [block_id for block_id in entry["failed_blocks"] if block_id not in wanted] + \
+            stats[language]["failed_blocks"]
+        entry["blocks"] = apply_heading_levels(entry["blocks"], snapshot.get("levels") or [])
+        outputs[language] = rebuild.structure_rebuilder(entry["blocks"])
+    return outputs
+
+
+def detect_document_domain(client: translate.APIClient, split_blocks: List[Dict], document: str) -> DomainResolver:
+    """
+    根据正文前几个块判断文献所属领域，检测在后台进行，结果按文档哈希缓存。
+
+    :param client: 用于领域检测的客户端
+    :param split_blocks: 预处理后的块列表
+    :param document: 原始Markdown文本，用于计算缓存键
+    :return: 领域解析器，检测完成前提供本地关键词分类得到的临时领域
+    """
     front_text=[]
     num=0
     for idx, block in enumerate(split_blocks):
         if num>=6:
             break
-        if block["type"]!='image':
+        if pre_process.is_translatable(block) and block.get("section") != "references":
             front_text.append(block["content"])
             num=num+1
-    domain=client_short.detect_domain(front_text)
+    return DomainResolver(client, document, "\n\n".join(front_text))
+
+
+def main_workflow(input_md: str, config_short: Dict, config_long: Dict, source_language: str = "en", target_language: str = "zh-CN",
+                  size_hints: Optional[List[float]] = None, fix_headings: bool = True, stats: Optional[Dict] = None,
+                  cancel_token: Optional[CancelToken] = None, owner=None,
+                  usage: Optional[translate.UsageMeter] = None) -> str:
+    """
+    核心工作流函数，完成从输入Markdown文本到翻译后Markdown文本的完整流程。
+
+    :param input_md: 输入的Markdown文本
+    :param config_short: 短文本配置参数，包含API提供者等信息
+    :param config_long: 长文本配置参数，包含API提供者等信息
+    :param source_language: 原文语言
+    :param target_language: 目标语言
+    :param size_hints: MinerU标题字号提示，用于标题层级推断
+    :param fix_headings: 是否修复标题层级（与正文翻译并行执行）
+    :param stats: 可选的统计字典，用于返回token用量等信息
+    :param cancel_token: 取消标记，取消后在下一个检查点抛出 TaskCancelled
+    :param owner: 块调度所有者（通常为用户ID），同一所有者的块共享一份调度份额
+    :param usage: 可选的用量统计器，累计所有翻译请求的Token用量和缓存命中
+    """
+    language_stats = {}
+    outputs = multi_language_workflow(input_md, config_short, config_long, source_language, [target_language],
+                                      size_hints=size_hints, fix_headings=fix_headings, stats=language_stats,
+                                      cancel_token=cancel_token, owner=owner, usage=usage)
+    if stats is not None:
+        stats.update(language_stats[target_language])
+    return outputs[target_language]
+
+
+def multi_language_workflow(input_md: str, config_short: Dict, config_long: Dict, source_language: str,
+                            target_languages: List[str], size_hints: Optional[List[float]] = None,
+                            fix_headings: bool = True, stats: Optional[Dict] = None,
+                            cancel_token: Optional[CancelToken] = None, owner=None,
+                            usage: Optional[translate.UsageMeter] = None, config_fallback: Optional[Dict] = None,
+                            snapshot: Optional[Dict] = None) -> Dict[str, str]:
+    """
+    将同一文档翻译为多个目标语言：解析、拆分、领域判断和标题修复只做一次，
+    各目标语言在共享的块列表上并行翻译。
+
+    :param input_md: 输入的Markdown文本
+    :param config_short: 短文本配置参数
+    :param config_long: 长文本配置参数
+    :param source_language: 原文语言
+    :param target_languages: 目标语言列表
+    :param size_hints: MinerU标题字号提示
+    :param fix_headings: 是否修复标题层级
+    :param stats: 可选的统计字典，按目标语言返回各自的统计项
+    :param cancel_token: 取消标记
+    :param owner: 块调度所有者（通常为用户ID）
+    :param usage: 可选的用量统计器
+    :param config_fallback: 备用客户端配置，首次失败的块会在最后用它重新翻译
+    :param snapshot: 可选的字典，返回原文块、各语言译文块、失败块和标题层级，供之后只重译失败块
+    :return: 目标语言到译文Markdown的映射；翻译失败的块保留原文，块id记录在 stats[语言]["failed_blocks"]
+    """
+    if stats is None:
+        stats = {}
+    # 初始化tiktoken编码器
+    encoder = tiktoken.get_encoding("cl100k_base")
+
+    # 预处理阶段
+    start = time.monotonic()
+    with timeline.span("split"):
+        split_blocks = prepare_blocks(input_md)
 
+    # 标题修复只依赖原文标题块，与正文翻译并行
+    executor = ThreadPoolExecutor(max_workers=len(target_languages) + 1)
+    api_key = _deepseek_api_key(config_short, config_long)
+    heading_future = None
+    if fix_headings and api_key:
+        heading_future = executor.submit(bind_context(_fix_headings), split_blocks, api_key, size_hints, cancel_token)
+    try:
+        # 翻译阶段
+        client_short = translate.api_client_factory(config_short)
+        client_long=translate.api_client_factory(config_long)
+        client_fallback = translate.api_client_factory(config_fallback) if config_fallback else None
+        # 判断领域
+        domain = detect_document_domain(client_short, split_blocks, input_md)
+
+        logger.info("文档切分为 %d 个块", len(split_blocks))
+        futures = {}
+        for language in target_languages:
+            stats[language] = _new_stats()
+            futures[language] = executor.submit(
+                bind_context(timeline.traced(translate_blocks, "translate", lang=language)), split_blocks, client_short, client_long, config_short, config_long, domain,
+                source_language, language, stats[language], encoder, cancel_token, owner, usage, client_fallback
+            )
+        translations = {language: future.result() for language, future in futures.items()}
+
+        # 后处理阶段
+        check_cancelled(cancel_token)
+        levels = heading_future.result() if heading_future is not None else []
+        outputs = {}
+        for language in translations:
+            translations[language] = apply_heading_levels(translations[language], levels)
+            outputs[language] = rebuild.structure_rebuilder(translations[language])
+        if snapshot is not None:
+            snapshot.update({
+                "source_language": source_language,
+                "domain": domain.result(),
+                "levels": levels,
+                "source_blocks": split_blocks,
+                "languages": {language: {"blocks": translated, "failed_blocks": stats[language]["failed_blocks"]}
+                              for language, translated in translations.items()},
+            })
+        metrics.STAGE_SECONDS.observe(time.monotonic() - start, stage="translate")
+        return outputs
+    finally:
+        executor.shutdown(wait=False)
+
+
+def _collect_results(jobs: List[tuple], translated: List[Dict], stats: Dict) -> List[tuple]:
+    """
+    等待块任务完成并写回结果，返回失败的任务；取消会直接抛出。
+    """
+    failed = []
+    for job in jobs:
+        index, future, block_stats, _ = job
+        try:
+            translated[index] = future.result()
+        except TaskCancelled:
+            raise
+        except Exception as e:
+            logger.error("❌ 块 %s 翻译失败: %s", translated[index].get('id'), truncate(e))
+            failed.append(job)
+            continue
+        for key, value in block_stats.items():
+            stats[key] += value
+    return failed
+
+
+def _requeue(job: tuple) -> tuple:
+    """
+    失败块重新排队用的任务：换用新的块内统计，首次尝试已累积的统计随失败一并丢弃。
+    """
+    index, _, block_stats, (fn, args, *rest) = job
+    fresh = _new_stats()
+    args = tuple(fresh if arg is block_stats else arg for arg in args)
+    return index, fresh, (fn, args, *rest)
+
+
+def translate_blocks(split_blocks: List[Dict], client_short: translate.APIClient, client_long: translate.APIClient,
+                     config_short: Dict, config_long: Dict, domain, source_language: str, target_language: str,
+                     stats: Dict, encoder, cancel_token: Optional[CancelToken] = None, owner=None,
+                     usage: Optional[translate.UsageMeter] = None,
+                     fallback_client: Optional[translate.APIClient] = None) -> List[Dict]:
+    """
+    将块列表翻译为单个目标语言，返回新的块列表（不修改输入块）。
+
+    各块的API请求经块调度器并发执行，不同所有者的块轮流调度。
+    单个块重试耗尽后不会中断整篇文档：先在最后用备用客户端重新排队，
+    仍失败则保留原文，并把块id记入 stats["failed_blocks"]。
+
+    :param split_blocks: prepare_blocks 生成的块列表
+    :param client_short: 短文本翻译客户端
+    :param client_long: 长文本翻译客户端
+    :param domain: 领域解析器（DomainResolver），每次请求时读取当前领域
+    :param stats: 当前目标语言的统计字典
+    :param encoder: tiktoken编码器
+    :param cancel_token: 取消标记
+    :param owner: 调度所有者（通常为用户ID）
+    :param usage: 可选的用量统计器
+    :param fallback_client: 备用客户端，为None时失败块直接保留原文
+    :return: 翻译后的块列表
+    """
+    dispatcher = scheduler.get_block_dispatcher()
     translated = []
-    for block in split_blocks:
-        print("Sub Blocks:", block)
+    jobs = []
     for idx, block in enumerate(split_blocks):
-        if block["type"]=='image':
-            translated.append({**block, "content": block})
+        check_cancelled(cancel_token)
+        # 图片、公式、代码块不调用翻译API
+        if not pre_process.is_translatable(block):
+            translated.append(block)
+            continue
+        # 参考文献条目原样保留
+        if block.get("section") == "references":
+            stats["reference_blocks_skipped"] += 1
+            stats["reference_tokens_skipped"] += len(encoder.encode(block["content"]))
+            translated.append(block)
             continue
         content = block["content"]
-        # 初始化tiktoken编码器
-        encoder = tiktoken.get_encoding("cl100k_base")
-        # 计算当前块的Token数
-        tokens = encoder.encode(content)
+        if block["type"] == "table" and block.get("rows"):
+            # 表格只发送文字单元格，结构由 rebuild 确定性重建
+            positions = _table_segments(block)
+            if not positions:
+                translated.append(block)
+                continue
+            content = translate.pack_segments([block["rows"][r][c] for r, c in positions])
+        masked, mapping = masking.mask_text(content)
+        # 计算当前块屏蔽前后的Token数
+        tokens = encoder.encode(masked)
+        stats["masked_spans"] += len(mapping)
+        stats["tokens_before_mask"] += len(encoder.encode(content)) if mapping else len(tokens)
+        stats["tokens_after_mask"] += len(tokens)
         if len(tokens)<1000:
-            print(block["content"])
-            print("当前翻译模型：", config_short['modelname'], "\ntokens:", len(tokens))
-            result = client_short.translate(block["content"], domain, source_language, target_language)
-            print(result)
-            translated.append({**block, "content": result})
+            client, modelname = client_short, config_short.get('modelname', config_short['provider'])
         else:
-            print(block["content"])
-            print("当前翻译模型：", config_long['modelname'], "\ntokens:", len(tokens))
-            result = client_long.translate(block["content"], domain, source_language, target_language)
-            print(result)
-            translated.append({**block, "content": result})
-
-
-    # 后处理阶段
-    output_md = rebuild.structure_rebuilder(translated)
-
-
-    return output_md
+            client, modelname = client_long, config_long.get('modelname', config_long['provider'])
+        logger.debug("[%s] 块 %s 使用模型 %s，tokens: %d", target_language, block.get("id"), modelname, len(tokens),
+                     extra={"sample": "block_model"})
+        # API请求交给块调度器，与其他用户的块轮流执行；统计先记在块内，完成后合并
+        block_stats = _new_stats()
+        if block["type"] == "table" and block.get("rows"):
+            task = (_translate_table, (block, positions, content, masked, mapping, domain,
+                                       source_language, target_language, block_stats, cancel_token, usage))
+        else:
+            task = (_translate_block, (block, masked, mapping, domain,
+                                       source_language, target_language, block_stats, cancel_token, usage))
+        task = (*task, target_language, len(tokens))
+        future = dispatcher.submit(owner, _run_block, client, *task)
+        jobs.append((len(translated), future, block_stats, task))
+        translated.append(block)
 
+    failed = []
+    retries = []
+    try:
+        failed = _collect_results(jobs, translated, stats)
+        # 失败块在最后换用备用客户端重新排队
+        if failed and fallback_client is not None:
+            metrics.BLOCKS.inc(len(failed), outcome="fallback")
+            logger.warning("🔁 [%s] %d 个块翻译失败，使用备用客户端重试", target_language, len(failed))
+            retries = [(index, dispatcher.submit(owner, _run_block, fallback_client, *task), block_stats, task)
+                       for index, block_stats, task in map(_requeue, failed)]
+            failed = _collect_results(retries, translated, stats)
+    finally:
+        # 出错或取消时撤回尚未开始的块（包括备用客户端重新排队的块）
+        for _, future, _, _ in jobs + retries:
+            future.cancel()
+    for index, *_ in failed:
+        stats["failed_blocks"].append(translated[index]["id"])
+    metrics.BLOCKS.inc(len(jobs) - len(failed), outcome="translated")
+    metrics.BLOCKS.inc(len(failed), outcome="failed")
+    metrics.BLOCKS.inc(stats["reference_blocks_skipped"], outcome="skipped_reference")
+    if failed:
+        logger.warning("⚠️ [%s] %d 个块翻译失败，保留原文: %s", target_language, len(failed), stats['failed_blocks'])
 
+    saved = stats["tokens_before_mask"] - stats["tokens_after_mask"]
+    ratio = saved / stats["tokens_before_mask"] * 100 if stats["tokens_before_mask"] else 0
+    metrics.MASKED_TOKENS_SAVED.inc(saved)
+    logger.info("🔒 [%s] 占位符屏蔽 %d 处，节省 %d tokens（%.1f%%），%d 个块因占位符丢失重新请求",
+                target_language, stats['masked_spans'], saved, ratio, stats['remasked_blocks'])
+    logger.info("📚 [%s] 跳过参考文献 %d 个块，节省 %d tokens",
+                target_language, stats['reference_blocks_skipped'], stats['reference_tokens_skipped'])
+    return translated
@@ -1,38 +1,192 @@
 import en_markdown_to_zh
+import translate
 import os
+import json
+import logging
+import metrics
+import profiling
+import timeline
 import shutil
+import threading
+import time
 import nltk
+import image_stage
+import pdf_pages
+
+# 使用随项目提供的PaddleOCR模型，需在导入MinerU之前设置
+os.environ.setdefault("PADDLE_OCR_BASE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".paddleocr"))
+
 from magic_pdf.data.data_reader_writer import FileBasedDataWriter
 from magic_pdf.data.read_api import read_local_office  # 实际应为读取PDF的接口
 from magic_pdf.model.doc_analyze_by_custom_model import doc_analyze
 from magic_pdf.data.dataset import PymuDocDataset
-from markdown_fixer import fix_markdown_after_translation
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from log_config import task_context
+from task_control import TaskCancelled, check_cancelled
 
+logger = logging.getLogger(__name__)
+
+# 块快照文件后缀，保存在结果包中，用于之后只重译失败的块
+SNAPSHOT_SUFFIX = ".blocks.json"
+# 批量翻译中文件完成标记（保存该文件的汇总记录），存在时续跑跳过该文件
+BATCH_MARKER = ".batch_done.json"
+BATCH_SUMMARY = "batch_summary.jsonl"
+
+
+def extract_heading_size_hints(middle_json):
+    """
+    从MinerU中间结果中提取标题字号提示（以标题首行的行高近似字号）。
+
+    :param middle_json: pipe_result.get_middle_json() 的返回值
+    :return: 与Markdown标题顺序一致的字号列表
+    """
+    if isinstance(middle_json, str):
+        middle_json = json.loads(middle_json)
+    hints = []
+    for page in middle_json.get("pdf_info", []):
+        for block in page.get("para_blocks", []):
+            if block.get("type") != "title":
+                continue
+            lines = block.get("lines") or []
+            bbox = lines[0].get("bbox") if lines else block.get("bbox")
+            hints.append(round(bbox[3] - bbox[1], 1) if bbox else 0.0)
+    return hints
+
+
+def plan_pages(pdf_path, ocr_mode="auto"):
+    """
+    确定每页的解析方式。
+
+    :param ocr_mode: auto 逐页判断（有可用文本层的页直接抽取，扫描页/乱码页做OCR），on 全部OCR，off 全部使用文本层
+    :return: 每页的解析方式（pdf_pages.TEXT / pdf_pages.OCR）；无法逐页判断时返回None，按整份文档处理
+    """
+    if ocr_mode not in pdf_pages.OCR_MODES:
+        logger.warning("⚠️ 未知的OCR模式 %s，按 auto 处理", ocr_mode)
+        ocr_mode = "auto"
+    if ocr_mode != "auto":
+        return None
+    with timeline.span("classify_pages") as record:
+        try:
+            pages = pdf_pages.classify_pages(pdf_path)
+        except Exception as e:
+            logger.warning("⚠️ 页面分类失败，全部使用文本层: %s", e)
+            return None
+        modes = [page["mode"] for page in pages]
+        ocr_indexes = [index for index, mode in enumerate(modes) if mode == pdf_pages.OCR]
+        if record is not None:
+            record["pages"] = len(modes)
+            record["ocrPages"] = [index + 1 for index in ocr_indexes]
+    for index in ocr_indexes:
+        logger.debug("第 %d 页使用OCR：%s", index + 1, pages[index]["reason"], extra=pages[index])
+    if ocr_indexes:
+        logger.info("🔎 页面分类：共 %d 页，文本层 %d 页，OCR %d 页（第 %s 页）", len(modes),
+                    len(modes) - len(ocr_indexes), len(ocr_indexes), pdf_pages.format_pages(ocr_indexes))
+    else:
+        logger.info("🔎 页面分类：共 %d 页，全部使用文本层", len(modes))
+    return modes
 
-def pdf_to_markdown(pdf_path, output_dir="output"):
-    # 初始化输出目录
-    os.makedirs(os.path.join(output_dir, "images"), exist_ok=True)
-    image_writer = FileBasedDataWriter(os.path.join(output_dir, "images"))
-    md_writer = FileBasedDataWriter(output_dir)
 
-    # 读取PDF文件
-    with open(pdf_path, "rb") as f:
-        pdf_bytes = f.read()
+class _RunImageWriter(FileBasedDataWriter):
+    """
+    页面区间分别解析时使用的图片写入器：MinerU按子PDF内的页码和位置命名图片，不同区间的图片可能重名，
+    因此给文件名加上区间前缀，并记录改名，供 image_stage.rewrite_references 修正Markdown中的引用。
+    """
+
+    def __init__(self, parent_dir, prefix):
+        super().__init__(parent_dir)
+        self.prefix = prefix
+        self.renames = {}
+
+    def write(self, path, data):
+        self.renames[path] = self.prefix + path
+        super().write(self.prefix + path, data)
+
 
+def _analyze(pdf_bytes, ocr, image_writer, cancel_token):
+    """对一份PDF（或其中的页面区间）执行MinerU分析，返回管线结果"""
     # 创建数据集实例
     ds = PymuDocDataset(pdf_bytes)  # [^6]
 
     # 执行分析流程
-    infer_result = ds.apply(doc_analyze, ocr=False)  # [^2]
-    pipe_result = infer_result.pipe_txt_mode(image_writer)  # [^2]
+    check_cancelled(cancel_token)
+    infer_result = ds.apply(doc_analyze, ocr=ocr)  # [^2]
+    check_cancelled(cancel_token)
+    if ocr:
+        pipe_result = infer_result.pipe_ocr_mode(image_writer)
+    else:
+        pipe_result = infer_result.pipe_txt_mode(image_writer)  # [^2]
+    check_cancelled(cancel_token)
+    return pipe_result
+
+
+@profiling.profiled("pdf_to_markdown")
+def pdf_to_markdown(pdf_path, output_dir="output", cancel_token=None, ocr_mode="auto"):
+    """
+    使用MinerU将PDF解析为Markdown。
+
+    auto 模式下逐页判断是否需要OCR：全部为文本页时与关闭OCR相同；混合文档按连续的页面区间
+    分别解析后按页序拼接，只有扫描页/乱码页承担OCR开销。区间只在解析方式变化处切分，
+    跨区间边界的段落不会合并；各区间的图片文件名带区间前缀，避免互相覆盖。
+    各阶段之间检查取消标记；MinerU单个阶段内部无法中断。
+
+    :param cancel_token: 取消标记
+    :param ocr_mode: OCR模式，auto / on / off
+    :return: 标题字号提示列表，用于标题层级推断
+    """
+    # 初始化输出目录
+    os.makedirs(os.path.join(output_dir, "images"), exist_ok=True)
+    image_writer = FileBasedDataWriter(os.path.join(output_dir, "images"))
+    md_writer = FileBasedDataWriter(output_dir)
+
+    modes = plan_pages(pdf_path, ocr_mode)
+    if modes is None:
+        runs = [(None, None, pdf_pages.OCR if ocr_mode == "on" else pdf_pages.TEXT)]
+    else:
+        runs = pdf_pages.group_runs(modes)
+        if len(runs) == 1:
+            runs = [(None, None, runs[0][2])]
 
-    # 生成Markdown
     name_without_ext = os.path.splitext(os.path.basename(pdf_path))[0]
     image_dir = os.path.basename(os.path.join(output_dir, "images"))
-    pipe_result.dump_md(md_writer, f"{name_without_ext}.md", image_dir)  # [^1]
+    markdown_parts = []
+    size_hints = []
+    for start, end, mode in runs:
+        if start is None:
+            # 读取PDF文件
+            with open(pdf_path, "rb") as f:
+                pdf_bytes = f.read()
+        else:
+            pdf_bytes = pdf_pages.extract_pages(pdf_path, start, end)
+        attrs = {} if start is None else {"pages": f"{start + 1}-{end + 1}"}
+        writer = image_writer if start is None else \
+            _RunImageWriter(os.path.join(output_dir, "images"), f"p{start + 1}-{end + 1}_")
+        with timeline.span(f"parse_{mode}", **attrs):
+            pipe_result = _analyze(pdf_bytes, mode == pdf_pages.OCR, writer, cancel_token)
+        # 生成Markdown
+        markdown = pipe_result.get_markdown(image_dir)  # [^1]
+        if writer is not image_writer:
+            markdown = image_stage.rewrite_references(markdown, writer.renames, image_dir)
+        markdown_parts.append(markdown)
+        try:
+            size_hints.extend(extract_heading_size_hints(pipe_result.get_middle_json()))
+        except Exception as e:
+            logger.warning("⚠️ 无法提取标题字号提示: %s", e)
+    if modes is not None:
+        for mode in (pdf_pages.TEXT, pdf_pages.OCR):
+            metrics.PDF_PAGES.inc(modes.count(mode), mode=mode)
 
+    if len(markdown_parts) == 1:
+        md_text = markdown_parts[0]
+    else:
+        md_text = "\n\n".join(part.strip("\n") for part in markdown_parts) + "\n"
+    md_writer.write_string(f"{name_without_ext}.md", md_text)
+    return size_hints
 
-def translate_pdf_to_zh(pdf_path, output_dir, config_short, config_long, source_language="en", target_language="zh-CN"):
+
+def translate_pdf_to_zh(pdf_path, output_dir, config_short, config_long, source_language="en", target_language="zh-CN",
+                        cancel_token=None, target_languages=None, owner=None, timings=None, usage=None,
+                        config_fallback=None, failed_blocks=None, ocr_mode="auto", parse_slots=None):
     """
     将PDF文件转换为Markdown并进行翻译。
 
@@ -42,71 +196,254 @@ def translate_pdf_to_zh(pdf_path, output_dir, config_short, config_long, source_
     :param config_long: 长文本配置字典，包含API密钥等信息
     :param source_language: 原文语言
     :param target_language: 目标语言
+    :param cancel_token: 取消标记
+    :param target_languages: 多个目标语言；提供多个时解析只做一次，
+        各语言译文分别保存为 <文件名>.<语言>.md，原文Markdown保留
+    :param owner: 块调度所有者（通常为用户ID），用于多用户间公平分配翻译并发
+    :param timings: 可选的字典，返回解析(parse)和翻译(translate)阶段的耗时秒数
+    :param usage: 可选的 translate.UsageMeter，累计本文档的API用量
+    :param config_fallback: 备用客户端配置，用于重试首次失败的块
+    :param failed_blocks: 可选的字典，返回各目标语言翻译失败（保留原文）的块id
+    :param ocr_mode: OCR模式，auto 逐页判断 / on 全部OCR / off 只用文本层
+    :param parse_slots: 可选的信号量，限制同时解析的文档数（批量翻译时使用）
     """
+    if timings is None:
+        timings = {}
+    if failed_blocks is None:
+        failed_blocks = {}
+    languages = target_languages or [target_language]
     # 提取PDF文件名（去除扩展名）
     name_without_suff = os.path.splitext(os.path.basename(pdf_path))[0]
 
     # 将PDF转换为Markdown
-    pdf_to_markdown(pdf_path, output_dir=output_dir)
+    with parse_slots if parse_slots is not None else nullcontext():
+        start = time.monotonic()
+        with timeline.span("parse"):
+            size_hints = pdf_to_markdown(pdf_path, output_dir=output_dir, cancel_token=cancel_token, ocr_mode=ocr_mode)
+        timings["parse"] = time.monotonic() - start
+    metrics.STAGE_SECONDS.observe(timings["parse"], stage="parse")
 
     # 获取生成的Markdown文件路径
     md_file_path = os.path.join(output_dir, f"{name_without_suff}.md")
     # 将Markdown文件从英文翻译为中文
     with open(md_file_path, "r", encoding="utf-8") as file:
         md_text = file.read()
-    output_md = en_markdown_to_zh.main_workflow(md_text, config_short=config_short, config_long=config_long, source_language=source_language, target_language=target_language)
+    # 图片按内容哈希去重（很快），在翻译前改写引用；重新压缩与翻译并行，文件名不变
+    images_dir = os.path.join(output_dir, "images")
+    with timeline.span("images_dedupe"):
+        renames = image_stage.dedupe_images(images_dir)
+    if renames:
+        md_text = image_stage.rewrite_references(md_text, renames, os.path.basename(images_dir))
+        en_markdown_to_zh.save_markdown(md_text, md_file_path)
+        logger.info("🖼️ 去除重复图片 %d 张", len(renames))
+    image_futures = image_stage.start_recompress(images_dir, cancel_token)
+    # 标题层级修复在工作流内部与翻译并行完成
+    start = time.monotonic()
+    snapshot = {}
+    language_stats = {}
+    try:
+        outputs = en_markdown_to_zh.multi_language_workflow(md_text, config_short=config_short, config_long=config_long,
+                                                            source_language=source_language, target_languages=languages,
+                                                            size_hints=size_hints, cancel_token=cancel_token,
+                                                            owner=owner, usage=usage, stats=language_stats,
+                                                            config_fallback=config_fallback, snapshot=snapshot)
+        timings["translate"] = time.monotonic() - start
+    finally:
+        # 取消或失败时也等待压缩结束，避免清理输出目录时仍在写入图片
+        with timeline.span("images_wait"):
+            image_stats = image_stage.wait_recompress(image_futures)
+    if image_stats["recompressed"]:
+        logger.info("🖼️ 图片压缩：%d 张中 %d 张变小，共节省 %.1f MiB", image_stats["images"],
+                    image_stats["recompressed"], image_stats["bytes_saved"] / 1024 / 1024)
+
+    # 保存翻译后的Markdown文件（单一目标语言时覆盖原文件，保持原有输出结构）
+    if len(languages) == 1:
+        files = {languages[0]: f"{name_without_suff}.md"}
+    else:
+        files = {language: f"{name_without_suff}.{language}.md" for language in languages}
+    for language, output_md in outputs.items():
+        en_markdown_to_zh.save_markdown(output_md, os.path.join(output_dir, files[language]))
+
+    # 保存块快照，失败的块之后可以单独重译
+    snapshot["files"] = files
+    with timeline.span("snapshot"):
+        save_snapshot(snapshot, os.path.join(output_dir, f"{name_without_suff}{SNAPSHOT_SUFFIX}"))
+    for language, stats in language_stats.items():
+        if stats["failed_blocks"]:
+            failed_blocks[language] = stats["failed_blocks"]
+
+    logger.info("翻译完成")
+    for stats in translate.connection_stats():
+        logger.info("🔌 %s 连接复用：请求 %d 次，新建连接 %d 个", stats['provider'], stats['requests'],
+                    stats['new_connections'])
+    if usage is not None:
+        summary = usage.summary()
+        logger.info("💰 API用量：输入 %d tokens（缓存命中 %d，命中率 %.1f%%），输出 %d tokens",
+                    summary['prompt_tokens'], summary['prompt_cache_hit_tokens'], summary['cache_hit_ratio'] * 100,
+                    summary['completion_tokens'], extra={"usage": summary})
 
-    # 保存翻译后的Markdown文件
-    en_markdown_to_zh.save_markdown(output_md, md_file_path)
 
-    # 修复Markdown标题层级
+
+def save_snapshot(snapshot, path):
+    """保存块快照（JSON）"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+
+
+def retranslate_failed_blocks(zip_path, config_short, config_long, block_ids=None, config_fallback=None,
+                              cancel_token=None, owner=None, usage=None, failed_blocks=None):
+    """
+    只重译结果包中失败的块，重新生成Markdown并覆盖原ZIP。
+
+    :param zip_path: translate_one_pdf 生成的ZIP文件路径
+    :param config_short: 短文本配置字典
+    :param config_long: 长文本配置字典
+    :param block_ids: 需要重译的块id，为None时重译全部失败块
+    :param config_fallback: 备用客户端配置
+    :param cancel_token: 取消标记
+    :param owner: 块调度所有者
+    :param usage: 可选的 translate.UsageMeter
+    :param failed_blocks: 可选的字典，返回重译后仍失败的块id
+    """
+    if failed_blocks is None:
+        failed_blocks = {}
+    work_dir = os.path.splitext(zip_path)[0] + ".retry"
+    shutil.rmtree(work_dir, ignore_errors=True)
+    shutil.unpack_archive(zip_path, work_dir, 'zip')
+    try:
+        snapshot_files = [name for name in os.listdir(work_dir) if name.endswith(SNAPSHOT_SUFFIX)]
+        if not snapshot_files:
+            raise FileNotFoundError("结果包中没有块快照，无法只重译失败块")
+        snapshot_path = os.path.join(work_dir, snapshot_files[0])
+        with open(snapshot_path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+
+        language_stats = {}
+        outputs = en_markdown_to_zh.retranslate_snapshot(snapshot, config_short, config_long, block_ids=block_ids,
+                                                         config_fallback=config_fallback, stats=language_stats,
+                                                         cancel_token=cancel_token, owner=owner, usage=usage)
+        for language, output_md in outputs.items():
+            en_markdown_to_zh.save_markdown(output_md, os.path.join(work_dir, snapshot["files"][language]))
+        save_snapshot(snapshot, snapshot_path)
+        for language, entry in snapshot["languages"].items():
+            if entry["failed_blocks"]:
+                failed_blocks[language] = entry["failed_blocks"]
+
+        with timeline.span("zip"):
+            shutil.make_archive(os.path.splitext(zip_path)[0], 'zip', work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _link_or_copy(source, destination):
+    """优先创建硬链接，跨文件系统等情况下退回复制，避免批量时重复复制大文件"""
     try:
-        api_key = config_short.get('api_key') or config_long.get('api_key')
-        if api_key:
-            print("🔧 开始修复Markdown标题层级...")
-            fix_markdown_after_translation(output_dir, api_key)
+        os.link(source, destination)
+    except OSError:
+        shutil.copy(source, destination)
+
+
+def _translate_batch_file(pdf_path, output_subdir, config_short, config_long, source_language, languages,
+                          config_fallback, ocr_mode, parse_slots, delete_source):
+    """
+    批量翻译中的单个文件：成功后在输出目录写入完成标记；失败时保留原文PDF和已有输出，下次运行重做。
+
+    :return: 该文件的汇总记录
+    """
+    filename = os.path.basename(pdf_path)
+    os.makedirs(output_subdir)
+    _link_or_copy(pdf_path, os.path.join(output_subdir, filename))
+    usage = translate.UsageMeter()
+    timings = {}
+    failed_blocks = {}
+    start = time.monotonic()
+    with task_context(os.path.splitext(filename)[0]):
+        translate_pdf_to_zh(pdf_path, output_subdir, config_short, config_long, source_language,
+                            target_languages=languages, owner=filename, timings=timings, usage=usage,
+                            config_fallback=config_fallback, failed_blocks=failed_blocks, ocr_mode=ocr_mode,
+                            parse_slots=parse_slots)
+    record = {
+        "file": filename,
+        "status": "partial_success" if failed_blocks else "success",
+        "seconds": round(time.monotonic() - start, 3),
+        "parse": round(timings.get("parse", 0), 3),
+        "translate": round(timings.get("translate", 0), 3),
+        "usage": usage.summary(),
+        "failed_blocks": {language: len(ids) for language, ids in failed_blocks.items()},
+    }
+    with open(os.path.join(output_subdir, BATCH_MARKER), "w", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False)
+    if delete_source:
+        os.remove(pdf_path)
+    return record
+
+
+def translate_all_pdfs_in_folder(input_folder, output_folder, config_short, config_long, source_language="en",
+                                 target_language="zh-CN", target_languages=None, workers=4, parse_workers=1,
+                                 config_fallback=None, ocr_mode="auto", summary_path=None, delete_source=False,
+                                 force=False):
+    """
+    批量翻译文件夹中的PDF，结果保存在 output_folder/<文件名>/ 下。
+
+    最多 workers 个文件同时处理，其中最多 parse_workers 个同时做MinerU解析；翻译块由共享的块调度器
+    按文件轮流发送。已有完成标记的文件直接跳过，因此中断后重新运行即可续跑；单个文件失败不影响其他文件，
+    也不会删除其原文PDF。
+
+    :param workers: 同时处理的文件数
+    :param parse_workers: 同时解析的文件数（解析占用CPU/GPU和内存最多）
+    :param config_fallback: 备用客户端配置
+    :param ocr_mode: OCR模式，auto / on / off
+    :param summary_path: 汇总文件路径（JSON Lines，每个文件完成时追加一行），默认为 output_folder/batch_summary.jsonl
+    :param delete_source: 翻译成功后删除原文PDF
+    :param force: 忽略完成标记，重新翻译所有文件
+    :return: 各文件的汇总记录
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    languages = target_languages or [target_language]
+    summary_path = summary_path or os.path.join(output_folder, BATCH_SUMMARY)
+    summary_lock = threading.Lock()
+    parse_slots = threading.Semaphore(max(parse_workers, 1))
+
+    def run(filename):
+        pdf_path = os.path.join(input_folder, filename)
+        output_subdir = os.path.join(output_folder, os.path.splitext(filename)[0])
+        if not force and os.path.exists(os.path.join(output_subdir, BATCH_MARKER)):
+            record = {"file": filename, "status": "skipped"}
         else:
-            print("⚠️ 未找到API密钥，跳过标题修复")
-    except Exception as e:
-        print(f"⚠️ 标题修复失败，但翻译已完成: {str(e)}")
-
-    print("翻译完成")
-
-
-
-def translate_all_pdfs_in_folder(input_folder, output_folder, config_short, config_long, source_language="en", target_language="zh-CN"):
-    # 确保输出文件夹存在
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-    # 遍历输入文件夹中的所有文件
-    for filename in os.listdir(input_folder):
-        if filename.endswith(".pdf"):
-            # 构造完整的文件路径
-            pdf_path = os.path.join(input_folder, filename)
-
-            # 创建以PDF文件名命名的子文件夹
-            output_subdir = os.path.join(output_folder, os.path.splitext(filename)[0])
-            if not os.path.exists(output_subdir):
-                os.makedirs(output_subdir)
-            # 将PDF文件复制到输出子文件夹中
-            copied_pdf_path = os.path.join(output_subdir, filename)
+            # 没有完成标记的输出是上次中断或失败留下的，清理后重做
+            shutil.rmtree(output_subdir, ignore_errors=True)
             try:
-                shutil.copy(pdf_path, copied_pdf_path)
-            except FileNotFoundError as e:
-                print(f"无法复制文件 {pdf_path} 到 {copied_pdf_path}: {e}")
-                continue  # 跳过当前文件，继续处理下一个文件
-            # 调用翻译函数
-            translate_pdf_to_zh(pdf_path, output_subdir, config_short, config_long, source_language, target_language)
+                record = _translate_batch_file(pdf_path, output_subdir, config_short, config_long, source_language,
+                                               languages, config_fallback, ocr_mode, parse_slots, delete_source)
+            except Exception as e:
+                logger.exception("❌ %s 翻译失败: %s", filename, e)
+                record = {"file": filename, "status": "failed", "error": str(e)}
+        record["finishedAt"] = int(time.time())
+        with summary_lock:
+            with open(summary_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        logger.info("📄 %s：%s", filename, record["status"])
+        return record
 
-            # 删除原文PDF文件
-            os.remove(pdf_path)
+    filenames = sorted(name for name in os.listdir(input_folder) if name.lower().endswith(".pdf"))
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="batch") as executor:
+        return list(executor.map(run, filenames))
 
-def translate_one_pdf(pdf_path, output_folder, config_short, config_long, source_language="en", target_language="zh-CN"):
+def translate_one_pdf(pdf_path, output_folder, config_short, config_long, source_language="en", target_language="zh-CN",
+                      cancel_token=None, target_languages=None, owner=None, timings=None, usage=None,
+                      config_fallback=None, failed_blocks=None, ocr_mode="auto", output_name=None):
+    """
+    翻译单个PDF并将结果打包为 <输出目录>/<output_name>.zip，返回ZIP路径（复制PDF失败时返回None）。
+
+    :param output_name: 工作子目录和ZIP包的名称，默认为PDF文件名；同名文件可能同时处理时
+        （如Web服务中的多个任务）传入任务ID，各任务的中间文件与结果包互不覆盖
+    其余参数见 translate_pdf_to_zh。
+    """
     # 获取PDF文件名（不带扩展名）
     filename = os.path.basename(pdf_path)
     filename_without_ext = os.path.splitext(filename)[0]
-    # 创建以PDF文件名命名的子文件夹
-    output_subdir = os.path.join(output_folder, filename_without_ext)
+    # 创建工作子文件夹（默认以PDF文件名命名）
+    output_subdir = os.path.join(output_folder, output_name or filename_without_ext)
     if not os.path.exists(output_subdir):
         os.makedirs(output_subdir)
     # 将PDF文件复制到输出子文件夹中
@@ -114,15 +451,23 @@ def translate_one_pdf(pdf_path, output_folder, config_short, config_long, source
     try:
         shutil.copy(pdf_path, copied_pdf_path)
     except FileNotFoundError as e:
-        print(f"无法复制文件 {pdf_path} 到 {copied_pdf_path}: {e}")
+        logger.error("无法复制文件 %s 到 %s: %s", pdf_path, copied_pdf_path, e)
         return  # 如果复制失败，直接返回
-    # 调用翻译函数
-    translate_pdf_to_zh(pdf_path, output_subdir, config_short, config_long, source_language, target_language)
+    # 调用翻译函数，取消时清理中间产物
+    try:
+        translate_pdf_to_zh(pdf_path, output_subdir, config_short, config_long, source_language, target_language,
+                            cancel_token=cancel_token, target_languages=target_languages, owner=owner, timings=timings, usage=usage,
+                            config_fallback=config_fallback, failed_blocks=failed_blocks, ocr_mode=ocr_mode)
+    except TaskCancelled:
+        shutil.rmtree(output_subdir, ignore_errors=True)
+        raise
     # 将 output_subdir 压缩为 ZIP 文件
-    zip_path = os.path.join(output_folder, filename_without_ext)
-    shutil.make_archive(zip_path, 'zip', output_subdir)
+    zip_path = os.path.join(output_folder, output_name or filename_without_ext)
+    with timeline.span("zip"):
+        zip_path = shutil.make_archive(zip_path, 'zip', output_subdir)
     # 删除原始的 output_subdir 文件夹（可选）
     shutil.rmtree(output_subdir)
+    return zip_path
     
 
 
@@ -0,0 +1,177 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+import metrics
+from task_control import CancelToken
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_WORKERS = 4
+# 可重新压缩的图片格式（保持原格式和文件名，Markdown引用不变）
+_RECOMPRESS_FORMATS = ("JPEG", "PNG")
+
+_settings = {"recompress": True, "max_side": 2048, "jpeg_quality": 85, "workers": DEFAULT_WORKERS}
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def configure(recompress: bool = True, max_side: int = 2048, jpeg_quality: int = 85,
+              workers: int = DEFAULT_WORKERS) -> None:
+    """
+    设置图片处理参数；线程数只在首次创建线程池时生效。
+
+    :param recompress: 是否重新压缩图片（需要Pillow，MinerU已依赖）
+    :param max_side: 长边超过该像素数时等比缩小，0表示不缩小
+    :param jpeg_quality: JPEG重新编码的质量
+    :param workers: 图片处理线程数（哈希和Pillow编解码都会释放GIL），所有任务共享
+    """
+    with _executor_lock:
+        _settings.update(recompress=recompress, max_side=max_side, jpeg_quality=jpeg_quality, workers=workers)
+    _get_executor()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(_settings["workers"], 1), thread_name_prefix="image-stage")
+        return _executor
+
+
+def _list_images(image_dir: str) -> List[str]:
+    if not os.path.isdir(image_dir):
+        return []
+    return sorted(name for name in os.listdir(image_dir) if os.path.isfile(os.path.join(image_dir, name)))
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def dedupe_images(image_dir: str) -> Dict[str, str]:
+    """
+    按内容哈希去除重复图片（同一Logo、重复的图在MinerU中按位置分别保存），每组只保留文件名最小的一张。
+
+    :param image_dir: 图片目录
+    :return: 被删除的文件名 -> 保留的文件名
+    """
+    names = _list_images(image_dir)
+    if len(names) < 2:
+        return {}
+    digests = _get_executor().map(_hash_file, [os.path.join(image_dir, name) for name in names])
+    kept = {}
+    renames = {}
+    for name, digest in zip(names, digests):
+        original = kept.setdefault(digest, name)
+        if original != name:
+            renames[name] = original
+    for name in renames:
+        os.remove(os.path.join(image_dir, name))
+    metrics.IMAGES.inc(len(renames), outcome="duplicate")
+    return renames
+
+
+def rewrite_references(md_text: str, renames: Dict[str, str], image_dir_name: str = "images") -> str:
+    """
+    将Markdown（含HTML表格中的<img>）对已删除图片的引用改为保留的图片。
+
+    :param md_text: Markdown文本
+    :param renames: dedupe_images 的返回值
+    :param image_dir_name: Markdown中引用图片使用的目录名
+    :return: 替换后的文本
+    """
+    if not renames:
+        return md_text
+    pattern = re.compile(rf'({re.escape(image_dir_name)}/)([^\s)"\'<>]+)')
+    return pattern.sub(lambda m: m.group(1) + renames.get(m.group(2), m.group(2)), md_text)
+
+
+def _recompress(path: str, max_side: int, jpeg_quality: int, cancel_token: Optional[CancelToken]) -> Optional[int]:
+    """
+    重新压缩单张图片，结果更小时原地替换（缩小尺寸后文件反而变大的少见情况保留原图）。
+
+    :return: 节省的字节数；未替换时返回None
+    """
+    if cancel_token is not None and cancel_token.cancelled:
+        return None
+    from PIL import Image
+
+    size = os.path.getsize(path)
+    with Image.open(path) as img:
+        image_format = img.format
+        if image_format not in _RECOMPRESS_FORMATS:
+            return None
+        img.load()
+        if max_side and max(img.size) > max_side:
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+        buffer = io.BytesIO()
+        if image_format == "JPEG":
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            img.save(buffer, "JPEG", quality=jpeg_quality, optimize=True, progressive=True)
+        else:
+            img.save(buffer, "PNG", optimize=True)
+    if buffer.tell() >= size:
+        return None
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(buffer.getvalue())
+    os.replace(temp_path, path)
+    return size - buffer.tell()
+
+
+def start_recompress(image_dir: str, cancel_token: Optional[CancelToken] = None) -> List[Future]:
+    """
+    在图片线程池中重新压缩/缩小图片，与翻译并行执行，文件名不变。
+
+    :param image_dir: 图片目录（应先完成去重）
+    :param cancel_token: 取消标记，取消后尚未开始的图片不再处理
+    :return: 各图片的Future，交给 wait_recompress 等待
+    """
+    with _executor_lock:
+        settings = dict(_settings)
+    if not settings["recompress"]:
+        return []
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        logger.warning("⚠️ 未安装Pillow，跳过图片压缩")
+        return []
+    executor = _get_executor()
+    return [executor.submit(_recompress, os.path.join(image_dir, name), settings["max_side"],
+                            settings["jpeg_quality"], cancel_token)
+            for name in _list_images(image_dir)]
+
+
+def wait_recompress(futures: List[Future]) -> Dict[str, int]:
+    """
+    等待图片压缩完成；单张图片失败时保留原图。
+
+    :return: {"images": 处理的图片数, "recompressed": 被替换的图片数, "bytes_saved": 节省的字节数}
+    """
+    wait(futures)
+    recompressed = 0
+    saved = 0
+    for future in futures:
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.warning("⚠️ 图片压缩失败，保留原图: %s", e)
+            continue
+        if result is not None:
+            recompressed += 1
+            saved += result
+    metrics.IMAGES.inc(recompressed, outcome="recompressed")
+    metrics.IMAGE_BYTES_SAVED.inc(saved)
+    return {"images": len(futures), "recompressed": recompressed, "bytes_saved": saved}
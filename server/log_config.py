@@ -0,0 +1,152 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+
+# 当前任务ID，写入每条日志用于关联同一任务的日志
+task_id_var: contextvars.ContextVar = contextvars.ContextVar("task_id", default="-")
+
+# 日志中文本内容（原文、译文等）的默认截断长度
+DEFAULT_TRUNCATE = 200
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [task=%(task_id)s] %(message)s"
+
+# LogRecord 的标准属性，其余属性视为结构化字段
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "task_id", "sample"}
+
+# 第三方库的调试日志（每个HTTP请求十余条）会淹没业务日志，固定为WARNING
+_NOISY_LOGGERS = ("httpcore", "httpx", "openai", "urllib3")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+def truncate(text, limit: int = DEFAULT_TRUNCATE) -> str:
+    """
+    截断过长的文本内容，避免整段原文/译文写入日志。
+
+    :param text: 任意对象，按str处理
+    :param limit: 保留的最大字符数
+    :return: 截断后的文本，注明省略的字符数
+    """
+    text = str(text)
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}…(+{len(text) - limit} chars)"
+
+
+class ContextFilter(logging.Filter):
+    """在产生日志的线程中写入当前任务ID"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.task_id = task_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    对高频日志采样：带有 extra={"sample": 键} 的日志，
+    每个任务的每个键先保留前 burst 条，之后每 rate 条保留1条。
+    """
+
+    def __init__(self, rate: int, burst: int):
+        super().__init__()
+        self.rate = max(rate, 1)
+        self.burst = burst
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, "sample", None)
+        if key is None:
+            return True
+        counter = (getattr(record, "task_id", "-"), key)
+        with self._lock:
+            count = self._counts.get(counter, 0) + 1
+            self._counts[counter] = count
+            # 计数表过大时清空，防止长时间运行后无限增长
+            if len(self._counts) > 10000:
+                self._counts.clear()
+        return count <= self.burst or count % self.rate == 0
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出一行JSON，extra中的字段作为结构化字段输出"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "task_id": getattr(record, "task_id", "-"),
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(level: Optional[str] = None, fmt: Optional[str] = None) -> None:
+    """
+    配置异步日志：业务线程只把日志放入队列，由后台监听线程格式化并输出。
+
+    未指定的参数从环境变量读取：LOG_LEVEL（默认INFO）、LOG_FORMAT（text/json，默认text）、
+    LOG_SAMPLE_RATE（采样间隔，默认50）、LOG_SAMPLE_BURST（每个键先保留的条数，默认5）。
+    重复调用不会重复添加处理器。
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+        fmt = (fmt or os.getenv("LOG_FORMAT", "text")).lower()
+
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        queue_handler.addFilter(ContextFilter())
+        queue_handler.addFilter(SamplingFilter(int(os.getenv("LOG_SAMPLE_RATE", "50")),
+                                               int(os.getenv("LOG_SAMPLE_BURST", "5"))))
+
+        root = logging.getLogger()
+        root.setLevel(level)
+        root.addHandler(queue_handler)
+        for name in _NOISY_LOGGERS:
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+        _listener = logging.handlers.QueueListener(log_queue, output)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+@contextmanager
+def task_context(task_id: str):
+    """在上下文中设置当前任务ID"""
+    token = task_id_var.set(task_id)
+    try:
+        yield
+    finally:
+        task_id_var.reset(token)
+
+
+def bind_context(fn: Callable) -> Callable:
+    """
+    绑定当前上下文（任务ID等），返回的函数在其他线程中执行时沿用该上下文。
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        # 同一个Context不能被多个线程同时进入，每次执行使用副本
+        return context.copy().run(fn, *args, **kwargs)
+    return run
@@ -1,21 +1,144 @@
-import os
+import logging
 import re
 import time
-from typing import List, Tuple
+from typing import Dict, List, Optional
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_deepseek import ChatDeepSeek
+import metrics
+import task_control
+import translate
+from task_control import CancelToken, TaskCancelled, check_cancelled
+
+logger = logging.getLogger(__name__)
+
+# 标题层级推断规则（预编译）
+_HEADING_LINE = re.compile(r'^(#+)\s*(.*)$')
+_EMPHASIS = re.compile(r'^[*_]+|[*_]+$')
+# 1 / 1. / 3.2 / 3.2.1 Title
+_NUMBERED = re.compile(r'^(\d{1,2}(?:\.\d{1,2})*)\.?\s+\S')
+# A.1 / B.2.3 Title（附录小节）
+_APPENDIX_NUMBERED = re.compile(r'^([A-Z])\.(\d{1,2}(?:\.\d{1,2})*)\.?\s+\S')
+# Appendix A / APPENDIX / 附录A
+# 中文词与后续文字之间没有\b边界（如“附录A”“结论与展望”），中文只匹配前缀
+_APPENDIX_TOP = re.compile(r'^(?:(?:appendix|appendices|supplementary\s+materials?)\b|附\s*录)', re.IGNORECASE)
+# II. METHODS（IEEE风格罗马数字）
+_ROMAN = re.compile(r'^(?=[IVXL]+\.)[IVXL]{1,5}\.\s+\S')
+# A. Subsection（IEEE风格字母小节）
+_LETTER = re.compile(r'^[A-Z]\.\s+\S')
+# 第一章 / 第2节
+_CN_CHAPTER = re.compile(r'^第[一二三四五六七八九十百\d]+[章部分篇]')
+_CN_SECTION = re.compile(r'^第[一二三四五六七八九十百\d]+节')
+# 一、 / （一）
+_CN_ENUM = re.compile(r'^[一二三四五六七八九十]+[、.．]')
+_CN_SUB_ENUM = re.compile(r'^[（(][一二三四五六七八九十]+[)）]')
+# 无编号的常见一级章节
+_KNOWN_TOP = re.compile(
+    r'^(?:(?:abstract|introduction|related\s+works?|background|conclusions?|discussion|'
+    r'references?|bibliography|acknowledge?ments?|keywords?|index\s+terms)\b|'
+    r'摘\s*要|关键词|引\s*言|绪\s*论|结\s*论|讨\s*论|参考文献|致\s*谢)',
+    re.IGNORECASE
+)
+# 参考文献章节，其后的字母编号标题按附录处理
+_REFERENCES_TOP = re.compile(r'^(?:(?:references?|bibliography)\b|参考文献)', re.IGNORECASE)
+# 字号匹配的相对容差
+_SIZE_TOLERANCE = 0.08
+
+
+def _heading_text(heading: str) -> str:
+    """去掉#号与首尾强调符号后的标题文本"""
+    match = _HEADING_LINE.match(heading.strip())
+    text = match.group(2) if match else heading.strip()
+    return _EMPHASIS.sub('', text.strip()).strip()
+
+
+def _rule_depth(text: str, uses_roman: bool, in_appendix: bool) -> Optional[int]:
+    """根据编号规则推断相对深度（1为章节顶层），无法判断时返回None"""
+    match = _APPENDIX_NUMBERED.match(text)
+    if match:
+        return 1 + len(match.group(2).split('.'))
+    match = _NUMBERED.match(text)
+    if match:
+        return len(match.group(1).split('.'))
+    if _ROMAN.match(text) or _APPENDIX_TOP.match(text) or _KNOWN_TOP.match(text):
+        return 1
+    if _CN_CHAPTER.match(text) or _CN_ENUM.match(text):
+        return 1
+    if _CN_SECTION.match(text) or _CN_SUB_ENUM.match(text):
+        return 2
+    if _LETTER.match(text):
+        if uses_roman:
+            return 2
+        if in_appendix:
+            return 1
+    return None
+
+
+def infer_heading_levels(headings: List[str], size_hints: Optional[List[float]] = None) -> List[Optional[int]]:
+    """本地推断标题层级，无法判断的标题返回None
+
+    依次使用章节编号、附录/参考文献等固定章节名以及MinerU提供的标题字号。
+
+    Args:
+        headings: 标题列表（可带#号）
+        size_hints: 与标题一一对应的字号提示，数量不一致时忽略
+
+    Returns:
+        List[Optional[int]]: 每个标题的层级（1-6），None表示需要交给LLM判断
+    """
+    texts = [_heading_text(h) for h in headings]
+    uses_roman = any(_ROMAN.match(t) for t in texts)
+
+    depths: List[Optional[int]] = []
+    in_appendix = False
+    for text in texts:
+        if _APPENDIX_TOP.match(text) or _REFERENCES_TOP.match(text):
+            in_appendix = True
+        depths.append(_rule_depth(text, uses_roman, in_appendix))
+
+    # 首个无法判断的标题出现在所有编号章节之前，视为论文题目；
+    # 有字号提示时要求它比顶层章节标题更大，否则只是一个无编号章节，交给字号比较或LLM
+    offset = 0
+    if len(texts) > 1 and depths[0] is None and any(d is not None for d in depths[1:]):
+        offset = 1
+        if size_hints and len(size_hints) == len(headings) and size_hints[0]:
+            top_sizes = sorted(size for depth, size in zip(depths, size_hints) if depth == 1 and size)
+            if top_sizes:
+                top_size = top_sizes[len(top_sizes) // 2]
+                if size_hints[0] <= top_size * (1 + _SIZE_TOLERANCE):
+                    offset = 0
+
+    levels: List[Optional[int]] = []
+    for idx, depth in enumerate(depths):
+        if idx == 0 and offset:
+            levels.append(1)
+        elif depth is None:
+            levels.append(None)
+        else:
+            levels.append(min(depth + offset, 6))
+
+    # 用字号补全剩余标题：与已确定层级的标题字号最接近者同级
+    if size_hints and len(size_hints) == len(headings) and None in levels:
+        level_sizes: Dict[int, List[float]] = {}
+        for level, size in zip(levels, size_hints):
+            if level is not None and size:
+                level_sizes.setdefault(level, []).append(size)
+        references = {level: sorted(sizes)[len(sizes) // 2] for level, sizes in level_sizes.items()}
+        for idx, (level, size) in enumerate(zip(levels, size_hints)):
+            if level is not None or not size or not references:
+                continue
+            best_level, best_size = min(references.items(), key=lambda item: abs(item[1] - size))
+            if abs(best_size - size) <= best_size * _SIZE_TOLERANCE:
+                levels[idx] = best_level
+
+    return levels
+
 
 class MarkdownFixer:
-    def __init__(self, api_key: str):
-        self.llm = ChatDeepSeek(
-            api_key=api_key,
-            model="deepseek-chat",
-            temperature=0.1,
-            max_tokens=8192,
-            max_retries=3,
-            timeout=60
-        )
+    def __init__(self, api_key: str, cancel_token: Optional[CancelToken] = None):
+        self.api_key = api_key
+        self.cancel_token = cancel_token
+        self._chain = None
         self.prompt = ChatPromptTemplate.from_template(
             """请根据学术论文结构规范修复以下标题层级：
 要求：
@@ -29,150 +152,116 @@ class MarkdownFixer:
 
 请直接返回修正后的标题列表："""
         )
-        self.chain = self.prompt | self.llm | StrOutputParser()
-    
-    def _extract_headings(self, content: str) -> Tuple[List[str], str]:
-        """提取标题并保留锚点"""
-        headings = []
-        body = []
-        for line in content.split('\n'):
-            if line.startswith('#'):
-                headings.append(line)
-                body.append(f"__HEADING_PLACEHOLDER_{len(headings)}__")
-            else:
-                body.append(line)
-        return headings, '\n'.join(body)
-    
-    def _rebuild_content(self, body: str, new_headings: List[str]) -> str:
-        """重建Markdown内容"""
-        content_lines = []
-        heading_idx = 0
-        for line in body.split('\n'):
-            if line.startswith('__HEADING_PLACEHOLDER_'):
-                if heading_idx < len(new_headings):
-                    content_lines.append(new_headings[heading_idx])
-                    heading_idx += 1
-            else:
-                content_lines.append(line)
-        return '\n'.join(content_lines)
+
+    @property
+    def chain(self):
+        """按需创建LLM调用链，规则可完全确定层级时不会初始化客户端"""
+        if self._chain is None:
+            llm = ChatDeepSeek(
+                api_key=self.api_key,
+                model="deepseek-chat",
+                temperature=0.1,
+                max_tokens=8192,
+                max_retries=3,
+                timeout=60,
+                # 与翻译客户端共用同一端点的连接池
+                http_client=translate.shared_http_client("deepseek", self.api_key, translate.DEEPSEEK_BASE_URL)
+            )
+            self._chain = self.prompt | llm | StrOutputParser()
+        return self._chain
     
-    def fix_markdown_file(self, md_path: str, max_retries: int = 3) -> bool:
-        """修复单个Markdown文件的标题结构
-        
+    def _llm_levels(self, headings: List[str], levels: List[Optional[int]], max_retries: int) -> List[Optional[int]]:
+        """将规则无法确定的标题交给LLM判断层级
+
+        已确定的标题先按推断层级改写后一并发送，作为上下文；
+        只采纳LLM对未确定标题给出的层级。
+        """
+        draft = [
+            f"{'#' * level} {_heading_text(h)}" if level else h.strip()
+            for h, level in zip(headings, levels)
+        ]
+        for attempt in range(max_retries):
+            check_cancelled(self.cancel_token)
+            try:
+                start = time.monotonic()
+                fixed_headings = self.chain.invoke({
+                    "headings": '\n'.join(draft)
+                })
+                metrics.record_api_call("deepseek", "heading_levels", time.monotonic() - start)
+                new_headings = [h.strip() for h in fixed_headings.split('\n') if h.strip().startswith('#')]
+                if len(new_headings) != len(headings):
+                    raise ValueError("标题数量不匹配")
+                return [
+                    level if level else min(len(_HEADING_LINE.match(new).group(1)), 6)
+                    for level, new in zip(levels, new_headings)
+                ]
+            except Exception as e:
+                metrics.record_api_error("deepseek", "heading_levels", attempt < max_retries - 1)
+                if attempt == max_retries - 1:
+                    raise
+                logger.warning("⚠️ 标题层级LLM判断失败，重试中: %s", e)
+                task_control.sleep(2 ** attempt, self.cancel_token)
+        return levels
+
+    def resolve_levels(self, headings: List[str], size_hints: Optional[List[float]] = None,
+                       max_retries: int = 3) -> List[Optional[int]]:
+        """确定标题层级：先用本地规则，仅对无法判断的标题调用LLM
+
         Args:
-            md_path: Markdown文件路径
-            max_retries: 最大重试次数
-            
+            headings: 标题列表（可带#号）
+            size_hints: MinerU标题字号提示
+            max_retries: LLM最大重试次数
+
         Returns:
-            bool: 修复是否成功
+            List[Optional[int]]: 每个标题的层级，LLM失败时未确定项为None
         """
-        if not os.path.exists(md_path):
-            print(f"❌ 文件不存在：{md_path}")
-            return False
-            
+        levels = infer_heading_levels(headings, size_hints)
+        unresolved = sum(1 for level in levels if level is None)
+        metrics.HEADINGS.inc(len(headings) - unresolved, method="rules")
+        if not unresolved:
+            return levels
+        logger.info("ℹ️ %d/%d 个标题无法由规则确定层级，调用LLM", unresolved, len(headings))
         try:
-            with open(md_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # 提取标题
-            original_headings, body = self._extract_headings(content)
-            
-            # 如果没有标题，直接返回成功
-            if not original_headings:
-                print(f"ℹ️ 文件无标题，跳过修复：{os.path.basename(md_path)}")
-                return True
-            
-            for attempt in range(max_retries):
-                try:
-                    # 调用LLM修复
-                    fixed_headings = self.chain.invoke({
-                        "headings": '\n'.join(original_headings)
-                    })
-                    
-                    # 解析响应
-                    new_headings = [h.strip() for h in fixed_headings.split('\n') if h.strip().startswith('#')]
-                    if len(new_headings) != len(original_headings):
-                        raise ValueError("标题数量不匹配")
-                    
-                    # 重建内容
-                    fixed_content = self._rebuild_content(body, new_headings)
-                    
-                    # 原子写入
-                    tmp_path = f"{md_path}.tmp"
-                    with open(tmp_path, 'w', encoding='utf-8') as f:
-                        f.write(fixed_content)
-                    os.replace(tmp_path, md_path)
-                    
-                    print(f"✅ 标题修复完成：{os.path.basename(md_path)}")
-                    return True
-                    
-                except Exception as e:
-                    if attempt == max_retries - 1:
-                        print(f"❌ 修复失败《{os.path.basename(md_path)}》: {str(e)}")
-                    time.sleep(2 ** attempt)
-                    
+            resolved = self._llm_levels(headings, levels, max_retries)
+        except TaskCancelled:
+            raise
         except Exception as e:
-            print(f"❌ 文件操作失败《{os.path.basename(md_path)}》: {str(e)}")
-            
-        return False
+            logger.warning("⚠️ LLM标题层级判断失败，保留原层级: %s", e)
+            metrics.HEADINGS.inc(unresolved, method="unresolved")
+            return levels
+        metrics.HEADINGS.inc(unresolved, method="llm")
+        return resolved
+
+    def fix_heading_blocks(self, blocks: List[Dict], size_hints: Optional[List[float]] = None,
+                           max_retries: int = 3) -> List[Optional[int]]:
+        """直接基于解析后的块列表推断标题层级，不读写文件
 
-    def fix_markdown_in_directory(self, directory_path: str) -> int:
-        """修复目录中所有Markdown文件的标题结构
-        
         Args:
-            directory_path: 目录路径
-            
+            blocks: pre_process.markdown_parser 生成的块列表
+            size_hints: MinerU标题字号提示
+            max_retries: LLM最大重试次数
+
         Returns:
-            int: 成功修复的文件数量
+            List[Optional[int]]: 按顺序对应每个标题块的层级
         """
-        if not os.path.exists(directory_path):
-            print(f"❌ 目录不存在：{directory_path}")
-            return 0
-        
-        fixed_count = 0
-        for root, dirs, files in os.walk(directory_path):
-            for file in files:
-                if file.endswith('.md'):
-                    md_path = os.path.join(root, file)
-                    if self.fix_markdown_file(md_path):
-                        fixed_count += 1
-        
-        return fixed_count
-
-def fix_markdown_after_translation(output_dir: str, api_key: str) -> bool:
-    """在翻译完成后修复Markdown文件的标题层级
-    
-    Args:
-        output_dir: 输出目录路径
-        api_key: DeepSeek API密钥
-        
-    Returns:
-        bool: 修复是否成功
+        headings = [f"{'#' * block.get('level', 1)} {block['content']}"
+                    for block in blocks if block["type"] == "heading"]
+        if not headings:
+            return []
+        return self.resolve_levels(headings, size_hints, max_retries)
+
+
+def apply_heading_levels(blocks: List[Dict], levels: List[Optional[int]]) -> List[Dict]:
+    """按顺序将推断出的层级应用到标题块（None表示保留原层级），返回新的块列表。
+
+    未翻译或翻译失败的块与原文块是同一个对象，会被多个目标语言共用，因此修改层级时复制块，不改动传入的块。
     """
-    try:
-        fixer = MarkdownFixer(api_key)
-        fixed_count = fixer.fix_markdown_in_directory(output_dir)
-        print(f"🔧 共修复了 {fixed_count} 个Markdown文件的标题层级")
-        return True
-    except Exception as e:
-        print(f"❌ 标题修复过程出错: {str(e)}")
-        return False
-
-# 保留原有的兼容代码，但标记为已弃用
-def fix_markdown(article, max_retries: int = 3) -> None:
-    """已弃用：修复单个Markdown文件的标题结构（保持向后兼容）"""
-    print("⚠️ fix_markdown 函数已弃用，请使用 fix_markdown_file")
-    if hasattr(article, 'pdf_parsing_result_path') and article.pdf_parsing_result_path:
-        # 这里需要API密钥，但旧接口没有提供，所以抛出异常
-        raise ValueError("需要API密钥，请使用新的 fix_markdown_file 方法")
-
-if __name__ == "__main__":
-    # 测试代码
-    test_dir = "test_output"
-    test_api_key = "your-api-key-here"
-    
-    if os.path.exists(test_dir):
-        success = fix_markdown_after_translation(test_dir, test_api_key)
-        print(f"修复结果: {'成功' if success else '失败'}")
-    else:
-        print(f"测试目录不存在: {test_dir}")
\ No newline at end of file
+    levels = iter(levels)
+    result = []
+    for block in blocks:
+        if block["type"] == "heading":
+            level = next(levels, None)
+            if level and level != block.get("level"):
+                block = {**block, "level": level}
+        result.append(block)
+    return result
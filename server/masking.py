@@ -0,0 +1,71 @@
+import re
+from typing import Dict, List, Tuple
+
+
+# 占位符格式，数字部分按块内出现顺序编号
+PLACEHOLDER = "[#{}]"
+# 译文中可能被改写的占位符变体（全角括号、多余空格）
+_PLACEHOLDER_VARIANT = re.compile(r'[\[［]\s*#\s*(\d+)\s*[\]］]')
+
+# 需要屏蔽的片段：行内公式、LaTeX引用命令、URL/DOI、数字引用标记
+# 行内公式按pandoc规则：开头$后不是空白，结尾$前不是空白且其后不紧跟数字，避免把 "$5 and $10" 当作公式
+_MASKABLE = re.compile(
+    r'(?<![\$\\])\$(?![\$\s])(?:\\.|[^$\\\n])+?(?<!\s)\$(?![\$\d])'       # $...$
+    r'|\\\((?:.|\n)+?\\\)'                                                # \(...\)
+    r'|\\(?:cite[pt]?|citeauthor|ref|eqref|autoref|[cC]ref|label)\*?'
+    r'(?:\[[^\]]*\])*\{[^}]*\}'                                           # \cite{...}
+    r'|(?:https?://|www\.)[^\s<>()\[\]]+[^\s<>()\[\].,;:]'                # URL
+    r'|\bdoi:\s*10\.\d{4,9}/[^\s]+[^\s.,;:]'                              # doi:10.xxxx/...
+    r'|\[\d{1,3}(?:\s*[,，–—-]\s*\d{1,3})*\]'                             # [12] / [1, 3-5]
+)
+
+
+def mask_text(text: str) -> Tuple[str, Dict[str, str]]:
+    """
+    将公式、URL、引用等无需翻译的片段替换为短占位符。
+
+    相同片段复用同一个占位符；原文中已含占位符样式的文本不做替换。
+
+    :param text: 待翻译的文本
+    :return: (替换后的文本, 占位符到原始片段的映射)
+    """
+    if _PLACEHOLDER_VARIANT.search(text):
+        return text, {}
+
+    mapping: Dict[str, str] = {}
+    reverse: Dict[str, str] = {}
+
+    def replace(match: re.Match) -> str:
+        span = match.group(0)
+        if span not in reverse:
+            placeholder = PLACEHOLDER.format(len(reverse) + 1)
+            reverse[span] = placeholder
+            mapping[placeholder] = span
+        return reverse[span]
+
+    return _MASKABLE.sub(replace, text), mapping
+
+
+def unmask_text(text: str, mapping: Dict[str, str]) -> Tuple[str, List[str]]:
+    """
+    将译文中的占位符还原为原始片段。
+
+    :param text: 模型返回的译文
+    :param mapping: mask_text 返回的映射
+    :return: (还原后的文本, 译文中丢失的占位符列表)
+    """
+    if not mapping:
+        return text, []
+
+    seen = set()
+
+    def restore(match: re.Match) -> str:
+        placeholder = PLACEHOLDER.format(match.group(1))
+        if placeholder not in mapping:
+            return match.group(0)
+        seen.add(placeholder)
+        return mapping[placeholder]
+
+    restored = _PLACEHOLDER_VARIANT.sub(restore, text)
+    missing = [placeholder for placeholder in mapping if placeholder not in seen]
+    return restored, missing
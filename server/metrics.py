@@ -0,0 +1,289 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+# 默认的延迟分桶（秒），覆盖单次API请求的常见范围
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# 任务阶段耗时分桶（秒）
+STAGE_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1200.0, 3600.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """
+    指标基类：按标签值元组保存序列，单个锁保护，记录一次只是一次字典查找和加法。
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: Dict) -> tuple:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def clear(self) -> None:
+        """清空所有序列（用于每次采集时整体刷新的Gauge）"""
+        with self._lock:
+            self._series.clear()
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    @property
+    def sample_name(self) -> str:
+        return self.name
+
+    def render(self) -> List[str]:
+        name = self.sample_name
+        lines = [f"# HELP {name} {self.documentation}", f"# TYPE {name} {self.kind}"]
+        return lines + self.samples()
+
+
+class _ScalarMetric(_Metric):
+    """值为单个数字的指标，无标签时从0开始输出"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        if not self.labelnames:
+            self._series[()] = 0
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._series.get(self._key(labels), 0)
+
+
+class Counter(_ScalarMetric):
+    """只增不减的计数器"""
+
+    kind = "counter"
+
+    @property
+    def sample_name(self) -> str:
+        return f"{self.name}_total"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = list(self._series.items())
+        return [f"{self.sample_name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in series]
+
+
+class Gauge(_ScalarMetric):
+    """可增可减的瞬时值"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        """在上下文内计数加一，退出时减一"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = list(self._series.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in series]
+
+
+class _HistogramSeries:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, buckets: int):
+        self.counts = [0] * buckets
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(_Metric):
+    """分桶直方图，输出累计的 _bucket、_sum、_count"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _HistogramSeries(len(self.buckets))
+            series.counts[index] += 1
+            series.sum += value
+            series.count += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """记录上下文内代码的耗时（秒）"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = [(key, list(s.counts), s.sum, s.count) for key, s in self._series.items()]
+        lines = []
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """进程内的指标注册表"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> None:
+        with self._lock:
+            if any(existing.name == metric.name for existing in self._metrics):
+                raise ValueError(f"指标 {metric.name} 重复注册")
+            self._metrics.append(metric)
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """注册采集前调用的刷新函数，用于更新需要查询数据库等的Gauge"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """以Prometheus文本格式（0.0.4）输出全部指标"""
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics)
+        for collector in collectors:
+            collector()
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ---- 任务与队列 ----
+TASKS = Gauge("dmt_tasks", "各状态的翻译任务数", ["status"])
+TASKS_FINISHED = Counter("dmt_tasks_finished", "结束的翻译任务数（按最终状态）", ["status"])
+TASKS_REJECTED = Counter("dmt_uploads_rejected", "被准入控制拒绝的上传数", ["reason"])
+TASKS_RUNNING = Gauge("dmt_executor_running_tasks", "任务线程池中正在执行的任务数")
+BLOCKS_QUEUED = Gauge("dmt_block_dispatcher_queued", "块调度器中排队的翻译块数")
+STAGE_SECONDS = Histogram("dmt_stage_duration_seconds", "任务各阶段耗时（秒）", ["stage"], buckets=STAGE_BUCKETS)
+PDF_PAGES = Counter("dmt_pdf_pages", "解析的PDF页数（按解析方式 text / ocr）", ["mode"])
+
+# ---- 翻译块 ----
+BLOCKS = Counter("dmt_blocks", "翻译块处理结果", ["outcome"])
+MASKED_TOKENS_SAVED = Counter("dmt_masked_tokens_saved", "占位符屏蔽节省的Token数")
+
+# ---- 图片处理 ----
+IMAGES = Counter("dmt_images", "抽取图片的处理结果（duplicate 去重删除 / recompressed 重新压缩或缩小）", ["outcome"])
+IMAGE_BYTES_SAVED = Counter("dmt_image_bytes_saved", "图片重新压缩节省的字节数")
+
+# ---- API请求 ----
+API_LATENCY = Histogram("dmt_api_request_duration_seconds", "API请求耗时（秒），按调用类型区分",
+                        ["provider", "call"])
+API_REQUESTS = Counter("dmt_api_requests", "API请求数", ["provider", "call", "outcome"])
+API_RETRIES = Counter("dmt_api_retries", "API请求失败后的重试次数", ["provider", "call"])
+API_TOKENS = Counter("dmt_api_tokens", "API用量Token数", ["provider", "kind"])
+VERIFY_FAILURES = Counter("dmt_verify_failures", "完整性校验判定译文不完整的次数", ["provider"])
+ROUTER_TRIPS = Counter("dmt_router_circuit_open", "路由后端熔断次数", ["backend"])
+
+# ---- 标题修复 ----
+HEADINGS = Counter("dmt_headings", "标题层级的确定方式", ["method"])
+
+# API用量字段到 kind 标签的映射
+_TOKEN_FIELDS = {
+    "prompt_tokens": "prompt",
+    "completion_tokens": "completion",
+    "prompt_cache_hit_tokens": "cache_hit",
+    "prompt_cache_miss_tokens": "cache_miss",
+}
+
+
+def record_api_call(provider: str, call: str, seconds: float, usage: Optional[Dict] = None) -> None:
+    """
+    记录一次成功的API请求。
+
+    :param provider: 提供者名称
+    :param call: 调用类型（translate / check / detect_domain / heading_levels）
+    :param seconds: 请求耗时
+    :param usage: 响应中的usage字典（可选）
+    """
+    API_LATENCY.observe(seconds, provider=provider, call=call)
+    API_REQUESTS.inc(provider=provider, call=call, outcome="ok")
+    for field, kind in _TOKEN_FIELDS.items():
+        value = (usage or {}).get(field)
+        if value:
+            API_TOKENS.inc(value, provider=provider, kind=kind)
+
+
+def record_api_error(provider: str, call: str, retrying: bool) -> None:
+    """记录一次失败的API请求，retrying 表示之后还会重试"""
+    API_REQUESTS.inc(provider=provider, call=call, outcome="error")
+    if retrying:
+        API_RETRIES.inc(provider=provider, call=call)
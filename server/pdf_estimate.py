@@ -0,0 +1,62 @@
+import logging
+import re
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+
+# 无法抽取文本时每页的估计Token数（学术论文单页约500~900个Token）
+DEFAULT_TOKENS_PER_PAGE = 700
+# 英文文本平均每个Token约4个字符
+CHARS_PER_TOKEN = 4
+# 估算Token时最多抽样的页数
+SAMPLE_PAGES = 5
+
+_PAGE_OBJECT = re.compile(rb'/Type\s*/Page(?![a-zA-Z])')
+_PAGE_COUNT = re.compile(rb'/Type\s*/Pages\b[^>]*?/Count\s+(\d+)')
+
+
+def _estimate_with_fitz(fitz, pdf_path: str) -> Dict[str, int]:
+    """用PyMuPDF读取页数，并抽样若干页的文本层估算Token数"""
+    with fitz.open(pdf_path) as doc:
+        pages = doc.page_count
+        if pages == 0:
+            return {"pages": 0, "tokens": 0}
+        step = max(1, pages // SAMPLE_PAGES)
+        sampled = list(range(0, pages, step))[:SAMPLE_PAGES]
+        chars = sum(len(doc[i].get_text()) for i in sampled)
+    tokens_per_page = chars / CHARS_PER_TOKEN / len(sampled)
+    # 扫描件没有文本层，按默认密度估算
+    if tokens_per_page < DEFAULT_TOKENS_PER_PAGE / 10:
+        tokens_per_page = DEFAULT_TOKENS_PER_PAGE
+    return {"pages": pages, "tokens": int(tokens_per_page * pages)}
+
+
+def _estimate_from_bytes(pdf_path: str) -> Dict[str, int]:
+    """不依赖PDF库，从页树的Count字段或页对象数量估算页数"""
+    with open(pdf_path, 'rb') as f:
+        data = f.read()
+    counts = [int(count) for count in _PAGE_COUNT.findall(data)]
+    pages = max(counts) if counts else len(_PAGE_OBJECT.findall(data))
+    # 页树位于压缩对象流中时无法直接扫描到，至少按1页计
+    pages = max(pages, 1)
+    return {"pages": pages, "tokens": pages * DEFAULT_TOKENS_PER_PAGE}
+
+
+def estimate_pdf(pdf_path: str) -> Dict[str, int]:
+    """
+    在上传时快速估算PDF的页数和Token量，不做完整的MinerU解析。
+
+    :param pdf_path: PDF文件路径
+    :return: {"pages": 页数, "tokens": 估计Token数}
+    """
+    # PyMuPDF（MinerU的依赖）在首次上传时才导入，不拖慢服务启动
+    try:
+        import fitz
+    except ImportError:
+        return _estimate_from_bytes(pdf_path)
+    try:
+        return _estimate_with_fitz(fitz, pdf_path)
+    except Exception as e:
+        logger.warning("⚠️ PyMuPDF读取失败，改用字节扫描估算: %s", e)
+        return _estimate_from_bytes(pdf_path)
@@ -0,0 +1,122 @@
+import logging
+import unicodedata
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# 解析方式：文本层 / OCR
+TEXT = "text"
+OCR = "ocr"
+OCR_MODES = ("auto", "on", "off")
+
+# 文本层字符数（不含空白）低于该值视为没有文本层
+MIN_TEXT_CHARS = 20
+# 文本层较少时，页面图片覆盖率超过该值视为扫描页
+SCANNED_IMAGE_RATIO = 0.3
+# 图片几乎覆盖整页时，文本层少于该字符数（页眉、页码等）仍视为扫描页
+FULL_PAGE_IMAGE_RATIO = 0.8
+SPARSE_TEXT_CHARS = 200
+# 不可用字符（替换符、私用区、控制字符）占比超过该值视为乱码
+GARBLED_RATIO = 0.2
+
+
+def _garbled_ratio(text: str) -> float:
+    """文本层中无法映射到Unicode的字符占比（字体缺少ToUnicode映射时常见）"""
+    chars = [char for char in text if not char.isspace()]
+    if not chars:
+        return 0.0
+    bad = sum(1 for char in chars if char == "�" or unicodedata.category(char) in ("Co", "Cc", "Cs"))
+    return bad / len(chars)
+
+
+def _image_ratio(page) -> float:
+    """页面中图片覆盖的面积占比（重叠部分重复计算，上限为1）"""
+    rect = page.rect
+    area = rect.width * rect.height
+    if area <= 0:
+        return 0.0
+    covered = 0.0
+    for info in page.get_image_info():
+        bbox = (page.rect & info["bbox"]) if info.get("bbox") else None
+        if bbox is not None and not bbox.is_empty:
+            covered += bbox.width * bbox.height
+    return min(covered / area, 1.0)
+
+
+def classify_page(page) -> Dict:
+    """
+    判断单页是否需要OCR。
+
+    :param page: PyMuPDF的页面对象
+    :return: {"mode": text/ocr, "reason": 判定原因, "chars": 文本层字符数, "images": 图片覆盖率}
+    """
+    text = page.get_text()
+    chars = sum(1 for char in text if not char.isspace())
+    images = _image_ratio(page)
+    if chars >= MIN_TEXT_CHARS and _garbled_ratio(text) > GARBLED_RATIO:
+        mode, reason = OCR, "garbled"
+    elif chars < SPARSE_TEXT_CHARS and images >= FULL_PAGE_IMAGE_RATIO:
+        mode, reason = OCR, "scanned"
+    elif chars < MIN_TEXT_CHARS and images >= SCANNED_IMAGE_RATIO:
+        mode, reason = OCR, "scanned"
+    elif chars < MIN_TEXT_CHARS:
+        # 空白页或只有矢量图的页，OCR也识别不出文字
+        mode, reason = TEXT, "blank"
+    else:
+        mode, reason = TEXT, "text"
+    return {"mode": mode, "reason": reason, "chars": chars, "images": round(images, 2)}
+
+
+def classify_pages(pdf_path: str) -> List[Dict]:
+    """
+    逐页判断解析方式，结果顺序与页码一致。
+
+    :param pdf_path: PDF文件路径
+    :return: 每页的 classify_page 结果
+    """
+    import fitz
+    with fitz.open(pdf_path) as doc:
+        return [classify_page(page) for page in doc]
+
+
+def group_runs(modes: List[str]) -> List[Tuple[int, int, str]]:
+    """
+    将逐页的解析方式合并为连续区间。
+
+    :param modes: 每页的解析方式
+    :return: [(起始页, 结束页（含）, 解析方式)]，页码从0开始
+    """
+    runs = []
+    for index, mode in enumerate(modes):
+        if runs and runs[-1][2] == mode:
+            runs[-1] = (runs[-1][0], index, mode)
+        else:
+            runs.append((index, index, mode))
+    return runs
+
+
+def extract_pages(pdf_path: str, start: int, end: int) -> bytes:
+    """
+    抽取页面区间为新的PDF。
+
+    :param pdf_path: PDF文件路径
+    :param start: 起始页（从0开始）
+    :param end: 结束页（含）
+    :return: 新PDF的字节内容
+    """
+    import fitz
+    with fitz.open(pdf_path) as source, fitz.open() as part:
+        part.insert_pdf(source, from_page=start, to_page=end)
+        return part.tobytes()
+
+
+def format_pages(indexes: List[int]) -> str:
+    """将页码（从0开始）格式化为 1-3,7 形式的页码范围"""
+    ranges = []
+    for index in indexes:
+        if ranges and ranges[-1][1] == index - 1:
+            ranges[-1] = (ranges[-1][0], index)
+        else:
+            ranges.append((index, index))
+    return ",".join(f"{start + 1}" if start == end else f"{start + 1}-{end + 1}" for start, end in ranges)
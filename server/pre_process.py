@@ -1,7 +1,8 @@
 import re
 import tiktoken
 import nltk
-from typing import List, Dict, Union
+from typing import List, Dict, Optional, Tuple, Union
+import profiling
 
 
 # # # 下载NLTK的punkt资源（用于句子分割）
@@ -9,10 +10,146 @@ from typing import List, Dict, Union
 # nltk.download('punkt_tab')
 
 
+# 预编译的行级匹配规则
+_HEADING = re.compile(r'^(#+)\s+(.*)')
+_IMAGE = re.compile(r'!\[(.*?)\]\((.*?)\)')
+_FENCE = re.compile(r'^\s*(`{3,}|~{3,})')
+_FORMULA_OPEN = re.compile(r'^\s*(\$\$|\\\[)')
+_HTML_OPEN = re.compile(r'^\s*<(html|table|div)\b', re.IGNORECASE)
+_TABLE_ROW = re.compile(r'^\s*\|.*\|\s*$')
+# GFM 对齐单元格只要求至少一个短横线，如 |-|:-:|
+_TABLE_ALIGN = re.compile(r'^\s*:?-+:?\s*$')
+_CELL_SPLIT = re.compile(r'(?<!\\)\|')
+_INLINE_MATH = re.compile(r'\$[^$]*\$')
+_CELL_TEXT = re.compile(r'[^\W\d_]{2,}|[\u4e00-\u9fff\u3040-\u30ff\uac00-\ud7af]')
+# 参考文献章节标题，可带编号和结尾冒号：References / 7 References / VII. REFERENCES / References:
+_REFERENCE_HEADING = re.compile(
+    r'^(?:(?:\d+|[IVX]+)\.?\s*)?(?:references?|bibliography|literature\s+cited|works\s+cited|参考文献|引用文献)'
+    r'\s*[:：.]?$',
+    re.IGNORECASE
+)
+# 参考文献条目：[12] Author... / 12. Author, ... 且包含年份
+_REFERENCE_ENTRY = re.compile(r'^(?:\[\d{1,3}\]|\d{1,3}\.)\s*\S')
+_REFERENCE_YEAR = re.compile(r'\b(?:19|20)\d{2}[a-z]?\b')
+# 条目还需带有作者（Smith, J. / J. Smith / et al.）或出处（Proc. / Journal / arXiv / vol. / pp.）特征
+_REFERENCE_AUTHOR = re.compile(r"\b[A-Z][A-Za-z'\-]+,\s*(?:[A-Z]\.\s*)+|\b(?:[A-Z]\.\s*)+[A-Z][a-z]+|\bet\s+al\.")
+_REFERENCE_VENUE = re.compile(
+    r'\b(?:proc(?:eedings)?|journal|conference|symposium|workshop|transactions|arxiv|preprint|ieee|acm|springer|'
+    r'elsevier|doi)\b|\b(?:vol|pp|trans|in)[.:]',
+    re.IGNORECASE
+)
+# 段落中条目行占比超过该值时视为参考文献列表
+_REFERENCE_LINE_RATIO = 0.6
+
+# 需要送往翻译API的块类型，其余类型（公式、代码、图片）原样保留
+TRANSLATABLE_TYPES = {"heading", "paragraph", "table", "html"}
+
+
+def is_translatable(block: Dict[str, Union[str, int]]) -> bool:
+    """
+    判断块是否需要翻译。
+
+    :param block: 单个文本块
+    :return: 是否需要调用翻译API
+    """
+    return block.get("type") in TRANSLATABLE_TYPES
+
+
+def parse_pipe_table(content: str) -> Tuple[List[List[str]], Optional[int]]:
+    """
+    将管道符表格拆分为单元格。
+
+    :param content: 表格原文
+    :return: (按行排列的单元格列表, 对齐行的行号，不存在时为None)
+    """
+    rows = []
+    align_row = None
+    for line in content.split('\n'):
+        line = line.strip()
+        if line.startswith('|'):
+            line = line[1:]
+        if line.endswith('|') and not line.endswith('\\|'):
+            line = line[:-1]
+        cells = [cell.strip() for cell in _CELL_SPLIT.split(line)]
+        if align_row is None and cells and all(_TABLE_ALIGN.match(cell) for cell in cells):
+            align_row = len(rows)
+        rows.append(cells)
+    return rows, align_row
+
+
+def is_text_cell(cell: str) -> bool:
+    """
+    判断单元格是否含有需要翻译的文字（纯数字、符号、公式单元格不翻译）。
+
+    :param cell: 单元格文本
+    :return: 是否需要翻译
+    """
+    return bool(_CELL_TEXT.search(_INLINE_MATH.sub('', cell)))
+
+
+def _looks_like_reference_list(content: str) -> bool:
+    """
+    判断段落是否为参考文献条目列表（至少两行、且编号开头并带年份和作者/出处特征的行占多数）。
+    """
+    lines = [line for line in content.split('\n') if line.strip()]
+    if not lines:
+        return False
+    entries = sum(1 for line in lines
+                  if _REFERENCE_ENTRY.match(line) and _REFERENCE_YEAR.search(line)
+                  and (_REFERENCE_AUTHOR.search(line) or _REFERENCE_VENUE.search(line)))
+    return entries >= 2 and entries / len(lines) >= _REFERENCE_LINE_RATIO
+
+
+def classify_sections(blocks: List[Dict[str, Union[str, int]]]) -> int:
+    """
+    标记参考文献部分的块（section="references"），这些块原样输出、不送往翻译API。
+
+    参考文献标题之后到下一个标题之前的块都会被标记；参考文献标题之后的其他章节（如附录）
+    以及最后一个标题之后的段落，只有形如参考文献条目列表时才标记，正文中带年份的编号列表不受影响。
+    参考文献标题本身仍正常翻译。
+
+    :param blocks: markdown_parser 生成的块列表
+    :return: 被标记的块数量
+    """
+    last_heading = max((idx for idx, block in enumerate(blocks) if block["type"] == "heading"), default=-1)
+    in_references = False
+    after_references = False
+    marked = 0
+    for idx, block in enumerate(blocks):
+        if block["type"] == "heading":
+            in_references = bool(_REFERENCE_HEADING.match(block["content"].strip().strip('*').strip()))
+            after_references = after_references or in_references
+            continue
+        if not is_translatable(block):
+            continue
+        if not in_references:
+            if block["type"] != "paragraph" or not (after_references or idx > last_heading):
+                continue
+            if not _looks_like_reference_list(block["content"]):
+                continue
+        block["section"] = "references"
+        marked += 1
+    return marked
+
+
+def _collect_until(lines: List[str], start: int, closed) -> Optional[int]:
+    """
+    从start行开始向后查找，返回首个满足closed条件的行号；找不到时返回None，
+    由调用方把起始行当作普通段落，避免未闭合的分隔符吞掉文档剩余部分。
+    """
+    for idx in range(start, len(lines)):
+        if closed(lines[idx]):
+            return idx
+    return None
+
+
 def markdown_parser(text: str) -> List[Dict[str, Union[str, int]]]:
     """
     解析Markdown文本，生成AST树，并保留换行符号。
 
+    单遍扫描识别标题、图片、行间公式、管道符表格、代码块和HTML块，
+    公式与代码块保留原文，不送往翻译API。
+
     :param text: 原始Markdown文本
     :return: 带层级结构的AST树
     """
@@ -20,47 +157,115 @@ def markdown_parser(text: str) -> List[Dict[str, Union[str, int]]]:
     lines = text.split('\n')
     paragraph_buffer = []
 
-    for line in lines:
-        if line.strip() == "":
+    def flush_paragraph():
+        # 如果段落缓冲区有内容，先将其作为一个段落block添加到AST中
+        if paragraph_buffer:
+            ast.append({"type": "paragraph", "content": "".join(paragraph_buffer)})
+            paragraph_buffer.clear()
+
+    idx = 0
+    while idx < len(lines):
+        line = lines[idx]
+        stripped = line.strip()
+        if stripped == "":
+            idx += 1
+            continue
+
+        # 识别代码块
+        fence_match = _FENCE.match(line)
+        if fence_match:
+            fence = fence_match.group(1)
+            end = _collect_until(lines, idx + 1, lambda l: l.strip().startswith(fence))
+            if end is not None:
+                flush_paragraph()
+                ast.append({"type": "code", "content": "\n".join(lines[idx:end + 1])})
+                idx = end + 1
+                continue
+
+        # 识别行间公式（$$...$$ 或 \[...\]）
+        formula_match = _FORMULA_OPEN.match(line)
+        if formula_match:
+            opening = formula_match.group(1)
+            closing = "$$" if opening == "$$" else "\\]"
+            rest = stripped[len(opening):]
+            if closing in rest:
+                end = idx
+                head, last = [], stripped
+                close_at = len(opening) + rest.index(closing)
+            else:
+                end = _collect_until(lines, idx + 1, lambda l: closing in l)
+                if end is not None:
+                    head, last = [l.strip() for l in lines[idx:end]], lines[end].strip()
+                    close_at = last.index(closing)
+            if end is not None:
+                flush_paragraph()
+                close_at += len(closing)
+                ast.append({"type": "formula", "content": "\n".join(head + [last[:close_at]])})
+                # 闭合符之后的文字（如 "$$x$$ where x is ..."）作为段落继续翻译
+                trailing = last[close_at:].strip()
+                if trailing:
+                    paragraph_buffer.append(trailing)
+                    paragraph_buffer.append("\n")
+                idx = end + 1
+                continue
+
+        # 识别HTML块（MinerU输出的表格）
+        html_match = _HTML_OPEN.match(line)
+        if html_match:
+            closing = f"</{html_match.group(1).lower()}>"
+            end = _collect_until(lines, idx, lambda l: closing in l.lower())
+            if end is not None:
+                flush_paragraph()
+                ast.append({"type": "html", "content": "\n".join(lines[idx:end + 1]).strip()})
+                idx = end + 1
+                continue
+
+        # 识别管道符表格
+        if _TABLE_ROW.match(line):
+            flush_paragraph()
+            end = idx
+            while end + 1 < len(lines) and _TABLE_ROW.match(lines[end + 1]):
+                end += 1
+            content = "\n".join(l.strip() for l in lines[idx:end + 1])
+            rows, align_row = parse_pipe_table(content)
+            ast.append({"type": "table", "content": content, "rows": rows, "align_row": align_row})
+            idx = end + 1
             continue
 
         # 识别标题
-        heading_match = re.match(r'^(#+)\s+(.*)', line)
+        heading_match = _HEADING.match(line)
         if heading_match:
-            # 如果段落缓冲区有内容，先将其作为一个段落block添加到AST中
-            if paragraph_buffer:
-                ast.append({"type": "paragraph", "content": "".join(paragraph_buffer)})
-                paragraph_buffer = []
+            flush_paragraph()
             # 添加标题block，并在内容后添加换行符
             level = len(heading_match.group(1))
             content = heading_match.group(2)
             ast.append({"type": "heading", "level": level, "content": content})
+            idx += 1
             continue
 
         # 识别图片
-        image_match = re.match(r'!\[(.*?)\]\((.*?)\)', line)
+        image_match = _IMAGE.match(line)
         if image_match:
-            # 如果段落缓冲区有内容，先将其作为一个段落block添加到AST中
-            if paragraph_buffer:
-                ast.append({"type": "paragraph", "content": "".join(paragraph_buffer)})
-                paragraph_buffer = []
+            flush_paragraph()
             # 添加图片block，并在内容后添加换行符
             alt_text = image_match.group(1)
             path = image_match.group(2)
             ast.append({"type": "image", "alt": alt_text, "path": path})
+            idx += 1
             continue
 
-        # 如果不是标题或图片，则将其视为段落的一部分
-        paragraph_buffer.append(line.strip())
+        # 如果不是以上类型，则将其视为段落的一部分
+        paragraph_buffer.append(stripped)
         paragraph_buffer.append("\n")
+        idx += 1
 
     # 处理最后可能剩余的段落
-    if paragraph_buffer:
-        ast.append({"type": "paragraph", "content": "".join(paragraph_buffer) })
+    flush_paragraph()
 
     return ast
 
 
+@profiling.profiled("dynamic_splitter")
 def dynamic_splitter(block: Dict[str, Union[str, int]], max_tokens: int = 8192) -> List[Dict[str, Union[str, int]]]:
     """
     动态拆分文本块，确保每个子块的Token数不超过最大限制。
@@ -70,7 +275,8 @@ def dynamic_splitter(block: Dict[str, Union[str, int]], max_tokens: int = 8192)
     :return: 拆分后的子块列表
     """
     content = block.get("content", "")
-    if not content:
+    # 空块、不翻译的块（公式、代码等）和按单元格翻译的表格不做拆分，避免破坏结构
+    if not content or not is_translatable(block) or "rows" in block:
         return [block]
     # 初始化tiktoken编码器
     encoder = tiktoken.get_encoding("cl100k_base")
@@ -79,10 +285,13 @@ def dynamic_splitter(block: Dict[str, Union[str, int]], max_tokens: int = 8192)
     if len(tokens) <= max_tokens:
         return [block]
 
+    # 子块继承类型、章节等元信息
+    meta = {key: value for key, value in block.items() if key not in ("content", "identifier")}
+
     # 按换行符拆分
     paragraphs = content.split('\n')
     sub_blocks = []
-    current_block = {"type": block["type"], "content": ""}
+    current_block = {**meta, "content": ""}
     current_tokens = 0
 
     for paragraph in paragraphs:
@@ -92,7 +301,7 @@ def dynamic_splitter(block: Dict[str, Union[str, int]], max_tokens: int = 8192)
         if current_tokens + len(paragraph_tokens) > max_tokens:
             if current_block["content"]:
                 sub_blocks.append(current_block)
-            current_block = {"type": block["type"], "content": paragraph}
+            current_block = {**meta, "content": paragraph}
             current_tokens = len(paragraph_tokens)
         else:
             current_block["content"] += '\n' + paragraph if current_block["content"] else paragraph
@@ -105,7 +314,7 @@ def dynamic_splitter(block: Dict[str, Union[str, int]], max_tokens: int = 8192)
     if len(sub_blocks) == 1 and len(encoder.encode(sub_blocks[0]["content"])) > max_tokens:
         sentences = nltk.sent_tokenize(sub_blocks[0]["content"])
         sub_blocks = []
-        current_block = {"type": block["type"], "content": ""}
+        current_block = {**meta, "content": ""}
         current_tokens = 0
 
         for sentence in sentences:
@@ -114,7 +323,7 @@ def dynamic_splitter(block: Dict[str, Union[str, int]], max_tokens: int = 8192)
             if current_tokens + len(sentence_tokens) > max_tokens:
                 if current_block["content"]:
                     sub_blocks.append(current_block)
-                current_block = {"type": block["type"], "content": sentence}
+                current_block = {**meta, "content": sentence}
                 current_tokens = len(sentence_tokens)
             else:
                 current_block["content"] += ' ' + sentence if current_block["content"] else sentence
@@ -0,0 +1,219 @@
+import cProfile
+import contextvars
+import functools
+import io
+import itertools
+import logging
+import os
+import pstats
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# 整个任务（process_task所在线程）的分析目标名
+TASK = "task"
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+# 文本摘要中输出的函数/分配位置条数
+TOP_ENTRIES = 40
+
+_session_var: contextvars.ContextVar = contextvars.ContextVar("profile_session", default=None)
+_settings: Optional[Dict] = None
+_task_counter = itertools.count()
+_counter_lock = threading.Lock()
+# tracemalloc 是进程级的，多个任务同时采样时按引用计数启停
+_memory_lock = threading.Lock()
+_memory_users = 0
+
+
+def configure(targets: Optional[Iterable[str]] = None, sample_rate: Optional[int] = None,
+              memory: Optional[bool] = None, directory: Optional[str] = None) -> None:
+    """
+    配置任务性能分析，未指定的参数从环境变量读取：
+
+    - PROFILE_TARGETS：逗号分隔的分析目标，task 表示整个任务线程，
+      其余为阶段名（pdf_to_markdown、dynamic_splitter、structure_rebuilder）；为空时关闭
+    - PROFILE_SAMPLE_RATE：每 N 个任务分析 1 个，默认 10
+    - PROFILE_MEMORY：为1时用 tracemalloc 记录任务期间的内存分配，默认关闭
+    - PROFILE_DIR：输出目录，每个任务一个子目录，默认 server/profiles
+
+    cProfile 只分析调用它的线程：task 覆盖任务线程（解析、切分、重建），块翻译请求在块调度器线程中执行，
+    其耗时见任务时间线。同时指定 task 和阶段时，任务线程中的阶段已包含在 task 结果中，不再单独输出。
+    """
+    global _settings
+    if targets is None:
+        targets = os.getenv("PROFILE_TARGETS", "").split(",")
+    targets = {target.strip() for target in targets if target.strip()}
+    if sample_rate is None:
+        sample_rate = int(os.getenv("PROFILE_SAMPLE_RATE", "10"))
+    if memory is None:
+        memory = os.getenv("PROFILE_MEMORY", "0").lower() in ("1", "true", "yes")
+    _settings = {
+        "targets": targets,
+        "sample_rate": max(sample_rate, 1),
+        "memory": memory,
+        "directory": directory or os.getenv("PROFILE_DIR") or DEFAULT_DIR,
+    } if targets else None
+    if _settings:
+        logger.info("🔬 性能分析已开启：%s，每 %d 个任务采样1个%s", ",".join(sorted(targets)),
+                    _settings["sample_rate"], "，含内存分配" if memory else "")
+
+
+def _sampled() -> bool:
+    with _counter_lock:
+        return next(_task_counter) % _settings["sample_rate"] == 0
+
+
+class _Session:
+    """
+    单个被采样任务的分析会话。同一阶段的多次调用累计到一个分析器中，任务结束时统一写出。
+    """
+
+    def __init__(self, task_id: str, settings: Dict):
+        self.task_id = task_id
+        self.targets = settings["targets"]
+        self.memory = settings["memory"]
+        self.directory = os.path.join(settings["directory"], str(task_id))
+        self._profilers: Dict[str, cProfile.Profile] = {}
+        self._calls: Dict[str, int] = {}
+        self._busy = set()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def profile(self, name: str):
+        """
+        在当前线程内用 cProfile 分析上下文中的代码。
+
+        同一线程已在分析其他目标（嵌套阶段）或该目标正被其他线程分析时，本次调用不分析。
+        """
+        with self._lock:
+            skip = getattr(self._local, "active", False) or name in self._busy
+            if not skip:
+                self._busy.add(name)
+                profiler = self._profilers.setdefault(name, cProfile.Profile())
+                self._calls[name] = self._calls.get(name, 0) + 1
+        if skip:
+            yield
+            return
+        self._local.active = True
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # 其他分析工具已在运行（如调试器）
+            logger.warning("⚠️ 无法启动性能分析 %s: %s", name, e)
+            self._local.active = False
+            with self._lock:
+                self._busy.discard(name)
+            yield
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+            self._local.active = False
+            with self._lock:
+                self._busy.discard(name)
+
+    def dump(self, memory_before: Optional[tracemalloc.Snapshot]) -> None:
+        """写出各目标的 .prof（可用 snakeviz 等工具打开）和按累计耗时排序的文本摘要"""
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            profilers = dict(self._profilers)
+            calls = dict(self._calls)
+        for name, profiler in profilers.items():
+            profiler.dump_stats(os.path.join(self.directory, f"{name}.prof"))
+            buffer = io.StringIO()
+            buffer.write(f"# {name}：调用 {calls[name]} 次\n")
+            pstats.Stats(profiler, stream=buffer).sort_stats("cumulative").print_stats(TOP_ENTRIES)
+            with open(os.path.join(self.directory, f"{name}.txt"), "w", encoding="utf-8") as f:
+                f.write(buffer.getvalue())
+        if memory_before is not None:
+            self._dump_memory(memory_before)
+        logger.info("🔬 性能分析结果已写入 %s", self.directory)
+
+    def _dump_memory(self, before: tracemalloc.Snapshot) -> None:
+        after = _filtered_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"# 当前 {current / 1024 / 1024:.1f} MiB，峰值 {peak / 1024 / 1024:.1f} MiB（进程级，含同时运行的任务）",
+                 "# 任务期间增长最多的分配位置："]
+        lines.extend(str(stat) for stat in after.compare_to(before, "lineno")[:TOP_ENTRIES])
+        with open(os.path.join(self.directory, "memory.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def _filtered_snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+
+
+def _start_memory() -> tracemalloc.Snapshot:
+    global _memory_users
+    with _memory_lock:
+        if _memory_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _memory_users += 1
+    return _filtered_snapshot()
+
+
+def _stop_memory() -> None:
+    global _memory_users
+    with _memory_lock:
+        _memory_users -= 1
+        if _memory_users == 0:
+            tracemalloc.stop()
+
+
+@contextmanager
+def task_session(task_id: str):
+    """
+    按采样率决定是否分析该任务；被采样时在上下文内（包括随上下文传递的工作线程）启用各分析目标，
+    结束时把结果写入 PROFILE_DIR/<任务ID>/。
+
+    :param task_id: 任务ID，作为输出子目录名
+    """
+    settings = _settings
+    if settings is None or not _sampled():
+        yield None
+        return
+    session = _Session(task_id, settings)
+    memory_before = _start_memory() if session.memory else None
+    token = _session_var.set(session)
+    try:
+        if TASK in session.targets:
+            with session.profile(TASK):
+                yield session
+        else:
+            yield session
+    finally:
+        _session_var.reset(token)
+        try:
+            session.dump(memory_before)
+        except Exception as e:
+            logger.warning("⚠️ 性能分析结果写入失败: %s", e)
+        finally:
+            if memory_before is not None:
+                _stop_memory()
+
+
+def profiled(name: str) -> Callable:
+    """
+    阶段分析装饰器：当前任务被采样且 name 在分析目标中时，用 cProfile 分析该函数；
+    否则只多一次上下文变量读取。
+    """
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            session = _session_var.get()
+            if session is None or name not in session.targets:
+                return fn(*args, **kwargs)
+            with session.profile(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
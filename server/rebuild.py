@@ -1,7 +1,29 @@
 import re
 from typing import List, Dict
+import profiling
 
 
+def _space_cjk(text: str) -> str:
+    """统一中英文间距"""
+    text = re.sub(r'([\u4e00-\u9fff])([a-zA-Z])', r'\1 \2', text)
+    return re.sub(r'([a-zA-Z])([\u4e00-\u9fff])', r'\1 \2', text)
+
+
+def render_pipe_table(rows: List[List[str]]) -> str:
+    """
+    由单元格重建管道符表格，单元格内的管道符会被转义。
+
+    :param rows: 按行排列的单元格列表
+    :return: 表格Markdown文本
+    """
+    lines = []
+    for cells in rows:
+        escaped = [re.sub(r'(?<!\\)\|', r'\\|', cell.replace('\n', ' ')) for cell in cells]
+        lines.append("| " + " | ".join(escaped) + " |")
+    return "\n".join(lines)
+
+
+@profiling.profiled("structure_rebuilder")
 def structure_rebuilder(blocks: List[Dict]) -> str:
     """
     重建Markdown文本结构。
@@ -14,11 +36,19 @@ def structure_rebuilder(blocks: List[Dict]) -> str:
         if block["type"] == "heading":
             # 标题添加换行符
             level = block.get("level", 1)
-            content = block["content"]
+            content = _space_cjk(block["content"])
             md_text.append(f"{'#' * level} {content}\n")
         elif block["type"] == "paragraph":
             # 段落直接拼接
-            md_text.append(f"{block['content']}\n")
+            md_text.append(f"{_space_cjk(block['content'])}\n")
+        elif block["type"] == "table" and block.get("rows"):
+            md_text.append(f"\n{_space_cjk(render_pipe_table(block['rows']))}\n\n")
+        elif block["type"] in ("table", "html"):
+            # 表格前后保留空行，避免与相邻段落粘连
+            md_text.append(f"\n{_space_cjk(block['content'])}\n\n")
+        elif block["type"] in ("formula", "code"):
+            # 公式与代码块原样输出
+            md_text.append(f"\n{block['content']}\n\n")
         elif block["type"] == "image":
             # 图片路径UTF-8编码验证
             alt = block.get("alt", "")
@@ -31,9 +61,6 @@ def structure_rebuilder(blocks: List[Dict]) -> str:
 
     # 格式美化
     md_text = "".join(md_text)
-    # 统一中英文间距
-    md_text = re.sub(r'([\u4e00-\u9fff])([a-zA-Z])', r'\1 \2', md_text)
-    md_text = re.sub(r'([a-zA-Z])([\u4e00-\u9fff])', r'\1 \2', md_text)
     # 删除多余空行
     md_text = re.sub(r'\n{3,}', '\n\n', md_text)
 
@@ -0,0 +1,233 @@
+import contextvars
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, List, Optional, Sequence
+
+
+def _created_order(task):
+    return task.created_at is None, task.created_at
+
+
+def fair_order(pending: Sequence, running: Dict[Hashable, int], priority: Optional[Callable] = None) -> List:
+    """
+    按用户公平份额排列待处理任务。
+
+    每个用户的任务按priority排序，第k个任务的轮次为 已运行任务数 + k，轮次小的优先；
+    同一轮次内再按priority排序。任务对象需提供 user_id 和 created_at 属性。
+
+    :param pending: 待处理任务列表
+    :param running: 用户ID到正在执行任务数的映射
+    :param priority: 任务的排序键，越小越优先，默认按创建时间先后
+    :return: 排序后的任务列表
+    """
+    priority = priority or _created_order
+    by_user: Dict[Hashable, List] = {}
+    for task in pending:
+        by_user.setdefault(task.user_id, []).append((priority(task), task))
+
+    ranked = []
+    for user_id, tasks in by_user.items():
+        tasks.sort(key=lambda item: item[0])
+        for k, (key, task) in enumerate(tasks):
+            ranked.append(((running.get(user_id, 0) + k, key), task))
+    ranked.sort(key=lambda item: item[0])
+    return [task for _, task in ranked]
+
+
+def pick_next(pending: Sequence, running: Dict[Hashable, int], max_per_user: int,
+              priority: Optional[Callable] = None) -> Optional[object]:
+    """
+    选出下一个应执行的任务，跳过已达到并发上限的用户。
+
+    :param pending: 待处理任务列表
+    :param running: 用户ID到正在执行任务数的映射
+    :param max_per_user: 单个用户的最大并发任务数
+    :param priority: 任务的排序键，见 fair_order
+    :return: 任务对象，没有可执行任务时返回None
+    """
+    for task in fair_order(pending, running, priority):
+        if running.get(task.user_id, 0) < max_per_user:
+            return task
+    return None
+
+
+def queue_position(task_id, pending: Sequence, running: Dict[Hashable, int],
+                   priority: Optional[Callable] = None) -> Optional[int]:
+    """
+    计算任务在公平队列中的位置（从1开始），任务不在队列中时返回None
+    """
+    for position, task in enumerate(fair_order(pending, running, priority), start=1):
+        if task.id == task_id:
+            return position
+    return None
+
+
+def response_ratio_priority(estimate: Callable, waited: Callable) -> Callable:
+    """
+    最高响应比优先（短作业优先 + 老化）：响应比 = (等待时间 + 预计耗时) / 预计耗时。
+
+    短任务优先执行，长任务的响应比随等待时间增长，不会被无限推迟。
+    :param estimate: 任务到预计耗时（秒）的函数
+    :param waited: 任务到已等待秒数的函数
+    :return: 供 fair_order 使用的排序键函数
+    """
+    def key(task):
+        cost = max(estimate(task), 1.0)
+        return -(waited(task) + cost) / cost, _created_order(task)
+    return key
+
+
+class ThroughputTracker:
+    """
+    记录最近的实际吞吐量（解析 页/秒，翻译 Token/秒），用于预计任务耗时。
+    """
+
+    def __init__(self, parse_rate: float = 0.5, translate_rate: float = 100.0, alpha: float = 0.3):
+        self.parse_rate = parse_rate
+        self.translate_rate = translate_rate
+        self.alpha = alpha
+        self._lock = threading.Lock()
+
+    def _update(self, current: float, amount: float, seconds: float) -> float:
+        if amount <= 0 or seconds <= 0:
+            return current
+        return current + self.alpha * (amount / seconds - current)
+
+    def record_parse(self, pages: int, seconds: float) -> None:
+        with self._lock:
+            self.parse_rate = self._update(self.parse_rate, pages, seconds)
+
+    def record_translate(self, tokens: int, seconds: float) -> None:
+        with self._lock:
+            self.translate_rate = self._update(self.translate_rate, tokens, seconds)
+
+    def estimate_seconds(self, pages: Optional[int], tokens: Optional[int]) -> float:
+        """
+        预计任务总耗时。
+
+        :param pages: 页数
+        :param tokens: 需要翻译的Token总量（多目标语言时为各语言之和）
+        :return: 预计秒数
+        """
+        with self._lock:
+            return (pages or 0) / self.parse_rate + (tokens or 0) / self.translate_rate
+
+
+class DrainRate:
+    """
+    统计最近一段时间内任务的完成速率（任务/秒），用于计算过载时的 Retry-After。
+    """
+
+    def __init__(self, window: float = 900.0):
+        self.window = window
+        self._started = time.monotonic()
+        self._finished: deque = deque()
+        self._lock = threading.Lock()
+
+    def record(self) -> None:
+        """记录一个任务结束（成功、失败或取消都会释放执行槽位）"""
+        with self._lock:
+            self._finished.append(time.monotonic())
+
+    def rate(self) -> Optional[float]:
+        """最近窗口内的完成速率，尚无完成记录时返回None"""
+        now = time.monotonic()
+        with self._lock:
+            while self._finished and now - self._finished[0] > self.window:
+                self._finished.popleft()
+            if not self._finished:
+                return None
+            return len(self._finished) / min(self.window, max(now - self._started, 1.0))
+
+    def retry_after(self, excess: int, fallback_seconds: float, minimum: int = 5, maximum: int = 3600) -> int:
+        """
+        预计腾出 excess 个排队位置所需的秒数。
+
+        :param excess: 需要完成的任务数
+        :param fallback_seconds: 没有完成记录时使用的估计值
+        :return: Retry-After 秒数
+        """
+        rate = self.rate()
+        seconds = excess / rate if rate else fallback_seconds
+        return int(min(max(seconds, minimum), maximum))
+
+
+class BlockDispatcher:
+    """
+    块级轮询调度器：所有任务的翻译块共享一组工作线程，
+    按所有者（用户）轮流取块执行，大文档无法独占工作线程。
+    """
+
+    def __init__(self, workers: int = 8):
+        self.workers = workers
+        self._queues: "OrderedDict[Hashable, deque]" = OrderedDict()
+        self._condition = threading.Condition()
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"block-dispatcher-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, owner: Hashable, fn: Callable, *args, **kwargs) -> Future:
+        """
+        提交一个块任务。
+
+        :param owner: 所有者标识，同一所有者的块按提交顺序执行
+        :param fn: 执行函数，在提交时的上下文（任务ID等）中执行
+        :return: 结果Future，可在开始执行前取消
+        """
+        future = Future()
+        context = contextvars.copy_context()
+        with self._condition:
+            self._queues.setdefault(owner, deque()).append((future, context, fn, args, kwargs))
+            self._condition.notify()
+        return future
+
+    def _next(self):
+        """轮流从各所有者队列取出一个块，取出后该所有者移到队尾"""
+        with self._condition:
+            while not self._queues:
+                self._condition.wait()
+            owner, queue = next(iter(self._queues.items()))
+            item = queue.popleft()
+            self._queues.pop(owner)
+            if queue:
+                self._queues[owner] = queue
+            return item
+
+    def _worker(self) -> None:
+        while True:
+            future, context, fn, args, kwargs = self._next()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(context.run(fn, *args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def pending(self) -> Dict[Hashable, int]:
+        """各所有者排队中的块数"""
+        with self._condition:
+            return {owner: len(queue) for owner, queue in self._queues.items()}
+
+
+_dispatcher: Optional[BlockDispatcher] = None
+_dispatcher_lock = threading.Lock()
+DEFAULT_BLOCK_WORKERS = 8
+
+
+def configure_block_dispatcher(workers: int) -> None:
+    """设置块调度器的工作线程数，需在首次使用前调用"""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = BlockDispatcher(workers)
+
+
+def get_block_dispatcher() -> BlockDispatcher:
+    """获取进程内共享的块调度器"""
+    configure_block_dispatcher(DEFAULT_BLOCK_WORKERS)
+    return _dispatcher
@@ -0,0 +1,96 @@
+"""
+后端启动耗时基准：在独立进程中多次测量
+
+- import app：Web层导入耗时（不应包含翻译流水线）
+- 首个 /api/health 响应耗时（从进程内开始导入算起）
+- load_pipeline：翻译流水线加载耗时（即预热线程的工作量）
+
+用法: python startup_benchmark.py [--runs 5] [--skip-pipeline] [--importtime]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+# Web层启动时不应导入的重量级模块
+HEAVY_MODULES = ("magic_pdf", "fitz", "tiktoken", "nltk", "openai", "httpx", "langchain_core",
+                 "langchain_deepseek", "en_pdf_to_zh_markdown", "translate")
+
+_MEASURE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter() - start
+response = app.app.test_client().get('/api/health')
+first_response = time.perf_counter() - start
+result = {"import": imported, "health": first_response, "status": response.status_code,
+          "heavy": [name for name in HEAVY if name in sys.modules]}
+if PIPELINE:
+    start = time.perf_counter()
+    try:
+        app.load_pipeline()
+        result["pipeline"] = time.perf_counter() - start
+    except Exception as e:
+        result["pipeline_error"] = str(e)
+print(json.dumps(result))
+"""
+
+
+def _run_once(pipeline: bool) -> dict:
+    code = f"HEAVY = {HEAVY_MODULES!r}\nPIPELINE = {pipeline!r}\n" + _MEASURE
+    env = {**os.environ, "LOG_LEVEL": "ERROR"}
+    output = subprocess.run([sys.executable, "-c", code], cwd=SERVER_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _summary(label: str, values: list) -> None:
+    if not values:
+        return
+    print(f"{label:<22} 最小 {min(values):.3f}s  中位数 {statistics.median(values):.3f}s  最大 {max(values):.3f}s")
+
+
+def _importtime(top: int = 15) -> None:
+    """输出 import app 中累计耗时最长的模块（-X importtime）"""
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=SERVER_DIR,
+                            env={**os.environ, "LOG_LEVEL": "ERROR"}, capture_output=True, text=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative_us, name = line.split(":", 1)[1].split("|")
+        if cumulative_us.strip().isdigit():
+            rows.append((int(cumulative_us), name.strip()))
+    print(f"\nimport app 累计耗时最长的 {top} 个模块：")
+    for cumulative_us, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:>10.1f} ms  {name}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="测量后端启动与流水线加载耗时")
+    parser.add_argument("--runs", type=int, default=5, help="测量次数")
+    parser.add_argument("--skip-pipeline", action="store_true", help="不测量翻译流水线加载")
+    parser.add_argument("--importtime", action="store_true", help="输出导入耗时最长的模块")
+    args = parser.parse_args()
+
+    results = [_run_once(not args.skip_pipeline) for _ in range(args.runs)]
+    _summary("import app", [result["import"] for result in results])
+    _summary("首个 /api/health", [result["health"] for result in results])
+    _summary("load_pipeline", [result["pipeline"] for result in results if "pipeline" in result])
+    errors = {result["pipeline_error"] for result in results if "pipeline_error" in result}
+    for error in errors:
+        print(f"⚠️ 流水线加载失败: {error}")
+    heavy = sorted({name for result in results for name in result["heavy"]})
+    if heavy:
+        print(f"⚠️ Web层启动时导入了重量级模块: {', '.join(heavy)}")
+    else:
+        print("✅ Web层启动未导入翻译流水线")
+    if args.importtime:
+        _importtime()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import threading
+from typing import Optional
+
+
+class TaskCancelled(Exception):
+    """任务已被用户取消"""
+
+
+class CancelToken:
+    """
+    协作式取消标记，由API线程设置，工作线程在阶段边界和请求等待期间检查。
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        """请求取消任务"""
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def wait(self, timeout: float) -> bool:
+        """可被取消打断的等待，返回是否已被取消"""
+        return self._event.wait(timeout)
+
+
+def check_cancelled(token: Optional[CancelToken]) -> None:
+    """
+    若任务已被取消则抛出 TaskCancelled。
+
+    :param token: 取消标记，为None时不做检查
+    """
+    if token is not None and token.cancelled:
+        raise TaskCancelled()
+
+
+def sleep(seconds: float, token: Optional[CancelToken] = None) -> None:
+    """
+    可取消的sleep，用于重试退避。
+
+    :param seconds: 等待秒数
+    :param token: 取消标记
+    """
+    if token is None:
+        threading.Event().wait(seconds)
+    elif token.wait(seconds):
+        raise TaskCancelled()
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# 后端模块平铺在 server/ 下，测试按模块名直接导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 导入 app 时会创建数据库，测试使用临时目录中的数据库
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="pdf-translate-test-"), "site.db"))
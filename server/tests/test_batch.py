@@ -0,0 +1,52 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip("magic_pdf")
+import en_pdf_to_zh_markdown  # noqa: E402
+
+
+def test_batch_skips_finished_files_and_resumes_failed(tmp_path, monkeypatch):
+    input_dir = tmp_path / "in"
+    output_dir = tmp_path / "out"
+    input_dir.mkdir()
+    for name in ("a.pdf", "bad.pdf"):
+        (input_dir / name).write_bytes(b"%PDF-1.4")
+    calls = []
+    broken = {"bad.pdf"}
+
+    def fake_translate(pdf_path, output_subdir, *args, failed_blocks=None, **kwargs):
+        name = os.path.basename(pdf_path)
+        calls.append(name)
+        with open(os.path.join(output_subdir, "partial.md"), "w", encoding="utf-8") as f:
+            f.write(name)
+        if name in broken:
+            raise RuntimeError("parse error")
+
+    monkeypatch.setattr(en_pdf_to_zh_markdown, "translate_pdf_to_zh", fake_translate)
+
+    def run(**kwargs):
+        records = en_pdf_to_zh_markdown.translate_all_pdfs_in_folder(str(input_dir), str(output_dir), {}, {},
+                                                                     workers=2, **kwargs)
+        return {record["file"]: record["status"] for record in records}
+
+    assert run() == {"a.pdf": "success", "bad.pdf": "failed"}
+    assert (output_dir / "a" / en_pdf_to_zh_markdown.BATCH_MARKER).exists()
+    assert not (output_dir / "bad" / en_pdf_to_zh_markdown.BATCH_MARKER).exists()
+
+    broken.clear()
+    calls.clear()
+    assert run() == {"a.pdf": "skipped", "bad.pdf": "success"}
+    assert calls == ["bad.pdf"]
+    marker = json.loads((output_dir / "bad" / en_pdf_to_zh_markdown.BATCH_MARKER).read_text(encoding="utf-8"))
+    assert marker["status"] == "success" and marker["failed_blocks"] == {}
+
+    calls.clear()
+    assert run(force=True, delete_source=True) == {"a.pdf": "success", "bad.pdf": "success"}
+    assert sorted(calls) == ["a.pdf", "bad.pdf"]
+    assert list(input_dir.iterdir()) == []
+
+    summary = (output_dir / en_pdf_to_zh_markdown.BATCH_SUMMARY).read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["status"] for line in summary].count("skipped") == 1
+    assert len(summary) == 6
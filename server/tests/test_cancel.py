@@ -0,0 +1,27 @@
+import uuid
+
+import app as server
+
+
+def test_cancel_cleanup_only_removes_own_work_directory(tmp_path, monkeypatch):
+    monkeypatch.setitem(server.app.config, "PROCESSED_FOLDER", str(tmp_path))
+    with server.app.app_context():
+        user = server.User(email=f"{uuid.uuid4()}@example.com")
+        server.db.session.add(user)
+        server.db.session.commit()
+        # 同一用户的两个同名任务同时执行
+        tasks = [server.TranslationTask(id=str(uuid.uuid4()), user_id=user.id, filename="paper.pdf",
+                                        status="translating") for _ in range(2)]
+        server.db.session.add_all(tasks)
+        server.db.session.commit()
+        cancelled, running = (task.id for task in tasks)
+        for task_id in (cancelled, running):
+            (tmp_path / task_id).mkdir()
+            (tmp_path / task_id / "paper.md").write_text(task_id, encoding="utf-8")
+
+        server._finish_cancelled(cancelled)
+
+        assert not (tmp_path / cancelled).exists()
+        assert (tmp_path / running / "paper.md").read_text(encoding="utf-8") == running
+        assert server.db.session.get(server.TranslationTask, cancelled).status == "cancelled"
+        assert server.db.session.get(server.TranslationTask, running).status == "translating"
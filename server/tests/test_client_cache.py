@@ -0,0 +1,32 @@
+import translate
+
+
+def _config(api_key):
+    return {"provider": "openai_compatible", "base_url": "http://127.0.0.1:1/v1", "api_key": api_key,
+            "modelname": "m", "maxtoken": 16}
+
+
+def test_cache_keys_do_not_contain_api_key():
+    client = translate.api_client_factory(_config("sk-cache-secret"))
+    assert translate.api_client_factory(_config("sk-cache-secret")) is client
+    assert not any("sk-cache-secret" in key for key in translate._clients)
+    assert not any("sk-cache-secret" in part for key in translate._endpoints for part in key)
+
+
+def test_evicted_endpoints_are_closed_and_clients_recreated(monkeypatch):
+    monkeypatch.setattr(translate, "MAX_CACHED_ENDPOINTS", 2)
+    first = translate.api_client_factory(_config("sk-lru-1"))
+    http_client = first.endpoint.http_client
+    translate.api_client_factory(_config("sk-lru-2"))
+    translate.api_client_factory(_config("sk-lru-3"))
+    assert first.closed and http_client.is_closed
+    assert len(translate._endpoints) <= 2
+    again = translate.api_client_factory(_config("sk-lru-1"))
+    assert again is not first and not again.closed
+
+
+def test_client_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(translate, "MAX_CACHED_CLIENTS", 3)
+    for index in range(5):
+        translate.api_client_factory({**_config("sk-bounded"), "timeout": index})
+    assert len(translate._clients) <= 3
@@ -0,0 +1,39 @@
+import uuid
+
+import domain
+
+
+class _Detector:
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+
+    def detect_domain(self, text):
+        self.calls += 1
+        return self.result
+
+
+def test_detected_domain_is_cached_per_document():
+    document = f"Deep learning paper {uuid.uuid4()}"
+    detector = _Detector("机器学习")
+    assert domain.DomainResolver(detector, document, document).result() == "机器学习"
+
+    cached = domain.DomainResolver(_Detector("化学"), document, document)
+    assert cached.current() == "机器学习"
+    assert cached.result() == "机器学习"
+    assert detector.calls == 1
+
+
+def test_failed_detection_keeps_provisional_and_is_not_cached():
+    front = "The neural network training uses a large dataset and a transformer benchmark."
+    document = f"{front} {uuid.uuid4()}"
+    resolver = domain.DomainResolver(_Detector(None), document, front)
+    assert resolver.provisional == "机器学习"
+    assert resolver.result() == "机器学习"
+    retry = _Detector("自然语言处理")
+    assert domain.DomainResolver(retry, document, front).result() == "自然语言处理"
+    assert retry.calls == 1
+
+
+def test_classify_domain_needs_enough_hits():
+    assert domain.classify_domain("A short note about a market.") is None
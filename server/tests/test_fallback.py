@@ -0,0 +1,41 @@
+import en_markdown_to_zh
+from domain import FixedDomain
+
+
+class _Encoder:
+    @staticmethod
+    def encode(text):
+        return text.split()
+
+
+class _LosesPlaceholders:
+    """先返回丢失占位符的译文，用原文重新请求时失败"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def translate(self, text, *args, **kwargs):
+        self.calls += 1
+        if self.calls == 1:
+            return "译文"
+        raise RuntimeError("backend down")
+
+
+class _Echo:
+    def translate(self, text, *args, **kwargs):
+        return text
+
+
+def test_fallback_retry_does_not_reuse_failed_attempt_stats():
+    blocks = [{"id": "b1", "type": "paragraph", "content": "Energy $E=mc^2$ here"}]
+    stats = en_markdown_to_zh._new_stats()
+    primary = _LosesPlaceholders()
+    translated = en_markdown_to_zh.translate_blocks(
+        blocks, primary, primary, {"provider": "p"}, {"provider": "p"}, FixedDomain(None), "en", "zh-CN",
+        stats, _Encoder(), fallback_client=_Echo())
+
+    assert translated[0]["content"] == "Energy $E=mc^2$ here"
+    assert stats["failed_blocks"] == []
+    # 首次尝试中的占位符重请求随失败丢弃，只计入成功的那次
+    assert stats["remasked_blocks"] == 0
+    assert stats["masked_spans"] == 1
@@ -0,0 +1,34 @@
+import os
+import subprocess
+import sys
+
+import app as server
+
+
+def test_health_does_not_wait_for_pipeline(monkeypatch):
+    monkeypatch.setitem(server.pipeline_state, "ready", False)
+    client = server.app.test_client()
+    response = client.get("/api/health")
+    assert response.status_code == 200
+    assert response.json["data"]["status"] == "ok"
+
+    response = client.get("/api/ready")
+    assert response.status_code == 503
+    assert response.json["data"]["database"] is True
+    assert response.json["data"]["ready"] is False
+
+
+def test_ready_once_pipeline_loaded(monkeypatch):
+    monkeypatch.setitem(server.pipeline_state, "ready", True)
+    response = server.app.test_client().get("/api/ready")
+    assert response.status_code == 200
+    assert response.json["data"]["ready"] is True
+
+
+def test_web_layer_does_not_import_pipeline(tmp_path):
+    server_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{tmp_path / 'site.db'}"}
+    code = "import sys, app; print(sorted({'en_pdf_to_zh_markdown', 'en_markdown_to_zh', 'translate'} & set(sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=server_dir, env=env, capture_output=True, text=True,
+                            check=True)
+    assert result.stdout.strip().splitlines()[-1] == "[]"
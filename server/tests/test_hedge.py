@@ -0,0 +1,48 @@
+import threading
+import time
+
+import translate
+
+
+def _client(api_key):
+    return translate.api_client_factory({
+        "provider": "openai_compatible", "base_url": "http://127.0.0.1:1/v1", "api_key": api_key,
+        "modelname": "m", "maxtoken": 16, "timeout": 120, "hedge": True,
+        "hedge_min_delay": 0.2, "hedge_max_ratio": 1.0, "hedge_min_timeout": 1.0,
+    })
+
+
+def test_slow_primary_is_answered_by_hedge():
+    client = _client("sk-hedge-slow")
+    policy = client._hedge_policy("translate")
+    for _ in range(policy.min_samples):
+        policy.record(0.01)
+    lock = threading.Lock()
+    timeouts = []
+
+    def request(timeout):
+        with lock:
+            timeouts.append(timeout)
+            first = len(timeouts) == 1
+        time.sleep(1.0 if first else 0.05)
+        return "primary" if first else "hedge"
+
+    start = time.monotonic()
+    assert client._call(request) == "hedge"
+    elapsed = time.monotonic() - start
+    assert elapsed < policy.min_delay + 0.05 + 0.2
+    # 样本充足时单次请求超时按近期延迟收紧，落后的请求不会占用线程到客户端的完整超时
+    assert timeouts == [1.0, 1.0]
+
+
+def test_request_timeout_falls_back_to_client_timeout():
+    policy = translate.HedgePolicy(min_samples=2, timeout_factor=3.0, min_timeout=30.0)
+    assert policy.request_timeout(120) == 120
+    policy.record(20)
+    policy.record(5)
+    assert policy.request_timeout(120) == 60
+    assert policy.request_timeout(45) == 45
+
+
+def test_sdk_retries_are_disabled():
+    assert _client("sk-hedge-retries").endpoint.openai_client.max_retries == 0
@@ -0,0 +1,44 @@
+import pytest
+
+import image_stage
+
+
+def test_dedupe_keeps_first_name_and_rewrites_references(tmp_path):
+    (tmp_path / "b.jpg").write_bytes(b"logo")
+    (tmp_path / "a.jpg").write_bytes(b"logo")
+    (tmp_path / "c.jpg").write_bytes(b"figure")
+    (tmp_path / "d.jpg").write_bytes(b"logo")
+
+    renames = image_stage.dedupe_images(str(tmp_path))
+    assert renames == {"b.jpg": "a.jpg", "d.jpg": "a.jpg"}
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["a.jpg", "c.jpg"]
+
+    md = ('![](images/b.jpg)\n![](images/c.jpg)\n'
+          '<table><tr><td><img src="images/d.jpg"></td></tr></table>\n'
+          'see other/b.jpg')
+    assert image_stage.rewrite_references(md, renames) == (
+        '![](images/a.jpg)\n![](images/c.jpg)\n'
+        '<table><tr><td><img src="images/a.jpg"></td></tr></table>\n'
+        'see other/b.jpg')
+
+
+def test_nothing_to_dedupe(tmp_path):
+    assert image_stage.dedupe_images(str(tmp_path / "missing")) == {}
+    (tmp_path / "only.png").write_bytes(b"x")
+    assert image_stage.dedupe_images(str(tmp_path)) == {}
+    assert image_stage.rewrite_references("![](images/only.png)", {}) == "![](images/only.png)"
+
+
+def test_recompress_shrinks_large_images(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    Image.new("RGB", (400, 200), "white").save(tmp_path / "big.png")
+    (tmp_path / "note.txt").write_bytes(b"not an image")
+    image_stage.configure(max_side=100)
+    try:
+        futures = image_stage.start_recompress(str(tmp_path))
+        result = image_stage.wait_recompress(futures)
+    finally:
+        image_stage.configure()
+    assert result["images"] == 2 and result["recompressed"] == 1
+    with Image.open(tmp_path / "big.png") as img:
+        assert img.size == (100, 50)
@@ -0,0 +1,44 @@
+import json
+import logging
+import threading
+
+import log_config
+
+
+def _record(msg="message", **extra):
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, msg, (), None)
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+
+def test_truncate():
+    assert log_config.truncate("short") == "short"
+    assert log_config.truncate("x" * 12, limit=5) == "xxxxx…(+7 chars)"
+
+
+def test_bind_context_carries_task_id_to_other_threads():
+    seen = []
+    with log_config.task_context("task-1"):
+        bound = log_config.bind_context(lambda: seen.append(log_config.task_id_var.get()))
+    thread = threading.Thread(target=bound)
+    thread.start()
+    thread.join()
+    assert seen == ["task-1"]
+    assert log_config.task_id_var.get() == "-"
+
+
+def test_sampling_filter_keeps_burst_then_every_nth():
+    sampler = log_config.SamplingFilter(rate=3, burst=2)
+    kept = [sampler.filter(_record(task_id="t", sample="block")) for _ in range(7)]
+    assert kept == [True, True, True, False, False, True, False]
+    assert sampler.filter(_record())
+
+
+def test_json_formatter_outputs_task_id_and_extra_fields():
+    record = _record("done %s", task_id="task-2", block="b1")
+    record.args = ("ok",)
+    entry = json.loads(log_config.JsonFormatter().format(record))
+    assert entry["task_id"] == "task-2"
+    assert entry["message"] == "done ok"
+    assert entry["block"] == "b1"
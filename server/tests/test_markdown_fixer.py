@@ -0,0 +1,56 @@
+from markdown_fixer import apply_heading_levels, infer_heading_levels
+
+
+def test_numbered_sections():
+    headings = ["# 1 Introduction", "# 2 Method", "# 2.1 Setup", "# 2.1.1 Data"]
+    assert infer_heading_levels(headings) == [1, 1, 2, 3]
+
+
+def test_unresolved_first_heading_is_title_and_shifts_sections():
+    headings = ["# Attention Is All You Need", "# 1 Introduction", "# 1.1 Motivation"]
+    assert infer_heading_levels(headings) == [1, 2, 3]
+
+
+def test_first_heading_same_size_as_sections_is_not_title():
+    headings = ["# Preliminaries", "# 1 Introduction", "# 2 Method", "# 2.1 Setup"]
+    sizes = [14.0, 14.0, 14.0, 12.0]
+    assert infer_heading_levels(headings, sizes) == [1, 1, 1, 2]
+
+
+def test_larger_first_heading_is_title():
+    headings = ["# A Very Long Paper Title", "# 1 Introduction", "# 2 Method"]
+    sizes = [20.0, 14.0, 14.0]
+    assert infer_heading_levels(headings, sizes) == [1, 2, 2]
+
+
+def test_single_unresolved_heading_stays_unresolved():
+    assert infer_heading_levels(["# Some Title"]) == [None]
+
+
+def test_known_top_english_requires_word_boundary():
+    assert infer_heading_levels(["# Abstract", "# Introductionary Remarks"]) == [1, None]
+
+
+def test_known_top_chinese_without_separator():
+    headings = ["# 摘要", "# 引言", "# 结论与展望", "# 参考文献"]
+    assert infer_heading_levels(headings) == [1, 1, 1, 1]
+
+
+def test_chinese_appendix_letter_sections():
+    headings = ["# 1 Introduction", "# 附录A", "# A. Proofs", "# A.1 Lemma"]
+    assert infer_heading_levels(headings) == [1, 1, 1, 2]
+
+
+def test_letter_sections_under_roman_numbering():
+    headings = ["# I. INTRODUCTION", "# A. Background", "# II. METHOD"]
+    assert infer_heading_levels(headings) == [1, 2, 1]
+
+
+def test_apply_heading_levels_does_not_modify_shared_blocks():
+    source = {"type": "heading", "level": 1, "content": "Method"}
+    paragraph = {"type": "paragraph", "content": "Text."}
+    # 未翻译的块与原文块是同一个对象，被两个目标语言共用
+    zh = apply_heading_levels([source, paragraph], [2])
+    ja = apply_heading_levels([source, paragraph], [None])
+    assert zh[0]["level"] == 2 and zh[1] is paragraph
+    assert source["level"] == 1 and ja[0] is source
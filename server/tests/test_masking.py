@@ -0,0 +1,72 @@
+import en_markdown_to_zh
+from domain import FixedDomain
+from masking import mask_text, unmask_text
+
+
+def test_inline_math_is_masked():
+    masked, mapping = mask_text("where $x_i$ is the input")
+    assert masked == "where [#1] is the input"
+    assert mapping == {"[#1]": "$x_i$"}
+
+
+def test_currency_is_not_masked():
+    text = "It costs $5 and $10 per month."
+    assert mask_text(text) == (text, {})
+
+
+def test_space_after_opening_dollar_is_not_math():
+    text = "between $ 5 and 6$ units"
+    assert mask_text(text) == (text, {})
+
+
+def test_digit_after_closing_dollar_is_not_math():
+    text = "from $a to b$5 later"
+    assert mask_text(text) == (text, {})
+
+
+def test_urls_and_citations_are_masked_and_restored():
+    text = "See https://example.com/a and [3, 5] for \\cite{smith}."
+    masked, mapping = mask_text(text)
+    assert len(mapping) == 3
+    restored, missing = unmask_text(masked, mapping)
+    assert restored == text and missing == []
+
+
+def test_missing_placeholders_are_reported():
+    masked, mapping = mask_text("Let $a$ and $b$ be given")
+    restored, missing = unmask_text("设 [#1] 已知", mapping)
+    assert restored == "设 $a$ 已知"
+    assert missing == ["[#2]"]
+
+
+class _FakeClient:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def translate(self, text, context, source_language, target_language, **kwargs):
+        self.requests.append(text)
+        return self.responses.pop(0)
+
+
+def test_lost_placeholder_triggers_unmasked_retry():
+    block = {"id": "b0001", "type": "paragraph", "content": "Let $a$ and $b$ be given"}
+    masked, mapping = mask_text(block["content"])
+    client = _FakeClient(["设 [#1] 已知", "设 $a$ 和 $b$ 已知"])
+    stats = en_markdown_to_zh._new_stats()
+    result = en_markdown_to_zh._translate_masked(client, block, masked, mapping, FixedDomain(None),
+                                                 "en", "zh-CN", stats)
+    assert result == "设 $a$ 和 $b$ 已知"
+    assert client.requests == [masked, block["content"]]
+    assert stats["remasked_blocks"] == 1
+
+
+def test_complete_placeholders_need_one_request():
+    block = {"id": "b0001", "type": "paragraph", "content": "Let $a$ be given"}
+    masked, mapping = mask_text(block["content"])
+    client = _FakeClient(["设 [#1] 已知"])
+    stats = en_markdown_to_zh._new_stats()
+    result = en_markdown_to_zh._translate_masked(client, block, masked, mapping, FixedDomain(None),
+                                                 "en", "zh-CN", stats)
+    assert result == "设 $a$ 已知"
+    assert len(client.requests) == 1 and stats["remasked_blocks"] == 0
@@ -0,0 +1,47 @@
+import pytest
+
+import metrics
+
+
+def test_counter_and_gauge_text():
+    counter = metrics.Counter("test_requests", "Requests", ["path"])
+    counter.inc(path='/a"b')
+    counter.inc(2, path='/a"b')
+    assert counter.render() == [
+        "# HELP test_requests_total Requests",
+        "# TYPE test_requests_total counter",
+        'test_requests_total{path="/a\\"b"} 3',
+    ]
+    gauge = metrics.Gauge("test_running", "Running")
+    with gauge.track_inprogress():
+        assert gauge.samples() == ["test_running 1"]
+    assert gauge.samples() == ["test_running 0"]
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("test_latency_seconds", "Latency", ["call"], buckets=(0.5, 1.0))
+    for value in (0.2, 0.7, 3.0):
+        histogram.observe(value, call="translate")
+    assert histogram.samples() == [
+        'test_latency_seconds_bucket{call="translate",le="0.5"} 1',
+        'test_latency_seconds_bucket{call="translate",le="1"} 2',
+        'test_latency_seconds_bucket{call="translate",le="+Inf"} 3',
+        'test_latency_seconds_sum{call="translate"} 3.9',
+        'test_latency_seconds_count{call="translate"} 3',
+    ]
+
+
+def test_labels_are_checked_and_names_unique():
+    counter = metrics.Counter("test_checked", "Checked", ["status"])
+    with pytest.raises(ValueError):
+        counter.inc(status="ok", kind="x")
+    with pytest.raises(ValueError):
+        metrics.Counter("test_checked", "Duplicate")
+
+
+def test_registry_render_runs_collectors():
+    registry = metrics.Registry()
+    gauge = metrics.Gauge("test_collected", "Collected")
+    registry.register(gauge)
+    registry.add_collector(lambda: gauge.set(5))
+    assert registry.render().endswith("test_collected 5\n")
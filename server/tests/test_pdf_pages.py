@@ -0,0 +1,55 @@
+import pdf_pages
+
+
+class _Rect:
+    """PyMuPDF Rect 的最小替身：宽高、求交和 is_empty"""
+
+    def __init__(self, x0, y0, x1, y1):
+        self.x0, self.y0, self.x1, self.y1 = x0, y0, x1, y1
+
+    @property
+    def width(self):
+        return max(self.x1 - self.x0, 0)
+
+    @property
+    def height(self):
+        return max(self.y1 - self.y0, 0)
+
+    @property
+    def is_empty(self):
+        return self.width == 0 or self.height == 0
+
+    def __and__(self, other):
+        x0, y0, x1, y1 = other
+        return _Rect(max(self.x0, x0), max(self.y0, y0), min(self.x1, x1), min(self.y1, y1))
+
+
+class _Page:
+    def __init__(self, text, images=()):
+        self.rect = _Rect(0, 0, 100, 100)
+        self._text = text
+        self._images = [{"bbox": bbox} for bbox in images]
+
+    def get_text(self):
+        return self._text
+
+    def get_image_info(self):
+        return self._images
+
+
+def test_classify_page():
+    body = "Lorem ipsum dolor sit amet " * 20
+    assert pdf_pages.classify_page(_Page(body))["mode"] == pdf_pages.TEXT
+    scanned = pdf_pages.classify_page(_Page("12", images=[(-10, -10, 110, 110)]))
+    assert (scanned["mode"], scanned["reason"], scanned["images"]) == (pdf_pages.OCR, "scanned", 1.0)
+    # 整页图片上只有页眉页码
+    assert pdf_pages.classify_page(_Page("Journal of Things, page 12", images=[(0, 0, 100, 90)]))["reason"] == "scanned"
+    assert pdf_pages.classify_page(_Page("\ue000\ufffd\ue001" * 10 + "abc"))["reason"] == "garbled"
+    assert pdf_pages.classify_page(_Page("", images=[(0, 0, 10, 10)]))["reason"] == "blank"
+
+
+def test_group_runs_and_format_pages():
+    modes = ["text", "text", "ocr", "ocr", "text"]
+    assert pdf_pages.group_runs(modes) == [(0, 1, "text"), (2, 3, "ocr"), (4, 4, "text")]
+    assert pdf_pages.group_runs([]) == []
+    assert pdf_pages.format_pages([0, 1, 2, 6, 8, 9]) == "1-3,7,9-10"
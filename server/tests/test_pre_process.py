@@ -0,0 +1,109 @@
+from pre_process import markdown_parser
+
+
+def _types(blocks):
+    return [block["type"] for block in blocks]
+
+
+def test_single_line_formula():
+    blocks = markdown_parser("Intro text\n$$E = mc^2$$\nMore text")
+    assert _types(blocks) == ["paragraph", "formula", "paragraph"]
+    assert blocks[1]["content"] == "$$E = mc^2$$"
+
+
+def test_text_after_single_line_formula_is_translated():
+    blocks = markdown_parser("$$x$$ followed by text")
+    assert _types(blocks) == ["formula", "paragraph"]
+    assert blocks[0]["content"] == "$$x$$"
+    assert blocks[1]["content"].strip() == "followed by text"
+
+
+def test_multi_line_formula_with_trailing_text():
+    blocks = markdown_parser("\\[\na + b\n\\] where a is small")
+    assert _types(blocks) == ["formula", "paragraph"]
+    assert blocks[0]["content"] == "\\[\na + b\n\\]"
+    assert blocks[1]["content"].strip() == "where a is small"
+
+
+def test_unclosed_formula_does_not_swallow_document():
+    blocks = markdown_parser("$$\nx = 1\n# Heading\nBody text")
+    assert "formula" not in _types(blocks)
+    assert {"type": "heading", "level": 1, "content": "Heading"} in blocks
+    assert blocks[-1]["type"] == "paragraph"
+
+
+def test_code_fence():
+    blocks = markdown_parser("Text\n```python\nprint('hi')\n\n# not a heading\n```\nAfter")
+    assert _types(blocks) == ["paragraph", "code", "paragraph"]
+    assert blocks[1]["content"].endswith("```")
+    assert "# not a heading" in blocks[1]["content"]
+
+
+def test_unclosed_code_fence_falls_back_to_paragraph():
+    blocks = markdown_parser("```python\nprint('hi')\n# Heading\nBody")
+    assert "code" not in _types(blocks)
+    assert any(block["type"] == "heading" for block in blocks)
+
+
+def test_html_table():
+    blocks = markdown_parser("<table>\n<tr><td>Cell</td></tr>\n</table>\nAfter")
+    assert _types(blocks) == ["html", "paragraph"]
+    assert blocks[0]["content"].endswith("</table>")
+
+
+def test_unclosed_html_table_falls_back_to_paragraph():
+    blocks = markdown_parser("<table><tr><td>Cell\n# Heading\nBody")
+    assert "html" not in _types(blocks)
+    assert any(block["type"] == "heading" for block in blocks)
+
+
+def test_pipe_table():
+    blocks = markdown_parser("| Name | Value |\n| --- | --- |\n| alpha | 1 |\nAfter")
+    assert _types(blocks) == ["table", "paragraph"]
+    assert blocks[0]["align_row"] == 1
+    assert blocks[0]["rows"][2] == ["alpha", "1"]
+
+
+REFERENCE_ENTRIES = (
+    "[1] Smith, J., Doe, A. Deep learning for parsing. In: Proc. ACL, 2019.\n"
+    "[2] Vaswani, A. et al. Attention is all you need. NeurIPS, 2017.\n"
+)
+
+
+def _sections(text):
+    from pre_process import classify_sections
+    blocks = markdown_parser(text)
+    classify_sections(blocks)
+    return [(block["type"], block.get("section")) for block in blocks]
+
+
+def test_numbered_history_list_in_body_is_translated():
+    text = ("# 2 History\n1. The first engine was built in 1885.\n2. Mass production started in 1913.\n"
+            "# 3 Method\nWe propose a method.")
+    assert all(section is None for _, section in _sections(text))
+
+
+def test_reference_list_after_last_heading_is_detected():
+    assert _sections("# 5 Conclusion\n" + REFERENCE_ENTRIES) == [("heading", None), ("paragraph", "references")]
+
+
+def test_reference_list_in_body_is_not_skipped():
+    text = "# 2 Related Work\n" + REFERENCE_ENTRIES + "# 3 Method\nWe propose a method."
+    assert _sections(text) == [("heading", None), ("paragraph", None), ("heading", None), ("paragraph", None)]
+
+
+def test_numbered_list_with_years_at_end_needs_author_or_venue():
+    text = "# 6 Timeline\n1. Started in 2019.\n2. Finished in 2021."
+    assert _sections(text) == [("heading", None), ("paragraph", None)]
+
+
+def test_reference_heading_variants():
+    for heading in ("References:", "7 References", "VII. REFERENCES", "**References**", "参考文献："):
+        text = f"# {heading}\nSome entry without numbering."
+        assert _sections(text) == [("heading", None), ("paragraph", "references")], heading
+
+
+def test_reference_style_list_in_appendix_after_references():
+    text = "# References\n" + REFERENCE_ENTRIES + "# Appendix A\n" + REFERENCE_ENTRIES + "# A.1 Proof\nProof text."
+    assert _sections(text) == [("heading", None), ("paragraph", "references"), ("heading", None),
+                               ("paragraph", "references"), ("heading", None), ("paragraph", None)]
@@ -0,0 +1,33 @@
+import itertools
+
+import profiling
+
+
+@profiling.profiled("stage")
+def _stage(values):
+    return sum(values)
+
+
+def test_sampled_task_writes_stage_profile(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "_settings", None)
+    monkeypatch.setattr(profiling, "_task_counter", itertools.count())
+    profiling.configure(targets=["stage"], sample_rate=2, memory=True, directory=str(tmp_path))
+
+    for task_id in ("sampled", "skipped"):
+        with profiling.task_session(task_id):
+            assert _stage(range(10)) == 45
+            assert _stage(range(5)) == 10
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["sampled"]
+    output = tmp_path / "sampled"
+    assert sorted(path.name for path in output.iterdir()) == ["memory.txt", "stage.prof", "stage.txt"]
+    assert (output / "stage.txt").read_text(encoding="utf-8").startswith("# stage：调用 2 次")
+
+
+def test_profiling_disabled_without_targets(monkeypatch):
+    monkeypatch.setattr(profiling, "_settings", None)
+    monkeypatch.delenv("PROFILE_TARGETS", raising=False)
+    profiling.configure()
+    with profiling.task_session("task") as session:
+        assert session is None
+        assert _stage([1, 2]) == 3
@@ -0,0 +1,39 @@
+import client_config
+import translate
+
+
+def _backend(name):
+    return {"provider": "openai_compatible", "name": name, "base_url": f"http://127.0.0.1:1/{name}",
+            "api_key": "sk-router", "modelname": name, "maxtoken": 16}
+
+
+def test_router_retries_across_backends(monkeypatch):
+    router = translate.RoutingClient({"provider": "router", "backends": [_backend("a"), _backend("b")],
+                                      "attempts": 2, "retry_delay": 0})
+    calls = []
+
+    def flaky(name):
+        def translate_text(text, *args, **kwargs):
+            calls.append(name)
+            if len(calls) < 3:
+                raise RuntimeError(f"{name} down")
+            return f"{name}:{text}"
+        return translate_text
+
+    for backend in router.backends:
+        monkeypatch.setattr(backend.client, "translate", flaky(backend.name))
+    assert router.translate("hi").endswith(":hi")
+    assert len(calls) == 3
+
+
+def test_router_backends_retry_briefly(monkeypatch):
+    monkeypatch.setenv("OPENAI_COMPAT_BASE_URL", "http://127.0.0.1:1/v1")
+    monkeypatch.setenv("OPENAI_COMPAT_MODEL", "local")
+    monkeypatch.delenv("OPENAI_FALLBACK_BASE_URL", raising=False)
+    config = client_config.build_client_config("sk-user", 300)
+    assert config["provider"] == "router"
+    for backend in config["backends"]:
+        assert backend["max_retries"] == client_config.ROUTER_BACKEND_RETRIES
+        assert backend["timeout"] == client_config.ROUTER_BACKEND_TIMEOUT
+    # 备用后端须单独配置，不复用已在路由中的兼容后端
+    assert client_config.build_fallback_config(300) is None
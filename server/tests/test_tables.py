@@ -0,0 +1,70 @@
+import en_markdown_to_zh
+from domain import FixedDomain
+from pre_process import markdown_parser, parse_pipe_table
+from rebuild import render_pipe_table
+from translate import pack_segments, unpack_segments
+
+
+def test_parse_pipe_table_with_escaped_pipe():
+    rows, align_row = parse_pipe_table("| Name | Note |\n| --- | --- |\n| a \\| b | text |")
+    assert align_row == 1
+    assert rows[2] == ["a \\| b", "text"]
+
+
+def test_single_dash_alignment_row():
+    rows, align_row = parse_pipe_table("|a|b|\n|-|:-:|\n|1|2|")
+    assert align_row == 1
+    blocks = markdown_parser("|a|b|\n|-|:-:|\n|1|2|")
+    assert blocks[0]["type"] == "table" and blocks[0]["align_row"] == 1
+
+
+def test_table_without_alignment_row():
+    rows, align_row = parse_pipe_table("| a | b |\n| c | d |")
+    assert align_row is None
+    assert rows == [["a", "b"], ["c", "d"]]
+
+
+def test_render_round_trip_and_escaping():
+    rows, _ = parse_pipe_table("| Name | Value |\n| :-: | --- |\n| x | 1 |")
+    assert render_pipe_table(rows) == "| Name | Value |\n| :-: | --- |\n| x | 1 |"
+    assert render_pipe_table([["a|b", "multi\nline"]]) == "| a\\|b | multi line |"
+
+
+def test_render_keeps_rows_with_different_cell_counts():
+    rows, _ = parse_pipe_table("| a | b | c |\n| --- | --- | --- |\n| 1 | 2 |")
+    assert rows[2] == ["1", "2"]
+    assert render_pipe_table(rows).split("\n")[2] == "| 1 | 2 |"
+
+
+def test_pack_unpack_round_trip():
+    segments = ["Name", "two\nlines", "Value"]
+    packed = pack_segments(segments)
+    assert packed == "<1> Name\n<2> two lines\n<3> Value"
+    assert unpack_segments(packed, 3) == ["Name", "two lines", "Value"]
+
+
+def test_unpack_with_missing_and_extra_segments():
+    assert unpack_segments("<1> 名称\n<3> 值\n<4> 多余\nnoise", 3) == ["名称", None, "值"]
+
+
+class _FakeClient:
+    def __init__(self, response):
+        self.response = response
+
+    def translate(self, text, *args, **kwargs):
+        return self.response
+
+
+def test_table_cell_count_mismatch_keeps_source_cells():
+    block = markdown_parser("| Name | Value |\n| --- | --- |\n| alpha | 1 |")[0]
+    positions = en_markdown_to_zh._table_segments(block)
+    assert positions == [(0, 0), (0, 1), (2, 0)]
+    packed = pack_segments([block["rows"][r][c] for r, c in positions])
+    stats = en_markdown_to_zh._new_stats()
+    # 模型只返回了两个片段
+    result = en_markdown_to_zh._translate_table(_FakeClient("<1> 名称\n<2> 值"), block, positions, packed, packed,
+                                                {}, FixedDomain(None), "en", "zh-CN", stats)
+    assert result["rows"][0] == ["名称", "值"]
+    assert result["rows"][2] == ["alpha", "1"]
+    assert stats["table_cells_missing"] == 1
+    assert block["rows"][0] == ["Name", "Value"]
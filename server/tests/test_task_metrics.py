@@ -0,0 +1,40 @@
+import types
+import uuid
+
+import app as server
+import metrics
+import translate
+
+
+def test_failed_final_commit_is_counted_once(tmp_path, monkeypatch):
+    monkeypatch.setitem(server.app.config, "PROCESSED_FOLDER", str(tmp_path))
+    fake_translator = types.SimpleNamespace(
+        translate_one_pdf=lambda *args, output_name, **kwargs: str(tmp_path / f"{output_name}.zip"))
+    monkeypatch.setattr(server, "load_pipeline", lambda: (fake_translator, translate))
+    with server.app.app_context():
+        user = server.User(email=f"{uuid.uuid4()}@example.com")
+        server.db.session.add(user)
+        server.db.session.commit()
+        server.db.session.add(server.UserApiConfig(user_id=user.id, deepseek_api_key="sk-metrics"))
+        task = server.TranslationTask(id=str(uuid.uuid4()), user_id=user.id, filename="paper.pdf", status="pending")
+        server.db.session.add(task)
+        server.db.session.commit()
+        task_id = task.id
+
+    real_commit = server.db.session.commit
+
+    def commit():
+        # 写入下载地址的最终提交失败
+        if any(getattr(obj, "download_url", None) for obj in server.db.session.dirty):
+            server.db.session.rollback()
+            raise RuntimeError("database is locked")
+        real_commit()
+
+    monkeypatch.setattr(server.db.session, "commit", commit)
+    before = {status: metrics.TASKS_FINISHED.value(status=status) for status in ("success", "failed")}
+    server.process_task(task_id)
+
+    assert metrics.TASKS_FINISHED.value(status="success") == before["success"]
+    assert metrics.TASKS_FINISHED.value(status="failed") == before["failed"] + 1
+    with server.app.app_context():
+        assert server.db.session.get(server.TranslationTask, task_id).status == "failed"
@@ -0,0 +1,55 @@
+import os
+import shutil
+import threading
+
+import pytest
+
+pytest.importorskip("magic_pdf")
+import en_pdf_to_zh_markdown  # noqa: E402
+from task_control import TaskCancelled  # noqa: E402
+
+
+def test_same_filename_tasks_keep_separate_outputs(tmp_path, monkeypatch):
+    output_dir = tmp_path / "processed"
+    output_dir.mkdir()
+    barrier = threading.Barrier(3)
+
+    def fake_translate(pdf_path, output_subdir, *args, cancel_token=None, **kwargs):
+        with open(pdf_path, encoding="utf-8") as f:
+            content = f.read()
+        with open(os.path.join(output_subdir, "paper.md"), "w", encoding="utf-8") as f:
+            f.write(content)
+        # 三个同名任务同时处于翻译阶段，其中一个被取消并清理自己的中间文件
+        barrier.wait(timeout=5)
+        if content == "cancelled":
+            raise TaskCancelled()
+        barrier.wait(timeout=5)
+
+    monkeypatch.setattr(en_pdf_to_zh_markdown, "translate_pdf_to_zh", fake_translate)
+    results = {}
+
+    def run(task_id):
+        upload_dir = tmp_path / "uploads" / task_id
+        upload_dir.mkdir(parents=True)
+        (upload_dir / "paper.pdf").write_text(task_id, encoding="utf-8")
+        try:
+            results[task_id] = en_pdf_to_zh_markdown.translate_one_pdf(
+                str(upload_dir / "paper.pdf"), str(output_dir), {}, {}, output_name=task_id)
+        except TaskCancelled:
+            results[task_id] = None
+            barrier.wait(timeout=5)
+
+    threads = [threading.Thread(target=run, args=(task_id,)) for task_id in ("first", "second", "cancelled")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results["cancelled"] is None
+    assert sorted(os.listdir(output_dir)) == ["first.zip", "second.zip"]
+    for task_id in ("first", "second"):
+        assert results[task_id] == str(output_dir / f"{task_id}.zip")
+        unpacked = tmp_path / f"unpacked-{task_id}"
+        shutil.unpack_archive(results[task_id], unpacked, "zip")
+        assert (unpacked / "paper.md").read_text(encoding="utf-8") == task_id
+        assert (unpacked / "paper.pdf").read_text(encoding="utf-8") == task_id
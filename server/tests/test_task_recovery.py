@@ -0,0 +1,60 @@
+import uuid
+
+import pytest
+
+import app as server
+
+
+@pytest.fixture
+def ctx(monkeypatch):
+    submitted = []
+    monkeypatch.setattr(server.executor, "submit", lambda fn, task_id: submitted.append(task_id))
+    with server.app.app_context():
+        server.TranslationTask.query.delete()
+        server.db.session.commit()
+        server.cancel_tokens.clear()
+        yield submitted
+        server.cancel_tokens.clear()
+
+
+def _user():
+    user = server.User(email=f"{uuid.uuid4()}@example.com")
+    server.db.session.add(user)
+    server.db.session.commit()
+    return user.id
+
+
+def _task(user_id, status, **fields):
+    task = server.TranslationTask(id=str(uuid.uuid4()), user_id=user_id, filename="a.pdf", status=status, **fields)
+    server.db.session.add(task)
+    server.db.session.commit()
+    return task.id
+
+
+def _schedule():
+    # 后台线程在新的应用上下文（新的数据库会话）中调度
+    with server.app.app_context():
+        return server.schedule_pending_tasks()
+
+
+def test_restart_releases_slots_held_by_orphaned_tasks(ctx):
+    # 重启前有 MAX_CONCURRENT_TASKS 个任务在执行，新进程中没有对应的工作线程和取消标记
+    stale = [_task(_user(), "translating") for _ in range(server.MAX_CONCURRENT_TASKS)]
+    waiting = _task(_user(), "pending")
+    assert _schedule() == 0
+
+    assert server.recover_orphaned_tasks() == len(stale)
+    assert server.running_task_counts() == {}
+    assert _schedule() == server.MAX_CONCURRENT_TASKS
+    assert len(set(ctx)) == server.MAX_CONCURRENT_TASKS and set(ctx) <= set(stale) | {waiting}
+
+
+def test_recovery_finishes_cancelling_tasks_and_keeps_live_ones(ctx):
+    user_id = _user()
+    cancelling = _task(user_id, "cancelling")
+    live = _task(user_id, "translating")
+    server.cancel_tokens[live] = server.CancelToken()
+
+    assert server.recover_orphaned_tasks() == 1
+    assert server.db.session.get(server.TranslationTask, cancelling).status == "cancelled"
+    assert server.db.session.get(server.TranslationTask, live).status == "translating"
@@ -0,0 +1,45 @@
+import pytest
+
+import timeline
+from task_control import TaskCancelled
+
+
+def test_blocks_are_truncated_to_the_slowest(monkeypatch):
+    monkeypatch.setattr(timeline, "MAX_BLOCKS", 3)
+    run = timeline.Timeline()
+    for index in range(10):
+        run.add_block({"id": f"b{index}", "start": index, "dur": index % 5})
+    # 超过上限的两倍时就地裁剪，内存占用有界
+    assert len(run.blocks) <= 2 * timeline.MAX_BLOCKS
+    blocks = run.to_dict()["blocks"]
+    assert [block["id"] for block in blocks] == ["b3", "b4", "b9"]
+
+
+def test_block_records_calls_retries_and_tokens():
+    run = timeline.Timeline()
+    with timeline.activate(run):
+        with timeline.block("b1", "zh-CN", "paragraph", 42):
+            timeline.record_call("translate")
+            timeline.record_call("translate", 1.2345, {"prompt_tokens": 10, "completion_tokens": 4})
+        with timeline.block("skipped", "zh-CN", "paragraph", 1):
+            pass
+    [record] = run.to_dict()["blocks"]
+    assert record["id"] == "b1" and record["tokens"] == 42
+    assert record["calls"] == [["translate", 1.234]]
+    assert (record["retries"], record["prompt"], record["completion"]) == (1, 10, 4)
+
+
+def test_span_status_and_no_timeline():
+    run = timeline.Timeline()
+    with timeline.activate(run):
+        with timeline.span("parse"):
+            pass
+        with pytest.raises(TaskCancelled):
+            with timeline.span("translate", lang="zh-CN"):
+                raise TaskCancelled()
+    spans = run.to_dict()["spans"]
+    assert [span["name"] for span in spans] == ["parse", "translate"]
+    assert "status" not in spans[0] and spans[1]["status"] == "cancelled"
+    assert spans[1]["lang"] == "zh-CN"
+    with timeline.span("outside") as record:
+        assert record is None
@@ -0,0 +1,39 @@
+import io
+import os
+import uuid
+
+import pytest
+
+import app as server
+
+# 页数按 /Count 估算的最小PDF
+PDF = b"%PDF-1.4\n1 0 obj<</Type /Pages /Kids [] /Count 12>>endobj\n"
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setitem(server.app.config, "UPLOAD_FOLDER", str(tmp_path))
+    client = server.app.test_client()
+    email = f"{uuid.uuid4()}@example.com"
+    client.post("/api/register", json={"email": email, "password": "x"})
+    token = client.post("/api/login", json={"email": email, "password": "x"}).json["data"]["token"]
+    client.environ_base["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+    client.post("/api/config", json={"deepseek_api_key": "k"})
+    return client
+
+
+def _upload(client, name="paper.pdf"):
+    return client.post("/api/upload", data={"file": (io.BytesIO(PDF), name)}, content_type="multipart/form-data")
+
+
+def test_same_filename_uploads_do_not_share_a_file(client, tmp_path, monkeypatch):
+    first = _upload(client).json["data"]["taskId"]
+    second = _upload(client).json["data"]["taskId"]
+    assert os.path.exists(tmp_path / first / "paper.pdf")
+    assert os.path.exists(tmp_path / second / "paper.pdf")
+
+    # 页数超限被拒绝的同名上传只删除自己的文件
+    monkeypatch.setattr(server, "MAX_PAGES", 5)
+    assert _upload(client).status_code == 413
+    assert sorted(os.listdir(tmp_path)) == sorted([first, second])
+    assert os.path.exists(tmp_path / first / "paper.pdf")
@@ -0,0 +1,35 @@
+import types
+
+import translate
+
+
+def test_usage_meter_separates_cache_hits_and_misses():
+    meter = translate.UsageMeter()
+    meter.record({"prompt_tokens": 100, "completion_tokens": 20, "prompt_cache_hit_tokens": 80,
+                  "prompt_cache_miss_tokens": 20}, 1.0)
+    meter.record(types.SimpleNamespace(prompt_tokens=100, completion_tokens=30, prompt_cache_hit_tokens=0,
+                                       prompt_cache_miss_tokens=100), 3.0)
+    meter.record(None, 2.0)
+    summary = meter.summary()
+    assert summary["prompt_tokens"] == 200
+    assert summary["completion_tokens"] == 50
+    assert summary["requests"] == 3
+    assert summary["cache_hit_ratio"] == 0.4
+    assert summary["avg_latency_hit"] == 1.0
+    assert summary["avg_latency_miss"] == 2.5
+
+
+def test_empty_usage_meter_summary():
+    summary = translate.UsageMeter().summary()
+    assert summary["cache_hit_ratio"] == 0.0
+    assert summary["avg_latency_hit"] is None and summary["avg_latency_miss"] is None
+
+
+def test_translate_message_keeps_stable_prefix():
+    first = translate.build_translate_message("First block.", "机器学习", "英文", "中文", "paragraph")
+    second = translate.build_translate_message("Second block.", "机器学习", "英文", "中文", "paragraph")
+    prefix = first[:first.index("## 原文")]
+    # 同一文档同类块的请求只有原文不同，前缀可命中上下文缓存
+    assert second.startswith(prefix)
+    assert first.endswith("## 原文\nFirst block.")
+    assert "通用领域" in translate.build_translate_message("x", None, "英文", "中文", "paragraph")
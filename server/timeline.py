@@ -0,0 +1,170 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from task_control import TaskCancelled
+
+
+# 当前任务的时间线与正在翻译的块，随任务上下文传递到块调度器和后台线程
+_timeline_var: contextvars.ContextVar = contextvars.ContextVar("timeline", default=None)
+_block_var: contextvars.ContextVar = contextvars.ContextVar("timeline_block", default=None)
+
+# 单次运行最多记录的块数，超出后只保留耗时最长的块
+MAX_BLOCKS = 2000
+
+
+def _round(seconds: float) -> float:
+    return round(seconds, 3)
+
+
+class Timeline:
+    """
+    单次任务运行的时间线：阶段区间（开始/结束偏移秒数）和每个翻译块的请求耗时、重试与Token数。
+
+    所有时间为相对运行开始的偏移，序列化结果可直接存入数据库。
+    """
+
+    def __init__(self, kind: str = "translate"):
+        self.kind = kind
+        self.started_at = time.time()
+        self._start = time.monotonic()
+        self.spans: List[Dict] = []
+        self.blocks: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def offset(self) -> float:
+        """距运行开始的秒数"""
+        return time.monotonic() - self._start
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """
+        记录一个阶段区间，异常时标注状态。
+
+        :param name: 阶段名（parse / translate / detect_domain / fix_headings / zip 等）
+        :param attrs: 附加字段（如目标语言）
+        """
+        span = {"name": name, "start": _round(self.offset()), **attrs}
+        status = "ok"
+        try:
+            yield span
+        except TaskCancelled:
+            status = "cancelled"
+            raise
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            span["end"] = _round(self.offset())
+            if status != "ok":
+                span["status"] = status
+            with self._lock:
+                self.spans.append(span)
+
+    def add_block(self, record: Dict) -> None:
+        with self._lock:
+            self.blocks.append(record)
+            if len(self.blocks) > MAX_BLOCKS * 2:
+                self.blocks.sort(key=lambda block: block["dur"], reverse=True)
+                del self.blocks[MAX_BLOCKS:]
+
+    def to_dict(self) -> Dict:
+        """紧凑的可序列化表示，块按开始时间排序"""
+        with self._lock:
+            blocks = sorted(self.blocks, key=lambda block: block["dur"], reverse=True)[:MAX_BLOCKS]
+            spans = sorted(self.spans, key=lambda span: span["start"])
+        blocks.sort(key=lambda block: block["start"])
+        return {
+            "kind": self.kind,
+            "startedAt": int(self.started_at),
+            "duration": _round(self.offset()),
+            "spans": spans,
+            "blocks": blocks,
+        }
+
+
+@contextmanager
+def activate(timeline: Timeline):
+    """在上下文中设置当前时间线"""
+    token = _timeline_var.set(timeline)
+    try:
+        yield timeline
+    finally:
+        _timeline_var.reset(token)
+
+
+def current() -> Optional[Timeline]:
+    return _timeline_var.get()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """在当前时间线上记录阶段区间，没有时间线时不做任何事"""
+    timeline = _timeline_var.get()
+    if timeline is None:
+        yield None
+        return
+    with timeline.span(name, **attrs) as record:
+        yield record
+
+
+def traced(fn: Callable, name: str, **attrs) -> Callable:
+    """包装函数，使其每次执行都在当前时间线上记录为一个阶段区间"""
+    def run(*args, **kwargs):
+        with span(name, **attrs):
+            return fn(*args, **kwargs)
+    return run
+
+
+@contextmanager
+def block(block_id: str, language: str, block_type: str, tokens: int):
+    """
+    记录一个翻译块：期间的API请求通过 record_call 计入该块。
+
+    :param block_id: 块id
+    :param language: 目标语言
+    :param block_type: 块类型
+    :param tokens: 发送的Token数（屏蔽后）
+    """
+    timeline = _timeline_var.get()
+    if timeline is None:
+        yield None
+        return
+    record = {"id": block_id, "lang": language, "type": block_type, "tokens": tokens,
+              "start": _round(timeline.offset()), "calls": [], "retries": 0, "prompt": 0, "completion": 0}
+    token = _block_var.set(record)
+    try:
+        yield record
+    except TaskCancelled:
+        raise
+    except BaseException:
+        record["failed"] = True
+        raise
+    finally:
+        _block_var.reset(token)
+        record["dur"] = _round(timeline.offset() - record["start"])
+        # 没有发出请求的块（如排队时已取消）不记录
+        if record["calls"] or record.get("failed"):
+            timeline.add_block(record)
+
+
+def record_call(call: str, seconds: Optional[float] = None, usage: Optional[Dict] = None) -> None:
+    """
+    将一次API请求计入当前块；seconds 为None表示请求失败、将重试。
+
+    :param call: 调用类型（translate / check）
+    :param seconds: 请求耗时
+    :param usage: 响应中的usage字典
+    """
+    record = _block_var.get()
+    if record is None:
+        return
+    if seconds is None:
+        record["retries"] += 1
+        return
+    record["calls"].append([call, _round(seconds)])
+    if usage:
+        record["prompt"] += usage.get("prompt_tokens") or 0
+        record["completion"] += usage.get("completion_tokens") or 0
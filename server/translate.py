@@ -1,20 +1,558 @@
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import httpx
 from openai import OpenAI
+from task_control import CancelToken, TaskCancelled, check_cancelled
+import task_control
+import metrics
+import scheduler
+import timeline
+import re
+import logging
+import threading
 import time
 import json
+import hashlib
+from log_config import truncate
+
+logger = logging.getLogger(__name__)
+
+# 单次请求默认超时（秒）
+DEFAULT_TIMEOUT = 120
+# 等待请求返回时检查取消与对冲的间隔（秒）
+_POLL_INTERVAL = 0.5
+# 对冲请求使用的线程池，原请求与对冲请求都在其中执行；按块调度器线程数确定大小，首次使用时创建
+_hedge_executor: Optional[ThreadPoolExecutor] = None
+_hedge_executor_lock = threading.Lock()
+# 块调度器之外的调用（领域检测等）预留的线程数
+_HEDGE_EXTRA_WORKERS = 4
+# 各提供者的默认地址
+DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+SILICONFLOW_BASE_URL = "https://api.siliconflow.cn/v1/chat/completions"
+# 每个端点连接池的默认最大连接数
+DEFAULT_MAX_CONNECTIONS = 16
+# 进程内最多保留的端点数（每个用户的API Key一个），超出时关闭最久没有请求的端点的连接池
+MAX_CACHED_ENDPOINTS = 64
+# 进程内最多缓存的客户端实例数
+MAX_CACHED_CLIENTS = 128
+
+# 按块类型追加的格式说明（公式、代码块已在预处理阶段排除，不会送来翻译）
+BLOCK_TYPE_HINTS = {
+    "heading": "输入为章节标题：只输出译文标题，不要添加#号或编号以外的内容。",
+    "table": "输入为管道符表格：只翻译单元格中的文字，保持行列数、管道符和对齐行不变。",
+    "html": "输入为HTML表格：只翻译标签之间的文字，保持所有标签与属性不变。",
+    "segments": "输入为逐行编号的表格单元格，每行格式为“<序号> 文本”：逐行翻译文本，保留行首的<序号>，不得合并、拆分或遗漏任何一行。",
+}
+
+LANGUAGE_NAMES = {
+    "en": "英文",
+    "zh-CN": "中文",
+    "ja": "日文",
+    "ko": "韩文",
+    "fr": "法文",
+    "de": "德文",
+    "es": "西班牙文",
+    "ru": "俄文"
+}
+
+# 翻译系统提示词保持为常量：语言、领域、块类型等可变内容放在用户消息中，
+# 使所有文档和块的请求共享同一前缀，命中服务端的上下文缓存
+TRANSLATE_SYSTEM_PROMPT = """## 角色定位
+高度精准的学术文本翻译引擎，专注将学术文献从源语言翻译为目标语言、学术文档格式校对与完整性修复。
+源语言、目标语言、文献领域和输入类型以用户消息中的“翻译要求”为准。
+
+## 翻译规范
+- 保证原文意思没有改变，不要删减原文内容
+- 确保学术用语准确
+- 参考文献部分不翻译
+- 严格按照翻译要求从源语言翻译为目标语言
+
+## 输出规范（特别重要，必须遵守）
+1. 保证输出内容仅有纯净的翻译内容，加括号的解释内容也不行
+1. 禁用任何形式的解释性内容输出
+2. 禁止添加任何注释说明
+3. 屏蔽任何示例展示
+4. 不要输出“翻译要求”及“原文”等标记
+
+## 领域能力
+1. 数学公式结构验证
+2. 表格格式规范化检测
+3. 语义完整性缝合
+
+## 格式处理规则
+### 公式验证标准
+- 确认行内公式特殊符号转译有效性
+
+## 语段整合机制
+- 监测未闭合段落（缺失终止标点）
+- 基于语法树完成段落重组
+- 消除断行字符干扰
+"""
+
+VERIFY_SYSTEM_PROMPT = ("判断译文是否完整无删减地翻译了原文的内容或者是否存在多余内容（不能有多余的注释等），"
+                        "如果翻译完整且无多余内容，输出True，否则False，仅返回JSON：{\"is_valid\": bool}。")
+
+
+def build_translate_message(text: str, context: Optional[str], source_lang_name: str, target_lang_name: str,
+                            block_type: str) -> str:
+    """
+    构造翻译请求的用户消息，按变化频率从低到高排列：语言、领域、块类型、原文。
+
+    :param text: 待翻译的文本
+    :param context: 文献领域
+    :param source_lang_name: 原文语言名称
+    :param target_lang_name: 目标语言名称
+    :param block_type: 块类型
+    :return: 用户消息内容
+    """
+    lines = [
+        "## 翻译要求",
+        f"- 源语言：{source_lang_name}",
+        f"- 目标语言：{target_lang_name}",
+        f"- 文献领域：{context or '通用领域'}",
+    ]
+    hint = BLOCK_TYPE_HINTS.get(block_type)
+    if hint:
+        lines.append(f"- {hint}")
+    return "\n".join(lines) + f"\n\n## 原文\n{text}"
+
+
+def usage_dict(usage) -> Dict:
+    """将响应中的usage字段（OpenAI SDK对象或字典）转换为字典，为空时返回空字典"""
+    if usage is not None and not isinstance(usage, dict):
+        usage = usage.model_dump() if hasattr(usage, "model_dump") else vars(usage)
+    return usage or {}
+
+
+class UsageMeter:
+    """
+    按任务累计API用量，包括DeepSeek上下文缓存命中/未命中的Token数，
+    并分别统计命中缓存与未命中请求的平均延迟。
+    """
+
+    FIELDS = ("prompt_tokens", "completion_tokens", "prompt_cache_hit_tokens", "prompt_cache_miss_tokens")
+
+    def __init__(self):
+        self.totals = dict.fromkeys(self.FIELDS, 0)
+        self.requests = 0
+        self.hit_requests = 0
+        self.hit_latency = 0.0
+        self.miss_latency = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, usage, latency: float) -> None:
+        """
+        记录一次响应的用量。
+
+        :param usage: 响应中的usage字段（OpenAI SDK对象或字典），为空时只计请求数
+        :param latency: 请求耗时（秒）
+        """
+        usage = usage_dict(usage)
+        hit = usage.get("prompt_cache_hit_tokens") or 0
+        with self._lock:
+            self.requests += 1
+            for field in self.FIELDS:
+                self.totals[field] += usage.get(field) or 0
+            if hit:
+                self.hit_requests += 1
+                self.hit_latency += latency
+            else:
+                self.miss_latency += latency
+
+    def summary(self) -> Dict:
+        """用量汇总，可直接序列化为JSON"""
+        with self._lock:
+            miss_requests = self.requests - self.hit_requests
+            cached = self.totals["prompt_cache_hit_tokens"]
+            return {
+                **self.totals,
+                "requests": self.requests,
+                "cache_hit_ratio": round(cached / self.totals["prompt_tokens"], 3) if self.totals["prompt_tokens"] else 0.0,
+                "avg_latency_hit": round(self.hit_latency / self.hit_requests, 3) if self.hit_requests else None,
+                "avg_latency_miss": round(self.miss_latency / miss_requests, 3) if miss_requests else None,
+            }
+
+
+_SEGMENT_LINE = re.compile(r'^\s*<(\d+)>\s?(.*)$')
+
+
+def pack_segments(segments: List[str]) -> str:
+    """
+    将多个短文本（如表格单元格）打包为一次请求的编号文本。
+
+    :param segments: 待翻译的文本片段
+    :return: 每行形如“<序号> 文本”的打包文本
+    """
+    return "\n".join(f"<{idx}> {segment.replace(chr(10), ' ')}" for idx, segment in enumerate(segments, 1))
+
+
+def unpack_segments(text: str, count: int) -> List[Optional[str]]:
+    """
+    解析打包请求的译文。
+
+    :param text: 模型返回的编号文本
+    :param count: 原始片段数量
+    :return: 按顺序排列的译文，缺失的片段为None
+    """
+    results: List[Optional[str]] = [None] * count
+    for line in text.split("\n"):
+        match = _SEGMENT_LINE.match(line)
+        if match and 1 <= int(match.group(1)) <= count:
+            results[int(match.group(1)) - 1] = match.group(2).strip()
+    return results
+
+class HedgePolicy:
+    """
+    对冲请求策略：请求耗时超过近期延迟分位数时再发一份相同请求，取先返回者。
+
+    对冲次数受预算限制，不超过总请求数的 max_ratio。
+    同步请求无法中途取消，落后的请求只能等其结束，因此样本充足时按近期最慢的成功请求收紧单次请求超时，
+    被放弃的请求不会占用线程和连接直到客户端的完整超时。
+    """
+
+    def __init__(self, percentile: float = 0.95, window: int = 200, min_samples: int = 20,
+                 max_ratio: float = 0.1, min_delay: float = 5.0, timeout_factor: float = 3.0,
+                 min_timeout: float = 30.0):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_ratio = max_ratio
+        self.min_delay = min_delay
+        self.timeout_factor = timeout_factor
+        self.min_timeout = min_timeout
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedges = 0
+
+    def record(self, latency: float) -> None:
+        """记录一次成功请求的耗时"""
+        with self._lock:
+            self._latencies.append(latency)
+
+    def threshold(self) -> Optional[float]:
+        """当前对冲触发阈值（秒），样本不足时返回None表示不对冲"""
+        with self._lock:
+            self.calls += 1
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        idx = min(int(len(ordered) * self.percentile), len(ordered) - 1)
+        return max(ordered[idx], self.min_delay)
+
+    def request_timeout(self, default: float) -> float:
+        """单次请求超时（秒）：近期最慢成功请求的 timeout_factor 倍，不低于 min_timeout、不超过 default"""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return default
+            slowest = max(self._latencies)
+        return min(default, max(slowest * self.timeout_factor, self.min_timeout))
+
+    def try_acquire(self) -> bool:
+        """在预算内申请一次对冲"""
+        with self._lock:
+            if self.hedges + 1 > self.calls * self.max_ratio:
+                return False
+            self.hedges += 1
+            return True
+
+
+class ConnectionStats:
+    """
+    端点连接复用统计：请求数与新建TCP连接数之差即为复用次数。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+
+    def on_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def on_new_connection(self) -> None:
+        with self._lock:
+            self.new_connections += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused": max(self.requests - self.new_connections, 0),
+            }
+
+
+class _CountingTransport(httpx.HTTPTransport):
+    """统计请求数与新建连接数的httpx传输层"""
+
+    def __init__(self, stats: ConnectionStats, on_request: Callable[[], None], **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+        self._on_request = on_request
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        outer_trace = request.extensions.get("trace")
+
+        def trace(event_name, info):
+            if event_name == "connection.connect_tcp.complete":
+                self._stats.on_new_connection()
+            if outer_trace is not None:
+                outer_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        self._on_request()
+        return super().handle_request(request)
+
+
+class _Endpoint:
+    """
+    进程内共享的API端点，按 (提供者, API Key, 地址) 区分，持有长连接池、复用统计与对冲策略。
+    """
+
+    def __init__(self, key: Tuple[str, str, str], provider: str, api_key: str, base_url: str, max_connections: int):
+        self.key = key
+        self.provider = provider
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.stats = ConnectionStats()
+        self.hedge_policies: Dict[str, HedgePolicy] = {}
+        self.closed = False
+        self._lock = threading.Lock()
+        self._http_client = None
+        self._openai_client = None
+        self._session = None
+
+    @property
+    def http_client(self) -> httpx.Client:
+        """带连接池的httpx客户端（OpenAI SDK与langchain共用）"""
+        with self._lock:
+            if self._http_client is None:
+                limits = httpx.Limits(max_connections=self.max_connections,
+                                      max_keepalive_connections=self.max_connections)
+                self._http_client = httpx.Client(
+                    transport=_CountingTransport(self.stats, self._on_request, limits=limits),
+                    timeout=DEFAULT_TIMEOUT
+                )
+            return self._http_client
+
+    @property
+    def openai_client(self) -> OpenAI:
+        """共享连接池的OpenAI客户端"""
+        http_client = self.http_client
+        with self._lock:
+            if self._openai_client is None:
+                # 重试由各客户端自己的重试循环和对冲负责，SDK不再重复重试
+                self._openai_client = OpenAI(api_key=self.api_key, base_url=self.base_url, http_client=http_client,
+                                             max_retries=0)
+            return self._openai_client
+
+    @property
+    def session(self):
+        """带连接池的requests会话（SiliconFlow使用）"""
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_connections, pool_block=True)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.hooks["response"].append(lambda response, *args, **kwargs: self._on_request())
+                self._session = session
+            return self._session
+
+    def _on_request(self) -> None:
+        """每次请求都刷新端点的最近使用顺序，正在使用的端点不会被淘汰"""
+        self.stats.on_request()
+        with _endpoints_lock:
+            if _endpoints.get(self.key) is self:
+                _endpoints.move_to_end(self.key)
+
+    def close(self) -> None:
+        """关闭连接池（端点被淘汰时调用），使用该端点的缓存客户端随之失效"""
+        with self._lock:
+            self.closed = True
+            http_client, session = self._http_client, self._session
+        if http_client is not None:
+            http_client.close()
+        if session is not None:
+            session.close()
+
+    def get_hedge_policy(self, config: Dict, call: str = "translate") -> HedgePolicy:
+        """端点共享的对冲策略，延迟分布按端点和调用类型（translate/check）分别学习"""
+        with self._lock:
+            policy = self.hedge_policies.get(call)
+            if policy is None:
+                policy = self.hedge_policies[call] = _hedge_policy_from_config(config)
+            return policy
+
+    def connection_stats(self) -> Dict[str, int]:
+        stats = self.stats.snapshot()
+        if self._session is not None:
+            # urllib3连接池自行记录新建连接数
+            pools = self._session.get_adapter(self.base_url).poolmanager.pools
+            stats["new_connections"] = sum(pools[key].num_connections for key in pools.keys())
+            stats["reused"] = max(stats["requests"] - stats["new_connections"], 0)
+        return stats
+
+
+_endpoints: "OrderedDict[Tuple[str, str, str], _Endpoint]" = OrderedDict()
+_endpoints_lock = threading.Lock()
+
+
+def _key_digest(api_key: str) -> str:
+    """缓存键中使用API Key的摘要，不保留原始密钥"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+def get_endpoint(provider: str, api_key: str, base_url: str,
+                 max_connections: int = DEFAULT_MAX_CONNECTIONS) -> _Endpoint:
+    """
+    获取进程内共享的端点，相同 (提供者, API Key, 地址) 复用同一个连接池。
+
+    端点按最近请求时间做LRU淘汰，最多保留 MAX_CACHED_ENDPOINTS 个，被淘汰的端点关闭连接池。
+    :param provider: API提供者名称
+    :param api_key: API密钥
+    :param base_url: API地址
+    :param max_connections: 连接池最大连接数（仅在首次创建时生效）
+    :return: 共享端点
+    """
+    key = (provider, _key_digest(api_key), base_url)
+    evicted = []
+    with _endpoints_lock:
+        endpoint = _endpoints.get(key)
+        if endpoint is not None:
+            _endpoints.move_to_end(key)
+            return endpoint
+        endpoint = _endpoints[key] = _Endpoint(key, provider, api_key, base_url, max_connections)
+        while len(_endpoints) > MAX_CACHED_ENDPOINTS:
+            evicted.append(_endpoints.popitem(last=False)[1])
+    for old in evicted:
+        logger.info("🔌 关闭长时间未使用的端点连接池: %s ***%s", old.provider, old.api_key[-4:])
+        old.close()
+    return endpoint
+
+
+def shared_http_client(provider: str, api_key: str, base_url: str) -> httpx.Client:
+    """
+    获取端点共享的httpx客户端，供langchain等第三方SDK复用连接池。
+    """
+    return get_endpoint(provider, api_key, base_url).http_client
+
+
+def connection_stats() -> List[Dict]:
+    """
+    各共享端点的连接复用统计（API Key只保留末四位）。
+    """
+    with _endpoints_lock:
+        endpoints = list(_endpoints.values())
+    return [
+        {"provider": e.provider, "base_url": e.base_url, "api_key": f"***{e.api_key[-4:]}", **e.connection_stats()}
+        for e in endpoints
+    ]
+
 
 class APIClient:
     """
     统一接口的翻译客户端基类。
     """
 
-    def translate(self, text: str, context: Optional[str] = None, source_language: str = "en", target_language: str = "zh-CN") -> str:
+    endpoint: Optional[_Endpoint] = None
+    # 启用对冲时为客户端配置，None表示不对冲
+    hedge_config: Optional[Dict] = None
+    # 单次请求超时（秒）
+    timeout: float = DEFAULT_TIMEOUT
+
+    @property
+    def closed(self) -> bool:
+        """使用的端点已被淘汰、连接池已关闭"""
+        return self.endpoint is not None and self.endpoint.closed
+
+    def _hedge_policy(self, call: str) -> Optional[HedgePolicy]:
+        """按调用类型获取端点共享的对冲策略，未启用对冲时返回None"""
+        if self.hedge_config is None or self.endpoint is None:
+            return None
+        return self.endpoint.get_hedge_policy(self.hedge_config, call)
+
+    @staticmethod
+    def _timed(request: Callable, timeout: float, policy: Optional[HedgePolicy],
+               started: Optional[List[float]] = None):
+        """执行请求并记录耗时，供对冲策略学习延迟分布；started 用于取回请求实际开始的时间"""
+        start = time.monotonic()
+        if started is not None:
+            started.append(start)
+        result = request(timeout)
+        if policy is not None:
+            policy.record(time.monotonic() - start)
+        return result
+
+    def _call(self, request: Callable, cancel_token: Optional[CancelToken] = None, call: str = "translate"):
+        """
+        执行一次API请求，启用对冲策略时对慢请求发出重复请求。
+
+        对冲计时从原请求实际开始执行算起，在线程池中排队的时间不计入。
+        同步HTTP请求无法中途取消：落后或被取消的请求结果会被丢弃，其占用时间受单次请求超时限制
+        （见 HedgePolicy.request_timeout）。
+        :param request: 请求函数，参数为本次请求的超时（秒）
+        :param cancel_token: 取消标记，任务取消后立即放弃等待并抛出 TaskCancelled
+        :param call: 调用类型（translate/check），各自学习延迟分布
+        :return: 请求结果
+        """
+        policy = self._hedge_policy(call)
+        threshold = policy.threshold() if policy is not None else None
+        timeout = policy.request_timeout(self.timeout) if policy is not None else self.timeout
+        if threshold is None and cancel_token is None:
+            return self._timed(request, timeout, policy)
+
+        executor = _get_hedge_executor()
+        started = []
+        hedged = threshold is None
+        error = None
+        pending = {executor.submit(self._timed, request, timeout, policy, started)}
+        while pending:
+            check_cancelled(cancel_token)
+            poll = _POLL_INTERVAL
+            if not hedged and started:
+                # 临近对冲时间点时缩短等待，对冲请求按时发出
+                poll = min(poll, max(started[0] + threshold - time.monotonic(), 0.0))
+            done, pending = wait(pending, timeout=poll, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    return future.result()
+                error = future.exception()
+            if pending and not hedged and started and time.monotonic() - started[0] >= threshold:
+                hedged = True
+                if policy.try_acquire():
+                    logger.info("⏱️ 请求超过 %.1fs 未返回，发出对冲请求", threshold)
+                    pending.add(executor.submit(self._timed, request, timeout, policy))
+        raise error
+
+    def detect_domain(self, text: str) -> Optional[str]:
+        """
+        检测文献所属领域，不支持领域检测的客户端返回None。
+        :param text: 文献前几段内容
+        :return: 领域关键词，失败时返回None
+        """
+        return None
+
+    def translate(self, text: str, context: Optional[str] = None, source_language: str = "en", target_language: str = "zh-CN",
+                  block_type: str = "paragraph", cancel_token: Optional[CancelToken] = None,
+                  usage: Optional[UsageMeter] = None) -> str:
         """
         翻译文本。
         :param text: 待翻译的文本
         :param context: 上下文提示
         :param source_language: 原文语言
         :param target_language: 目标语言
+        :param block_type: 块类型（heading/paragraph/table/html）
+        :param cancel_token: 取消标记
+        :param usage: 可选的用量统计器
         :return: 翻译后的文本
         """
         raise NotImplementedError
@@ -28,36 +566,30 @@ class SiliconFlowClient(APIClient):
 
     def __init__(self, config:Dict):
         self.api_key = config['api_key']
-        self.base_url = "https://api.siliconflow.cn/v1/chat/completions"
+        self.base_url = config.get('base_url', SILICONFLOW_BASE_URL)
         self.modelname = config['modelname']
         self.maxtoken=config['maxtoken']
+        self.timeout = config.get('timeout', DEFAULT_TIMEOUT)
+        self.endpoint = get_endpoint("siliconflow", self.api_key, self.base_url,
+                                     config.get('max_connections', DEFAULT_MAX_CONNECTIONS))
+        if config.get('hedge'):
+            self.hedge_config = config
 
 
-    def translate(self, text: str, context: Optional[str] = None, source_language: str = "en", target_language: str = "zh-CN") -> str:
+    def translate(self, text: str, context: Optional[str] = None, source_language: str = "en", target_language: str = "zh-CN",
+                  block_type: str = "paragraph", cancel_token: Optional[CancelToken] = None,
+                  usage: Optional[UsageMeter] = None) -> str:
         """
         使用SiliconFlow API翻译文本 [^1][^2]。
         """
-        import requests
-
-        # 创建语言映射
-        language_names = {
-            "en": "英文",
-            "zh-CN": "中文",
-            "ja": "日文",
-            "ko": "韩文",
-            "fr": "法文",
-            "de": "德文",
-            "es": "西班牙文",
-            "ru": "俄文"
-        }
-
-        source_lang_name = language_names.get(source_language, "英文")
-        target_lang_name = language_names.get(target_language, "中文")
+        source_lang_name = LANGUAGE_NAMES.get(source_language, "英文")
+        target_lang_name = LANGUAGE_NAMES.get(target_language, "中文")
 
         # 添加提示词
         prompt = (
             f"请接收含有复杂数学公式、学术表格的{source_lang_name}markdown论文，检查公式以及表格的格式是否正确，"
             f"并将其翻译为{target_lang_name}，只输出译文，不要有其他说明。"
+            f"{BLOCK_TYPE_HINTS.get(block_type, '')}"
             f"\n\n原文：{text}"
         )
 
@@ -77,27 +609,55 @@ class SiliconFlowClient(APIClient):
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
-        response = requests.post(self.base_url, json=payload, headers=headers)
+        session = self.endpoint.session
+        start = time.monotonic()
+        response = self._call(lambda timeout: session.post(self.base_url, json=payload, headers=headers, timeout=timeout),
+                              cancel_token)
         if response.status_code == 200:
-            return response.json()["choices"][0]["message"]["content"]
+            data = response.json()
+            elapsed = time.monotonic() - start
+            metrics.record_api_call("siliconflow", "translate", elapsed, data.get("usage"))
+            timeline.record_call("translate", elapsed, data.get("usage"))
+            if usage is not None:
+                usage.record(data.get("usage"), elapsed)
+            return data["choices"][0]["message"]["content"]
         else:
+            metrics.record_api_error("siliconflow", "translate", retrying=False)
             raise Exception(f"API请求失败: {response.status_code}")
 
 
-class DeepSeekClient(APIClient):
-    """深度求索(DeepSeek) API客户端实现"""
+class OpenAICompatibleClient(APIClient):
+    """
+    通用OpenAI兼容接口客户端，可对接本地部署的推理服务（vLLM、Ollama等）。
+
+    配置中必须提供base_url；check_model 为领域检测和完整性校验使用的模型，默认与翻译模型相同；
+    verify 为False时跳过完整性校验（部分本地服务不支持JSON输出模式）。
+    """
+
+    provider = "openai_compatible"
+    default_base_url: Optional[str] = None
+    default_check_model: Optional[str] = None
 
     def __init__(self, config: Dict):
-        self.client = OpenAI(
-            api_key=config['api_key'],
-            base_url="https://api.deepseek.com"
-        )
+        base_url = config.get('base_url') or self.default_base_url
+        if not base_url:
+            raise ValueError(f"{self.provider} 需要配置 base_url")
+        # 本地服务通常不校验密钥，但OpenAI SDK要求非空
+        self.endpoint = get_endpoint(self.provider, config.get('api_key') or "EMPTY", base_url,
+                                     config.get('max_connections', DEFAULT_MAX_CONNECTIONS))
+        # with_options 返回的新客户端共享同一个连接池
+        self.timeout = config.get('timeout', DEFAULT_TIMEOUT)
+        self.client = self.endpoint.openai_client.with_options(timeout=self.timeout)
         self.modelname = config['modelname']
+        self.check_model = config.get('check_model') or self.default_check_model or self.modelname
+        self.verify = config.get('verify', True)
         self.maxtoken = config['maxtoken']
-        self.max_retries = config.get('max_retries', 15)  # 默认最大重试次数为3
+        self.max_retries = config.get('max_retries', 15)  # 单独使用时的默认重试次数，路由模式下由配置调小
+        if config.get('hedge'):
+            self.hedge_config = config
 
-    def detect_domain(self, text: str) -> str:
-        """领域检测方法（返回JSON格式的关键词）"""
+    def detect_domain(self, text: str) -> Optional[str]:
+        """领域检测方法（模型返回JSON格式的关键词），失败时返回None"""
         prompt = """请根据以下学术文献的前几段内容判断所属专业领域，返回JSON格式包含单个关键词：
         {
             "domain": "领域关键词"
@@ -110,8 +670,9 @@ class DeepSeekClient(APIClient):
         2. 不要概括性表述
         3. 输出严格为JSON格式"""
         try:
+            start = time.monotonic()
             response = self.client.chat.completions.create(
-                model="deepseek-chat",
+                model=self.check_model,
                 messages=[
                     {"role": "system",
                         "content": f"{prompt}"},
@@ -126,104 +687,81 @@ class DeepSeekClient(APIClient):
                     'type': 'json_object'
                 }
             )
+            metrics.record_api_call(self.provider, "detect_domain", time.monotonic() - start,
+                                    usage_dict(response.usage))
             data = json.loads(response.choices[0].message.content)
-            print(data['domain'])
-            return data['domain']
+            domain = data.get('domain')
+            if not isinstance(domain, str) or not domain.strip():
+                return None
+            logger.info("领域检测结果: %s", domain)
+            return domain.strip()
         except Exception as e:
-                return {"domain": "general"}  # 失败时返回通用领域
+            metrics.record_api_error(self.provider, "detect_domain", retrying=False)
+            logger.warning("⚠️ 领域检测请求失败: %s", truncate(e))
+            return None  # 失败时由调用方使用通用领域
+
+    def translate(self, text: str, context: Optional[str] = None, source_language: str = "en", target_language: str = "zh-CN",
+                  block_type: str = "paragraph", cancel_token: Optional[CancelToken] = None,
+                  usage: Optional[UsageMeter] = None) -> str:
+        """
+        使用OpenAI兼容接口翻译文本（保留原始提示词和参数风格）。
 
-    def translate(self, text: str, context: Optional[str] = None, source_language: str = "en", target_language: str = "zh-CN") -> str:
-        """使用DeepSeek API翻译文本（保留原始提示词和参数风格）"""
+        系统提示词为固定常量，语言、领域和块类型放在用户消息中，使各请求共享最长的前缀，
+        提高服务端上下文缓存（如DeepSeek的prompt_cache_hit_tokens）的命中率。
+        :param usage: 可选的用量统计器，记录每次请求的Token用量和缓存命中情况
+        """
         retry_count_1 = 0
         retry_count_2 = 0
         errors_1 = []
         errors_2 = []
-        
-        # 创建语言映射
-        language_names = {
-            "en": "英文",
-            "zh-CN": "中文",
-            "ja": "日文",
-            "ko": "韩文",
-            "fr": "法文",
-            "de": "德文",
-            "es": "西班牙文",
-            "ru": "俄文"
-        }
 
-        source_lang_name = language_names.get(source_language, "英文")
-        target_lang_name = language_names.get(target_language, "中文")
-        
-        prompt=f"""
-        ## 角色定位
-        高度精准的{source_lang_name}-{target_lang_name}学术文本翻译引擎，专注将{context or "通用领域"}{source_lang_name}文献翻译为{target_lang_name}、学术文档格式校对与完整性修复
-        
-        ## 翻译规范
-        - 保证原文意思没有改变，不要删减原文内容
-        - 确保学术用语准确
-        - 参考文献部分不翻译
-        - 从{source_lang_name}翻译为{target_lang_name}
-        
-        ## 输出规范（特别重要，必须遵守）
-        1. 保证输出内容仅有纯净的翻译内容，加括号的解释内容也不行
-        1. 禁用任何形式的解释性内容输出
-        2. 禁止添加任何注释说明
-        3. 屏蔽任何示例展示
-        
-        ## 领域能力
-        1. 数学公式结构验证
-        2. 表格格式规范化检测
-        3. 语义完整性缝合
-        
-        ## 格式处理规则
-        ### 公式验证标准
-        - 检查所有`$$...$$`区块完整性
-        - 确认公式特殊符号转译有效性
-        
-        ### 表格处理协议
-        1. 强制采用管道符表格格式
-        2. 表尾保留两个连续`\n`换行符
-        3. 验证列宽一致性
-        
-        ## 语段整合机制
-        - 监测未闭合段落（缺失终止标点）
-        - 基于语法树完成段落重组
-        - 消除断行字符干扰
-        """
+        source_lang_name = LANGUAGE_NAMES.get(source_language, "英文")
+        target_lang_name = LANGUAGE_NAMES.get(target_language, "中文")
+        user_message = build_translate_message(text, context, source_lang_name, target_lang_name, block_type)
         for i in range(1):
             while retry_count_1 < self.max_retries:
                 try:
-                    response = self.client.chat.completions.create(
+                    start = time.monotonic()
+                    response = self._call(lambda timeout: self.client.chat.completions.create(
                         model=self.modelname,
                         messages=[
-                            {"role": "system", "content": f"{prompt}"},
-                            {"role": "user", "content": f"{text}"}
+                            {"role": "system", "content": TRANSLATE_SYSTEM_PROMPT},
+                            {"role": "user", "content": user_message}
                         ],
                         max_tokens=self.maxtoken,
                         temperature=0.3,
                         frequency_penalty=0,###就是你！！！！！！！，终于找到问题了！！！！
-                        stream=False
-                    )
+                        stream=False,
+                        timeout=timeout
+                    ), cancel_token)
+                    self._record_call("translate", start, response, usage)
                     break
+                except TaskCancelled:
+                    raise
                 except Exception as e:
                     errors_1.append(str(e))
                     retry_count_1 += 1
-                    print("1_")
-                    print(retry_count_1)
+                    self._record_error("translate", retry_count_1 < self.max_retries)
+                    logger.warning("%s 翻译请求失败（%d/%d）: %s", self.provider, retry_count_1, self.max_retries,
+                                   truncate(e))
                     if retry_count_1 < self.max_retries:
-                        time.sleep(2)  # 重试前等待1秒
+                        task_control.sleep(2, cancel_token)  # 重试前等待1秒
             if retry_count_1==self.max_retries:
-                raise Exception(f"DeepSeek API请求失败，重试 {self.max_retries} 次后仍然失败。错误信息: {', '.join(errors_1)}")
+                raise Exception(f"{self.provider} API请求失败，重试 {self.max_retries} 次后仍然失败。错误信息: {', '.join(errors_1)}")
+            if not self.verify:
+                break
             while retry_count_2 < self.max_retries:
                 try:
                     # 调用R1模型检查翻译是否完整
-                    check = self.client.chat.completions.create(
-                        model="deepseek-chat",
+                    start = time.monotonic()
+                    check = self._call(lambda timeout: self.client.chat.completions.create(
+                        model=self.check_model,
                         messages=[
                             {"role": "system",
-                             "content": f"""判断译文是否完整无删减地翻译了原文的内容或者是否存在多余内容（不能有多余的注释等），如果翻译完整且无多余内容，输出True，否则False，仅返回JSON：{{"is_valid": bool}}。原文是{source_lang_name}，译文应该是{target_lang_name}。"""},
+                             "content": VERIFY_SYSTEM_PROMPT},
                             {"role": "user",
-                             "content": f"原文：\n{text}\n\n译文：\n{response.choices[0].message.content}"}
+                             "content": f"原文是{source_lang_name}，译文应该是{target_lang_name}。\n\n"
+                                        f"原文：\n{text}\n\n译文：\n{response.choices[0].message.content}"}
                         ],
                         max_tokens=self.maxtoken,
                         temperature=0.3,
@@ -231,40 +769,271 @@ class DeepSeekClient(APIClient):
                         stream=False,
                         response_format={
                             'type': 'json_object'
-                        }
-                    )
+                        },
+                        timeout=timeout
+                    ), cancel_token, call="check")
+                    self._record_call("check", start, check, usage)
                     break
+                except TaskCancelled:
+                    raise
                 except Exception as e:
                     errors_2.append(str(e))
                     retry_count_2 += 1
-                    print("2_")
-                    print(retry_count_2)
+                    self._record_error("check", retry_count_2 < self.max_retries)
+                    logger.warning("%s 完整性校验请求失败（%d/%d）: %s", self.provider, retry_count_2,
+                                   self.max_retries, truncate(e))
                     if retry_count_2 < self.max_retries:
-                        time.sleep(2)  # 重试前等待1秒
+                        task_control.sleep(2, cancel_token)  # 重试前等待1秒
             if retry_count_2==self.max_retries:
-                raise Exception(f"DeepSeek API请求失败，重试 {self.max_retries} 次后仍然失败。错误信息: {', '.join(errors_2)}")
+                raise Exception(f"{self.provider} API请求失败，重试 {self.max_retries} 次后仍然失败。错误信息: {', '.join(errors_2)}")
             data = json.loads(check.choices[0].message.content)
-            print(data)
+            logger.debug("完整性校验结果: %s", data, extra={"sample": "verify_result"})
             if data['is_valid'] == True:
                 break
             elif data['is_valid'] == False and i == 4:
-                print("段落翻译不完整")
+                logger.warning("段落翻译不完整")
+            metrics.VERIFY_FAILURES.inc(provider=self.provider)
         return response.choices[0].message.content
-    
+
+    def _record_call(self, call: str, start: float, response, usage: Optional[UsageMeter]) -> None:
+        """记录一次成功请求的耗时与Token用量（进程级指标、任务时间线和任务级用量）"""
+        elapsed = time.monotonic() - start
+        response_usage = usage_dict(response.usage)
+        metrics.record_api_call(self.provider, call, elapsed, response_usage)
+        timeline.record_call(call, elapsed, response_usage)
+        if usage is not None:
+            usage.record(response_usage, elapsed)
+
+    def _record_error(self, call: str, retrying: bool) -> None:
+        """记录一次失败的请求，retrying 表示之后还会重试"""
+        metrics.record_api_error(self.provider, call, retrying)
+        if retrying:
+            timeline.record_call(call)
+
+
+class DeepSeekClient(OpenAICompatibleClient):
+    """深度求索(DeepSeek) API客户端实现"""
+
+    provider = "deepseek"
+    default_base_url = DEEPSEEK_BASE_URL
+    default_check_model = "deepseek-chat"
+
+
+class _BackendHealth:
+    """
+    路由后端的实时健康状态：延迟与错误率的指数滑动平均，以及熔断状态。
+    """
+
+    def __init__(self, name: str, client: APIClient, alpha: float):
+        self.name = name
+        self.client = client
+        self.alpha = alpha
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.in_flight = 0
+
+    def score(self) -> float:
+        """调度得分，越小越优先；无样本的后端得分为0，确保会被尝试"""
+        latency = self.latency if self.latency is not None else 0.0
+        return latency * (1 + self.in_flight) * (1 + 4 * self.error_rate)
+
+    def available(self, now: float) -> bool:
+        return now >= self.open_until
+
+
+class RoutingClient(APIClient):
+    """
+    多提供者路由客户端，按实时延迟和错误率在多个后端间分配请求。
+
+    配置示例::
+
+        {"provider": "router", "backends": [{...deepseek配置...}, {...openai_compatible配置...}],
+         "failure_threshold": 3, "cooldown": 60, "attempts": 3, "retry_delay": 2}
+
+    同一后端连续失败 failure_threshold 次后熔断 cooldown 秒，熔断期间请求转发到其他后端；
+    冷却结束后允许一次试探请求，成功即恢复。重试由路由负责：每轮按排序依次尝试各后端，
+    全部失败后等待 retry_delay 秒重新排序，最多 attempts 轮。后端自身的 max_retries 应设得很小
+    （见 client_config.ROUTER_BACKEND_RETRIES），否则一个慢后端会在切换前耗尽全部重试。
+    """
+
+    def __init__(self, config: Dict):
+        backends = config.get('backends') or []
+        if not backends:
+            raise ValueError("router 至少需要配置一个后端")
+        alpha = config.get('ewma_alpha', 0.3)
+        self.failure_threshold = config.get('failure_threshold', 3)
+        self.cooldown = config.get('cooldown', 60.0)
+        self.attempts = config.get('attempts', 3)
+        self.retry_delay = config.get('retry_delay', 2.0)
+        self.backends = [
+            _BackendHealth(backend.get('name') or f"{backend['provider']}:{backend.get('modelname', '')}",
+                           api_client_factory(backend), alpha)
+            for backend in backends
+        ]
+        self._lock = threading.Lock()
+
+    @property
+    def closed(self) -> bool:
+        return any(backend.client.closed for backend in self.backends)
+
+    def _ranked(self) -> List[_BackendHealth]:
+        """
+        按得分排列可用后端，全部熔断时按最早恢复的顺序返回，保证请求不会无处可发。
+        """
+        now = time.monotonic()
+        with self._lock:
+            available = [backend for backend in self.backends if backend.available(now)]
+            if not available:
+                return sorted(self.backends, key=lambda backend: backend.open_until)
+            return sorted(available, key=lambda backend: backend.score())
+
+    def _acquire(self, backend: _BackendHealth) -> None:
+        with self._lock:
+            backend.in_flight += 1
+
+    def _record(self, backend: _BackendHealth, elapsed: float, ok: bool) -> None:
+        with self._lock:
+            backend.in_flight -= 1
+            backend.error_rate += backend.alpha * ((0.0 if ok else 1.0) - backend.error_rate)
+            if ok:
+                backend.latency = elapsed if backend.latency is None else \
+                    backend.latency + backend.alpha * (elapsed - backend.latency)
+                backend.consecutive_failures = 0
+                backend.open_until = 0.0
+                return
+            backend.consecutive_failures += 1
+            if backend.consecutive_failures >= self.failure_threshold:
+                backend.open_until = time.monotonic() + self.cooldown
+                metrics.ROUTER_TRIPS.inc(backend=backend.name)
+                logger.warning("🚧 后端 %s 连续失败 %d 次，熔断 %.0fs", backend.name, backend.consecutive_failures,
+                               self.cooldown)
+
+    def _route(self, call: Callable[[APIClient], str], cancel_token: Optional[CancelToken] = None) -> str:
+        """依次尝试排序后的后端，直到某个后端成功；一轮全部失败后退避并重新排序，最多 attempts 轮"""
+        errors = []
+        for attempt in range(self.attempts):
+            if attempt:
+                task_control.sleep(self.retry_delay, cancel_token)
+            for backend in self._ranked():
+                check_cancelled(cancel_token)
+                self._acquire(backend)
+                start = time.monotonic()
+                try:
+                    result = call(backend.client)
+                except TaskCancelled:
+                    with self._lock:
+                        backend.in_flight -= 1
+                    raise
+                except Exception as e:
+                    self._record(backend, time.monotonic() - start, False)
+                    errors.append(f"{backend.name}: {e}")
+                    logger.warning("🔀 后端 %s 请求失败，尝试下一个后端: %s", backend.name, truncate(e))
+                    continue
+                self._record(backend, time.monotonic() - start, True)
+                return result
+        raise Exception(f"所有后端均请求失败（{self.attempts} 轮）: {'; '.join(errors)}")
+
+    def detect_domain(self, text: str) -> Optional[str]:
+        """按当前排序依次使用后端检测领域，返回第一个成功的结果"""
+        for backend in self._ranked():
+            domain = backend.client.detect_domain(text)
+            if domain:
+                return domain
+        return None
+
+    def translate(self, text: str, context: Optional[str] = None, source_language: str = "en", target_language: str = "zh-CN",
+                  block_type: str = "paragraph", cancel_token: Optional[CancelToken] = None,
+                  usage: Optional[UsageMeter] = None) -> str:
+        """将翻译请求路由到当前最优的后端，失败时切换到下一个后端"""
+        return self._route(lambda client: client.translate(text, context, source_language, target_language,
+                                                          block_type, cancel_token, usage), cancel_token)
+
+    def backend_stats(self) -> List[Dict]:
+        """各后端的实时状态，用于日志输出"""
+        now = time.monotonic()
+        with self._lock:
+            return [{"name": backend.name,
+                     "latency": backend.latency,
+                     "error_rate": round(backend.error_rate, 3),
+                     "available": backend.available(now)}
+                    for backend in self.backends]
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    """
+    对冲线程池：每个块调度线程最多同时有原请求和对冲请求各一个，另为调度器之外的调用预留少量线程，
+    避免线程池成为全进程API并发的上限。
+    """
+    global _hedge_executor
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            workers = 2 * scheduler.get_block_dispatcher().workers + _HEDGE_EXTRA_WORKERS
+            _hedge_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hedge")
+        return _hedge_executor
+
+
+def _hedge_policy_from_config(config: Dict) -> HedgePolicy:
+    """根据配置创建对冲策略"""
+    return HedgePolicy(
+        percentile=config.get('hedge_percentile', 0.95),
+        max_ratio=config.get('hedge_max_ratio', 0.1),
+        min_delay=config.get('hedge_min_delay', 5.0),
+        timeout_factor=config.get('hedge_timeout_factor', 3.0),
+        min_timeout=config.get('hedge_min_timeout', 30.0)
+    )
+
+
+_clients: "OrderedDict[str, APIClient]" = OrderedDict()
+_clients_lock = threading.Lock()
+
+
+def _client_cache_key(config: Dict) -> str:
+    """客户端缓存键：配置的JSON，其中的API Key（包括路由后端的）替换为摘要"""
+    def scrub(value):
+        if isinstance(value, dict):
+            return {k: _key_digest(v) if k == "api_key" and isinstance(v, str) else scrub(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [scrub(item) for item in value]
+        return value
+    return json.dumps(scrub(config), sort_keys=True, default=str)
+
 
 def api_client_factory(config:Dict) -> APIClient:
     """
-    根据提供者创建翻译客户端 [^1][^2]。
-    :param provider: API提供者名称
-    :param api_key: API密钥
+    根据提供者获取翻译客户端 [^1][^2]。
+
+    相同配置返回同一个客户端实例（LRU缓存，最多 MAX_CACHED_CLIENTS 个），同一端点的客户端共享连接池；
+    端点已被淘汰的客户端重新创建。
+    :param config: 客户端配置，包含provider、api_key、modelname等
     :return: 统一接口的翻译客户端
     """
+    key = _client_cache_key(config)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is not None and not client.closed:
+            _clients.move_to_end(key)
+            return client
+
     if config['provider'] == "siliconflow":
-        return SiliconFlowClient(config)
+        client = SiliconFlowClient(config)
     elif config['provider'] == "deepseek":
-        return DeepSeekClient(config)
+        client = DeepSeekClient(config)
+    elif config['provider'] == "openai_compatible":
+        client = OpenAICompatibleClient(config)
+    elif config['provider'] == "router":
+        client = RoutingClient(config)
     else:
         raise ValueError(f"不支持的提供者: {config['provider']}")
+    with _clients_lock:
+        cached = _clients.get(key)
+        if cached is not None and not cached.closed:
+            return cached
+        _clients[key] = client
+        while len(_clients) > MAX_CACHED_CLIENTS:
+            _clients.popitem(last=False)
+        return client
 
 
 